@@ -0,0 +1,387 @@
+import itertools
+import multiprocessing
+import queue
+import sys
+import threading
+from concurrent.futures import Future
+from multiprocessing import shared_memory
+from typing import Dict, Optional, Tuple
+
+from PIL import Image
+
+from cancellation import CancellationToken, ProcessingCancelled, check_cancelled
+from image_processor import DEFAULT_INFERENCE_SIZE, segment
+from inference_batcher import InferenceBatcher
+from progress import StageReporter
+from session_manager import DEFAULT_MODEL, get_session, session_pool
+
+# Names accepted by create_backend, in the order they are offered to users
+BACKENDS = ('thread', 'process')
+
+
+class ThreadBackend:
+    """
+    Runs inference in the calling thread with a session from the shared pool.
+
+    onnxruntime releases the GIL during inference, but the PIL work around it
+    does not, so this backend is cheapest to start and best for small batches.
+    With batch_size above 1, concurrent calls share ONNX runs through an
+    InferenceBatcher that runs up to workers batches at a time. The batcher
+    holds its session, so it is replaced once the pool has unloaded that
+    session and closed when its last call is done; otherwise it would keep
+    an evicted model loaded outside the pool's memory budget.
+    """
+
+    def __init__(self, workers: int, model_name: str = DEFAULT_MODEL, intra_op_threads: int = 0,
+                 inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE, batch_size: int = 1):
+        self.workers = max(1, workers)
+        self.model_name = model_name
+        self.intra_op_threads = intra_op_threads
+        self.inference_size = inference_size
+        self.batch_size = batch_size
+        self._batcher = None
+        self._users: Dict[InferenceBatcher, int] = {}  # Calls running on each batcher
+        self._lock = threading.Lock()
+
+    def _acquire(self):
+        """The session or batcher for one call, handed back with _release()"""
+        session = get_session(self.model_name, self.intra_op_threads)
+        if self.batch_size <= 1:
+            return session
+        stale = None
+        with self._lock:
+            # Built on first use, so loading the model stays off the caller of start(),
+            # and rebuilt when the pool has replaced the session it runs
+            if self._batcher is None or self._batcher.session is not session:
+                stale = self._detach_batcher()
+                self._batcher = InferenceBatcher(session, self.batch_size, runners=self.workers)
+            batcher = self._batcher
+            self._users[batcher] = self._users.get(batcher, 0) + 1
+        if stale is not None:
+            stale.close()
+        return batcher
+
+    def _release(self, runner):
+        if not isinstance(runner, InferenceBatcher):
+            return
+        with self._lock:
+            self._users[runner] -= 1
+            if self._users[runner]:
+                return
+            del self._users[runner]
+            retired = runner is not self._batcher
+        if retired:
+            runner.close()
+
+    def _detach_batcher(self) -> Optional[InferenceBatcher]:
+        """
+        Stop handing out the current batcher; call with the lock held.
+
+        Returns:
+            The batcher if no call is using it and the caller should close it;
+            otherwise the last call to finish closes it
+        """
+        batcher, self._batcher = self._batcher, None
+        return batcher if batcher is not None and not self._users.get(batcher) else None
+
+    def release_evicted(self):
+        """Close an idle batcher whose session the pool has unloaded, so its model's memory is freed"""
+        with self._lock:
+            if self._batcher is None or session_pool().holds(self._batcher.session):
+                return
+            stale = self._detach_batcher()
+        if stale is not None:
+            stale.close()
+
+    def predict_mask(self, image: Image.Image, stages: Optional[StageReporter] = None,
+                     token: Optional[CancellationToken] = None) -> Image.Image:
+        runner = self._acquire()
+        try:
+            # Callers pass the reduced inference copy; the estimate is theirs to record
+            return segment(image, session=runner, inference_size=self.inference_size, stages=stages,
+                           token=token, record_estimate=False).mask
+        finally:
+            self._release(runner)
+
+    def cancel(self):
+        """Nothing to stop here; calls in flight stop at their token's next check"""
+
+    def close(self):
+        with self._lock:
+            batcher, self._batcher = self._batcher, None
+        if batcher is not None:
+            batcher.close()
+
+
+def _attach_shared_memory(name: str) -> shared_memory.SharedMemory:
+    """Attach to a block owned by another process without taking over its cleanup"""
+    if sys.version_info >= (3, 13):
+        return shared_memory.SharedMemory(name=name, track=False)
+    # Older versions register the block again on attach; spawned workers share
+    # the parent's resource tracker, so that registration is a no-op and the
+    # owner's unlink still clears it
+    return shared_memory.SharedMemory(name=name)
+
+
+def _copy_from_buffer(mode: str, size: Tuple[int, int], buffer) -> Image.Image:
+    """Copy pixels out of a shared buffer so the block can be closed afterwards"""
+    view = Image.frombuffer(mode, size, buffer, 'raw', mode, 0, 1)
+    image = view.copy()
+    # The view keeps the buffer exported; it must go before the block is closed
+    del view
+    return image
+
+
+def _worker_main(tasks, results, model_name: str, intra_op_threads: int, inference_size: Optional[int],
+                 batch_size: int = 1):
+    """
+    Entry point of a backend worker process; holds one warm session for its lifetime.
+
+    With batch_size above 1 the worker serves that many tasks at once on
+    threads, whose inference is batched into shared runs of the session.
+    """
+    session = None
+    lock = threading.Lock()
+
+    def serve():
+        nonlocal session
+        while True:
+            task = tasks.get()
+            if task is None:
+                break
+            with lock:
+                try:
+                    if session is None:
+                        session = get_session(model_name, intra_op_threads)
+                        if batch_size > 1:
+                            session = InferenceBatcher(session, batch_size)
+                    ready = session
+                except Exception as e:
+                    ready = e
+            _run_task(task, ready, inference_size, results)
+
+    if batch_size <= 1:
+        serve()
+        return
+    threads = [threading.Thread(target=serve, name=f"rembg-task-{i}") for i in range(batch_size)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    if isinstance(session, InferenceBatcher):
+        session.close()
+
+
+def _run_task(task, session, inference_size: Optional[int], results):
+    """Segment one image from shared memory; session is the exception if it couldn't be loaded"""
+    task_id, in_name, mode, size, out_name = task
+    try:
+        if isinstance(session, Exception):
+            raise session
+
+        shm_in = _attach_shared_memory(in_name)
+        try:
+            image = _copy_from_buffer(mode, size, shm_in.buf)
+        finally:
+            shm_in.close()
+
+        stages = StageReporter()
+        data = segment(image, session=session, inference_size=inference_size, stages=stages,
+                       record_estimate=False).mask.tobytes()
+        shm_out = _attach_shared_memory(out_name)
+        try:
+            shm_out.buf[:len(data)] = data
+        finally:
+            shm_out.close()
+        results.put((task_id, None, stages.timings))
+    except Exception as e:
+        results.put((task_id, f"{type(e).__name__}: {str(e)}", None))
+
+
+class ProcessBackend:
+    """
+    Runs inference in a pool of worker processes, each holding its own warm session.
+
+    Image pixels travel through shared memory blocks owned by this process;
+    only the block names and image geometry are pickled. Conversion and mask
+    post-processing then run outside this interpreter's GIL, and only the
+    8-bit mask comes back. With batch_size above 1 each worker process
+    batches the inference of up to that many concurrent tasks.
+
+    cancel() recycles the pool: the workers are terminated mid-task and a
+    fresh set is started when the next image is submitted.
+    """
+
+    def __init__(self, workers: int, model_name: str = DEFAULT_MODEL, intra_op_threads: int = 0,
+                 inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE, batch_size: int = 1):
+        # spawn rather than fork: forking a process that runs Tk and other
+        # threads is not safe
+        self._ctx = multiprocessing.get_context('spawn')
+        self._pending: Dict[int, Tuple[Future, shared_memory.SharedMemory, shared_memory.SharedMemory, Tuple[int, int]]] = {}
+        self._lock = threading.Lock()
+        self._ids = itertools.count()
+        self._closed = False
+        self.workers = max(1, workers)
+        self.batch_size = max(1, batch_size)
+        self._worker_args = (model_name, intra_op_threads, inference_size, self.batch_size)
+        self._processes = []
+        self._tasks = None
+        with self._lock:
+            self._start_workers()
+
+    def _start_workers(self):
+        """Start a fresh set of worker processes with their own queues; call with the lock held"""
+        self._tasks = self._ctx.Queue()
+        self._results = self._ctx.Queue()
+        self._processes = [
+            self._ctx.Process(target=_worker_main, name=f"rembg-worker-{i}",
+                              args=(self._tasks, self._results) + self._worker_args,
+                              daemon=True)
+            for i in range(self.workers)
+        ]
+        for process in self._processes:
+            process.start()
+
+        collector = threading.Thread(target=self._collect_results, args=(self._results, self._processes),
+                                     name="rembg-worker-results")
+        collector.daemon = True
+        collector.start()
+
+    def predict_mask(self, image: Image.Image, stages: Optional[StageReporter] = None,
+                     token: Optional[CancellationToken] = None) -> Image.Image:
+        """
+        Compute the mask on a worker process and wait for the result.
+
+        Stage timings measured in the worker are added to stages once the
+        mask is back. A cancelled token only stops the call from starting or
+        drops its result; cancel() stops the work itself.
+        """
+        check_cancelled(token)
+        mask, timings = self.submit(image).result()
+        check_cancelled(token)
+        if stages is not None:
+            for stage, duration in timings.items():
+                stages.add(stage, duration)
+        return mask
+
+    def submit(self, image: Image.Image) -> Future:
+        """Queue an image for a worker process and return a Future for (mask, stage timings)"""
+        if self._closed:
+            raise RuntimeError("Backend is closed")
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+        data = image.tobytes()
+        shm_in = shared_memory.SharedMemory(create=True, size=max(len(data), 1))
+        shm_in.buf[:len(data)] = data
+        shm_out = shared_memory.SharedMemory(create=True, size=max(image.width * image.height, 1))
+
+        future = Future()
+        task_id = next(self._ids)
+        with self._lock:
+            if not self._processes:
+                self._start_workers()  # Recycled by cancel()
+            self._pending[task_id] = (future, shm_in, shm_out, image.size)
+            self._tasks.put((task_id, shm_in.name, image.mode, image.size, shm_out.name))
+        return future
+
+    def _collect_results(self, results, processes):
+        while True:
+            try:
+                message = results.get(timeout=0.5)
+            except queue.Empty:
+                if self._closed or processes is not self._processes:
+                    return  # Closed, or this set of workers was recycled
+                if not all(p.is_alive() for p in processes):
+                    self._fail_pending(RuntimeError("A background removal worker process exited unexpectedly"))
+                    return
+                continue
+            except (EOFError, OSError):
+                return
+
+            task_id, error, timings = message
+            with self._lock:
+                entry = self._pending.pop(task_id, None)
+            if entry is None:
+                continue
+
+            future, shm_in, shm_out, size = entry
+            try:
+                if error:
+                    future.set_exception(RuntimeError(error))
+                else:
+                    future.set_result((_copy_from_buffer('L', size, shm_out.buf), timings))
+            finally:
+                self._release(shm_in, shm_out)
+
+    def _release(self, *blocks):
+        for shm in blocks:
+            shm.close()
+            shm.unlink()
+
+    def _fail_pending(self, error: Exception):
+        with self._lock:
+            pending = list(self._pending.values())
+            self._pending.clear()
+        for future, shm_in, shm_out, _ in pending:
+            if not future.done():
+                future.set_exception(error)
+            self._release(shm_in, shm_out)
+
+    def _stop_workers(self, terminate: bool):
+        """Stop the current workers and retire their queues"""
+        with self._lock:
+            processes, self._processes = self._processes, []
+            tasks = self._tasks
+        if not terminate:
+            # One stop marker per task thread; each thread takes exactly one and exits
+            for _ in range(len(processes) * self.batch_size):
+                tasks.put(None)
+        for process in processes:
+            if terminate:
+                process.terminate()
+            process.join(timeout=5)
+            if process.is_alive():
+                process.terminate()
+        if terminate:
+            # Tasks nobody will read are dropped with the queue; don't let its
+            # feeder thread hold up interpreter exit trying to flush them
+            tasks.cancel_join_thread()
+
+    def cancel(self):
+        """Abandon every queued and running task and recycle the worker processes"""
+        if self._closed:
+            return
+        self._stop_workers(terminate=True)
+        self._fail_pending(ProcessingCancelled())
+
+    def close(self):
+        """Stop the worker processes and free any shared memory still in flight"""
+        if self._closed:
+            return
+        self._closed = True
+        self._stop_workers(terminate=False)
+        self._fail_pending(RuntimeError("Backend was closed"))
+
+
+def create_backend(name: str, workers: int, model_name: str = DEFAULT_MODEL, intra_op_threads: int = 0,
+                   inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE, batch_size: int = 1):
+    """
+    Create an inference backend by name.
+
+    Args:
+        name: One of BACKENDS
+        workers: Number of concurrent inference workers
+        model_name: rembg model to use
+        intra_op_threads: ONNX intra-op thread count per worker
+        inference_size: Long edge images are segmented at; None or 0 uses the full resolution
+        batch_size: Most images a worker runs through the model at once
+
+    Returns:
+        Backend object with predict_mask(), cancel() and close()
+    """
+    if name == 'thread':
+        return ThreadBackend(workers, model_name, intra_op_threads, inference_size, batch_size)
+    if name == 'process':
+        return ProcessBackend(workers, model_name, intra_op_threads, inference_size, batch_size)
+    raise ValueError(f"Unknown backend '{name}', expected one of: {', '.join(BACKENDS)}")
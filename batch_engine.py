@@ -0,0 +1,455 @@
+import hashlib
+import io
+import os
+import queue
+import threading
+from dataclasses import dataclass, field
+from typing import Callable, Dict, Iterable, List, Optional
+
+from PIL import Image
+
+from backends import create_backend
+from cancellation import CancellationToken, ProcessingCancelled
+from image_processor import (DEFAULT_INFERENCE_SIZE, MaskResult, apply_mask, decode_for_inference, load_source,
+                             mask_options, processing_estimate)
+from job_manifest import COMPLETED, FAILED, JobManifest
+from mask_refine import downscale_for_inference, inference_dimensions, upsample_mask
+from progress import EtaEstimator, StageReporter
+from result_cache import ResultCache, cache_key
+from session_manager import DEFAULT_MODEL
+
+# ONNX threads per inference worker; the worker count is derived from this so
+# the workers together roughly fill the physical cores
+DEFAULT_INTRA_OP_THREADS = 2
+
+# Decoded inference copies that may wait for a worker, in bytes
+DEFAULT_PREFETCH_MEMORY = 256 * 1024 * 1024
+
+# EXIF orientations that swap width and height
+_TRANSPOSED_ORIENTATIONS = (5, 6, 7, 8)
+
+_STOP = object()
+
+
+def physical_core_count() -> int:
+    """Return the number of physical CPU cores, falling back to logical cores"""
+    try:
+        import psutil
+        cores = psutil.cpu_count(logical=False)
+        if cores:
+            return cores
+    except ImportError:
+        pass
+    return os.cpu_count() or 1
+
+
+def _oriented_size(img: Image.Image):
+    """Size of an opened image after EXIF orientation, read from its header without decoding"""
+    if img.getexif().get(0x0112) in _TRANSPOSED_ORIENTATIONS:
+        return img.height, img.width
+    return img.size
+
+
+class _MemoryBudget:
+    """
+    Blocks producers while the bytes they hold would exceed a limit.
+
+    An empty budget always admits one reservation, so an image larger than
+    the whole budget is processed on its own instead of blocking forever.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._condition = threading.Condition()
+
+    def acquire(self, size: int):
+        with self._condition:
+            while self.used and self.used + size > self.limit:
+                self._condition.wait()
+            self.used += size
+
+    def release(self, size: int):
+        with self._condition:
+            self.used -= size
+            self._condition.notify_all()
+
+
+def default_worker_count(intra_op_threads: int = DEFAULT_INTRA_OP_THREADS) -> int:
+    """Number of inference workers that fits the machine without oversubscribing it"""
+    return max(1, physical_core_count() // max(1, intra_op_threads))
+
+
+@dataclass
+class BatchEvent:
+    """
+    Progress notification emitted by a BatchEngine.
+
+    kind is one of "started", "completed", "failed" or "finished". image is the
+    copy being segmented when started (the original for cache hits) and the
+    decoded original when completed; with the engine's preview_size set, the
+    originals are replaced by copies of at most that size and preview holds
+    the cut-out at the same size. result is a MaskResult that refers to the
+    source file.
+    timings holds the seconds a completed image spent in each stage; encode
+    includes compositing, which is streamed together with writing. Events are
+    delivered on engine threads, so GUI subscribers must hand them
+    over to the Tk thread themselves.
+    """
+    kind: str
+    index: int = -1
+    path: Optional[str] = None
+    image: Optional[Image.Image] = None
+    result: Optional[MaskResult] = None
+    preview: Optional[Image.Image] = None
+    output_path: Optional[str] = None
+    error: Optional[Exception] = None
+    cached: bool = False
+    timings: Optional[Dict[str, float]] = None
+    completed: int = 0
+    failed: int = 0
+    submitted: int = 0
+    cancelled: bool = False
+
+
+@dataclass
+class _BatchItem:
+    index: int
+    path: str
+    image: Optional[Image.Image] = None
+    inference_image: Optional[Image.Image] = None
+    reserved: int = 0
+    mask: Optional[Image.Image] = None
+    cache_key: Optional[str] = None
+    digest: Optional[str] = None
+    cached: bool = False
+    stages: StageReporter = field(default_factory=StageReporter)
+
+
+class BatchEngine:
+    """
+    Runs background removal over many files with overlapping stages.
+
+    Files are decoded, run through inference by several concurrent workers and
+    handed to an output handler for encoding, each stage on its own threads and
+    connected by bounded queues. The bounded queues keep memory flat however
+    many paths are fed in, and let decoding and encoding of neighbouring images
+    happen while inference is running.
+
+    The decode stage prefetches ahead of the workers: it decodes only the
+    reduced copy that is segmented (JPEGs scaled down while decoding, see
+    image_processor.decode_for_inference), within prefetch_memory bytes. The
+    full-resolution original is decoded by the encode stage, which refines
+    the mask against it and writes the output. With batch_size above 1, each worker
+    stacks up to that many images into one model run, so the engine keeps
+    workers * batch_size images in inference at once.
+    """
+
+    def __init__(
+        self,
+        workers: Optional[int] = None,
+        model_name: str = DEFAULT_MODEL,
+        intra_op_threads: int = DEFAULT_INTRA_OP_THREADS,
+        output_handler: Callable[[str, MaskResult], Optional[str]] = None,
+        backend: str = 'thread',
+        cache: Optional[ResultCache] = None,
+        decode_workers: int = 1,
+        encode_workers: Optional[int] = None,
+        max_pending: Optional[int] = None,
+        inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE,
+        estimator: Optional[EtaEstimator] = None,
+        batch_size: int = 1,
+        prefetch_memory: int = DEFAULT_PREFETCH_MEMORY,
+        manifest: Optional[JobManifest] = None,
+        preview_size: Optional[int] = None
+    ):
+        """
+        Args:
+            workers: Number of concurrent inference workers, defaults to
+                physical cores divided by intra_op_threads
+            model_name: rembg model to use
+            intra_op_threads: ONNX intra-op threads used by each inference call
+            output_handler: Called on an encode thread with the source path and
+                its MaskResult; returns the path it was written to, if any
+            backend: Inference backend name, 'thread' or 'process' (see backends.BACKENDS)
+            cache: Mask cache consulted before inference; None disables caching
+            decode_workers: Number of decoding threads
+            encode_workers: Number of encoding threads, defaults to the number of workers
+            max_pending: Bound on decoded images waiting for a worker
+            inference_size: Long edge images are segmented at; None or 0 uses
+                the full resolution
+            estimator: Receives the stage timings of completed images; pass one
+                in to keep throughput history across engines
+            batch_size: Most images each worker runs through the model at
+                once; worth raising for many small images
+            prefetch_memory: Bytes of decoded images the decode stage may hold
+                ahead of the workers
+            manifest: Job manifest that completed and failed images are
+                recorded in, so an interrupted job can be resumed
+            preview_size: Long edge of the images and cut-out previews put on
+                events, built on the encode threads; None puts the decoded
+                originals on them and builds no preview
+        """
+        if workers is not None and workers < 1:
+            raise ValueError(f"BatchEngine needs at least one worker, not {workers}")
+        self.workers = workers or default_worker_count(intra_op_threads)
+        self.model_name = model_name
+        self.intra_op_threads = intra_op_threads
+        self.output_handler = output_handler
+        self.backend = backend
+        self.cache = cache
+        self._backend = None
+        self.batch_size = max(1, batch_size)
+        # Enough callers to fill every worker's batch
+        self.infer_threads = self.workers * self.batch_size
+        self.decode_workers = max(1, decode_workers)
+        # Encoding includes decoding the original and refining the mask
+        self.encode_workers = encode_workers or self.workers
+        self.max_pending = max_pending or self.workers * max(2, self.batch_size)
+        self.inference_size = inference_size
+        self.estimator = estimator or EtaEstimator()
+        self._prefetch = _MemoryBudget(prefetch_memory)
+        self.manifest = manifest
+        self.preview_size = preview_size
+
+        self._paths = queue.Queue(maxsize=self.max_pending)
+        self._decoded = queue.Queue(maxsize=self.max_pending)
+        self._inferred = queue.Queue(maxsize=self.max_pending)
+        self._subscribers: List[Callable[[BatchEvent], None]] = []
+        self._threads: List[threading.Thread] = []
+        self._lock = threading.Lock()
+        self._token = CancellationToken()
+        self._finished = threading.Event()
+        self._stage_remaining = {}
+        self.submitted = 0
+        self.completed = 0
+        self.failed = 0
+
+    def subscribe(self, callback: Callable[[BatchEvent], None]):
+        """Register a callback that receives every BatchEvent"""
+        self._subscribers.append(callback)
+
+    @property
+    def is_running(self) -> bool:
+        return bool(self._threads) and not self._finished.is_set()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._token.cancelled
+
+    def start(self, paths: Iterable[str]):
+        """
+        Start processing the given paths.
+
+        The iterable is consumed lazily on a feeder thread, so it may be a
+        generator over a huge directory; the engine finishes once it is exhausted.
+        """
+        if self._threads:
+            raise RuntimeError("BatchEngine can only be started once")
+
+        self._backend = create_backend(self.backend, self.workers, self.model_name, self.intra_op_threads,
+                                       self.inference_size, self.batch_size)
+        self._stage_remaining = {
+            'decode': self.decode_workers,
+            'infer': self.infer_threads,
+            'encode': self.encode_workers,
+        }
+        self._spawn(lambda: self._feed(paths), 1, "feeder")
+        self._spawn(self._decode_loop, self.decode_workers, "decode")
+        self._spawn(self._infer_loop, self.infer_threads, "infer")
+        self._spawn(self._encode_loop, self.encode_workers, "encode")
+
+    def cancel(self):
+        """
+        Stop the batch: items still queued are dropped unprocessed, and images
+        being segmented are abandoned at their next stage boundary. The process
+        backend terminates its workers instead of letting them finish.
+        """
+        self._token.cancel()
+        if self._backend is not None:
+            self._backend.cancel()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait for the engine to finish, returns False on timeout"""
+        return self._finished.wait(timeout)
+
+    def _spawn(self, target, count, name):
+        for i in range(count):
+            thread = threading.Thread(target=target, name=f"batch-{name}-{i}")
+            thread.daemon = True
+            self._threads.append(thread)
+            thread.start()
+
+    def _emit(self, event: BatchEvent):
+        for callback in self._subscribers:
+            try:
+                callback(event)
+            except Exception as e:
+                print(f"Batch event handler failed: {str(e)}")
+
+    def _event(self, kind: str, item: Optional[_BatchItem] = None, **kwargs) -> BatchEvent:
+        with self._lock:
+            counters = dict(completed=self.completed, failed=self.failed,
+                            submitted=self.submitted, cancelled=self.cancelled)
+        if item is not None:
+            kwargs.setdefault('index', item.index)
+            kwargs.setdefault('path', item.path)
+        return BatchEvent(kind, **counters, **kwargs)
+
+    def _fail(self, item: _BatchItem, error: Exception):
+        with self._lock:
+            self.failed += 1
+        if self.manifest is not None:
+            self.manifest.record(item.path, FAILED, digest=item.digest, error=str(error))
+        self._emit(self._event('failed', item, error=error))
+
+    def _stage_done(self, stage: str, next_queue: Optional[queue.Queue], next_count: int):
+        """Record that one thread of a stage exited; the last one stops the next stage"""
+        with self._lock:
+            self._stage_remaining[stage] -= 1
+            last = self._stage_remaining[stage] == 0
+        if last:
+            if stage == 'infer':
+                self._backend.close()
+            if next_queue is not None:
+                for _ in range(next_count):
+                    next_queue.put(_STOP)
+            else:
+                self._emit(self._event('finished'))
+                self._finished.set()
+
+    def _feed(self, paths: Iterable[str]):
+        try:
+            for path in paths:
+                if self.cancelled:
+                    break
+                with self._lock:
+                    index = self.submitted
+                    self.submitted += 1
+                self._paths.put(_BatchItem(index, path))
+        finally:
+            for _ in range(self.decode_workers):
+                self._paths.put(_STOP)
+
+    def _decode_loop(self):
+        while True:
+            item = self._paths.get()
+            if item is _STOP:
+                break
+            if self.cancelled:
+                continue
+            try:
+                with item.stages.stage('decode'):
+                    with open(item.path, 'rb') as f:
+                        data = f.read()
+                    if self.manifest is not None:
+                        item.digest = hashlib.sha256(data).hexdigest()
+                    with Image.open(io.BytesIO(data)) as img:
+                        # Masks are computed on the EXIF-oriented image
+                        size = _oriented_size(img)
+                if self.cache is not None:
+                    with item.stages.stage('preprocess'):
+                        item.cache_key = cache_key(data, self.model_name, mask_options(self.inference_size))
+                        mask = self.cache.get(item.cache_key)
+                    if mask is not None and mask.size == size:
+                        item.mask = mask
+                        item.cached = True
+                        # Already processed before, skip the inference workers
+                        self._inferred.put(item)
+                        continue
+                width, height = inference_dimensions(size, self.inference_size)
+                item.reserved = width * height * 3
+                self._prefetch.acquire(item.reserved)
+                try:
+                    with item.stages.stage('decode'):
+                        item.inference_image = decode_for_inference(io.BytesIO(data), self.inference_size)
+                except Exception:
+                    self._release_prefetch(item)
+                    raise
+                del data
+            except Exception as e:
+                self._fail(item, e)
+                continue
+            self._decoded.put(item)
+        self._stage_done('decode', self._decoded, self.infer_threads)
+
+    def _release_prefetch(self, item: _BatchItem):
+        self._prefetch.release(item.reserved)
+        item.reserved = 0
+        item.inference_image = None
+
+    def _infer_loop(self):
+        while True:
+            item = self._decoded.get()
+            if item is _STOP:
+                break
+            try:
+                if self.cancelled:
+                    continue
+                self._emit(self._event('started', item, image=item.inference_image))
+                try:
+                    # The mask comes back at the size of the inference copy
+                    item.mask = self._backend.predict_mask(item.inference_image, item.stages, self._token)
+                except ProcessingCancelled:
+                    continue
+                except Exception as e:
+                    self._fail(item, e)
+                    continue
+            finally:
+                self._release_prefetch(item)
+            self._inferred.put(item)
+        self._stage_done('infer', self._inferred, self.encode_workers)
+
+    def _encode_loop(self):
+        while True:
+            item = self._inferred.get()
+            if item is _STOP:
+                break
+            if self.cancelled:
+                continue
+            try:
+                with item.stages.stage('decode'):
+                    item.image = load_source(item.path)
+                # Subscribers only see this copy, so they don't keep the original alive
+                shown = downscale_for_inference(item.image, self.preview_size) if self.preview_size else item.image
+                if item.cached:
+                    self._emit(self._event('started', item, image=shown, cached=True))
+                else:
+                    with item.stages.stage('postprocess'):
+                        item.mask = upsample_mask(item.mask, item.image)
+                        if item.cache_key:
+                            try:
+                                self.cache.put(item.cache_key, item.mask)
+                            except Exception as e:
+                                print(f"Could not cache mask for {item.path}: {str(e)}")
+                # The result handed on only refers to the file, so holding on to it
+                # costs the mask alone; the handler composites from the decoded image
+                result = MaskResult(item.mask, item.path)
+                output_path = None
+                if self.output_handler:
+                    with item.stages.stage('encode'):
+                        output_path = self.output_handler(item.path, result.with_source(item.image))
+                preview = None
+                if self.preview_size:
+                    preview = apply_mask(shown, item.mask.resize(shown.size, Image.BILINEAR)
+                                         if shown is not item.image else item.mask)
+            except Exception as e:
+                self._fail(item, e)
+                continue
+            megapixels = item.image.width * item.image.height / 1e6
+            item.image = None
+            timings = dict(item.stages.timings)
+            if not item.cached:
+                # Cache hits would make the throughput look better than it will be
+                self.estimator.record(timings)
+                # Per megapixel of the original, as single images are recorded
+                processing_estimate.record(timings.get('inference', 0.0),
+                                           timings.get('preprocess', 0.0) + timings.get('postprocess', 0.0),
+                                           megapixels)
+            with self._lock:
+                self.completed += 1
+            if self.manifest is not None:
+                self.manifest.record(item.path, COMPLETED, digest=item.digest, output=output_path, timings=timings)
+            self._emit(self._event('completed', item, image=shown, result=result, preview=preview,
+                                   output_path=output_path, cached=item.cached, timings=timings))
+        self._stage_done('encode', None, 0)
@@ -0,0 +1 @@
+"""Headless benchmarks for the background removal pipeline; run with python -m benchmarks"""
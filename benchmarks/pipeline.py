@@ -0,0 +1,262 @@
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import sys
+import tempfile
+import time
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+import PIL
+from PIL import Image, ImageDraw, ImageFilter
+
+from batch_engine import BatchEngine
+from benchmarks.stub_model import STUB_MODEL, register_stub_model
+from image_processor import DEFAULT_INFERENCE_SIZE, load_source, segment
+from outputs import measure_profiles, save_result
+from progress import STAGES, StageReporter
+from session_manager import clear_sessions, get_session
+
+# Bumped whenever the JSON layout changes incompatibly
+SCHEMA_VERSION = 1
+
+DEFAULT_SIZES = ((1024, 768), (3000, 2000), (6000, 4000))
+
+
+def parse_size(text: str) -> Tuple[int, int]:
+    width, _, height = text.lower().partition('x')
+    try:
+        return int(width), int(height)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected WIDTHxHEIGHT, got '{text}'")
+
+
+def peak_rss_mb() -> Optional[float]:
+    """Peak resident set size of this process so far, or None where it can't be read"""
+    try:
+        import resource
+    except ImportError:
+        try:
+            import psutil
+            info = psutil.Process().memory_info()
+            return getattr(info, 'peak_wset', info.rss) / (1024 * 1024)
+        except ImportError:
+            return None
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak / (1024 * 1024) if sys.platform == 'darwin' else peak / 1024
+
+
+def synthetic_image(size: Tuple[int, int], seed: int = 0) -> Image.Image:
+    """
+    A photo-like test image: textured background with a soft-edged subject.
+
+    Deterministic for a given size and seed, so runs are comparable.
+    """
+    width, height = size
+    rng = np.random.default_rng(seed)
+    # Low-frequency colour variation plus grain, so JPEG and PNG sizes are realistic
+    base = rng.integers(40, 200, size=(max(2, height // 64), max(2, width // 64), 3), dtype=np.uint8)
+    image = Image.fromarray(base).resize(size, Image.Resampling.BICUBIC)
+    grain = rng.integers(-12, 12, size=(height, width, 1), dtype=np.int16)
+    pixels = np.clip(np.asarray(image, dtype=np.int16) + grain, 0, 255).astype(np.uint8)
+    image = Image.fromarray(pixels)
+
+    subject = Image.new('L', size, 0)
+    ImageDraw.Draw(subject).ellipse((width * 0.25, height * 0.15, width * 0.75, height * 0.9), fill=255)
+    subject = subject.filter(ImageFilter.GaussianBlur(max(1, min(size) // 200)))
+    image.paste((230, 190, 160), mask=subject)
+    return image
+
+
+def _summary(samples: List[float]) -> Dict[str, float]:
+    ordered = sorted(samples)
+    return {
+        'mean': statistics.fmean(ordered),
+        'p50': ordered[len(ordered) // 2],
+        'p95': ordered[min(len(ordered) - 1, int(round(len(ordered) * 0.95)) - 1)],
+        'min': ordered[0],
+        'max': ordered[-1],
+    }
+
+
+def time_image(path: str, output_path: str, model: str, inference_size: Optional[int]) -> Dict[str, float]:
+    """Run one image through every stage and return the seconds spent in each"""
+    stages = StageReporter()
+    with stages.stage('decode'):
+        image = load_source(path)
+    result = segment(image, model, source_path=path, inference_size=inference_size, stages=stages)
+    with stages.stage('composite'):
+        result.with_source(image).to_rgba()
+    # Saving streams compositing and encoding together, as batch runs do
+    with stages.stage('encode'):
+        save_result(result.with_source(image), output_path)
+    return dict(stages.timings)
+
+
+def measure_cold_start(path: str, output_path: str, model: str, inference_size: Optional[int]) -> dict:
+    """Time loading a session and the first image against a second, warm image"""
+    clear_sessions()
+    started = time.perf_counter()
+    get_session(model)
+    session_load = time.perf_counter() - started
+    clear_sessions()
+
+    started = time.perf_counter()
+    time_image(path, output_path, model, inference_size)
+    cold = time.perf_counter() - started
+    started = time.perf_counter()
+    time_image(path, output_path, model, inference_size)
+    warm = time.perf_counter() - started
+    return {'session_load_s': session_load, 'cold_image_s': cold, 'warm_image_s': warm}
+
+
+def measure_size(path: str, output_path: str, size: Tuple[int, int], model: str,
+                 inference_size: Optional[int], repeat: int, warmup: int) -> dict:
+    for _ in range(warmup):
+        time_image(path, output_path, model, inference_size)
+
+    per_stage: Dict[str, List[float]] = {}
+    totals = []
+    for _ in range(repeat):
+        timings = time_image(path, output_path, model, inference_size)
+        for stage, duration in timings.items():
+            per_stage.setdefault(stage, []).append(duration)
+        totals.append(sum(timings.values()))
+
+    total = _summary(totals)
+    return {
+        'size': list(size),
+        'megapixels': size[0] * size[1] / 1e6,
+        'runs': repeat,
+        'stages': {stage: _summary(per_stage[stage]) for stage in STAGES if stage in per_stage},
+        'total': total,
+        'images_per_sec': 1.0 / total['mean'] if total['mean'] > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure_batch(paths: List[str], output_dir: str, model: str, inference_size: Optional[int],
+                  count: int, workers: Optional[int]) -> dict:
+    """Throughput of the staged BatchEngine over count images cycled from paths"""
+    jobs = [paths[i % len(paths)] for i in range(count)]
+
+    def write(original_path, result):
+        return save_result(result, os.path.join(output_dir, 'batch.png'))
+
+    engine = BatchEngine(workers=workers, model_name=model, inference_size=inference_size,
+                         output_handler=write)
+    started = time.perf_counter()
+    engine.start(jobs)
+    engine.join()
+    elapsed = time.perf_counter() - started
+    return {
+        'images': count,
+        'workers': engine.workers,
+        'completed': engine.completed,
+        'failed': engine.failed,
+        'seconds': elapsed,
+        'images_per_sec': engine.completed / elapsed if elapsed > 0 else None,
+        'peak_rss_mb': peak_rss_mb(),
+    }
+
+
+def measure_encoders(path: str, size: Tuple[int, int], model: str, inference_size: Optional[int]) -> dict:
+    """Encode time and output size of one image under every available encoder profile"""
+    image = load_source(path)
+    result = segment(image, model, source_path=path, inference_size=inference_size).with_source(image)
+    return {
+        'size': list(size),
+        'profiles': {
+            measurement.profile: {'seconds': measurement.seconds, 'bytes': measurement.size}
+            for measurement in measure_profiles(result)
+        },
+    }
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(description="Benchmark the background removal pipeline headlessly.")
+    parser.add_argument('--model', default=STUB_MODEL,
+                        help=f"rembg model, or '{STUB_MODEL}' to run offline without weights (default: {STUB_MODEL})")
+    parser.add_argument('--stub-latency', type=float, default=0.0, metavar='MS',
+                        help="milliseconds the stub model sleeps per image to imitate inference")
+    parser.add_argument('--sizes', type=parse_size, nargs='+', default=list(DEFAULT_SIZES), metavar='WxH',
+                        help="image resolutions to benchmark, run smallest first")
+    parser.add_argument('--repeat', type=int, default=5, help="timed runs per resolution (default: 5)")
+    parser.add_argument('--warmup', type=int, default=1, help="untimed runs per resolution (default: 1)")
+    parser.add_argument('--inference-size', type=int, default=DEFAULT_INFERENCE_SIZE,
+                        help=f"long edge images are segmented at, 0 for full size (default: {DEFAULT_INFERENCE_SIZE})")
+    parser.add_argument('--batch-images', type=int, default=12,
+                        help="images pushed through the batch engine for the throughput run, 0 skips it")
+    parser.add_argument('--workers', type=int, default=None, help="batch engine workers (default: automatic)")
+    parser.add_argument('--skip-encoders', action='store_true',
+                        help="don't compare the output encoder profiles on the largest size")
+    parser.add_argument('-o', '--output', help="write the JSON report here instead of stdout")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    if args.model == STUB_MODEL:
+        register_stub_model(args.stub_latency / 1000.0)
+
+    # Peak RSS only grows, so measuring small images first keeps the per-size figures meaningful
+    sizes = sorted(args.sizes, key=lambda size: size[0] * size[1])
+    workdir = tempfile.mkdtemp(prefix='rembg-ui-bench-')
+    try:
+        paths = []
+        for i, size in enumerate(sizes):
+            path = os.path.join(workdir, f"input_{size[0]}x{size[1]}.jpg")
+            synthetic_image(size, seed=i).save(path, 'JPEG', quality=90)
+            paths.append(path)
+        output_path = os.path.join(workdir, 'output.png')
+
+        report = {
+            'schema': SCHEMA_VERSION,
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S%z'),
+            'environment': {
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'pillow': PIL.__version__,
+                'numpy': np.__version__,
+                'cpu_count': os.cpu_count(),
+            },
+            'model': args.model,
+            'inference_size': args.inference_size,
+            'cold_start': measure_cold_start(paths[0], output_path, args.model, args.inference_size),
+            'results': [],
+        }
+        for path, size in zip(paths, sizes):
+            print(f"Benchmarking {size[0]}x{size[1]}...", file=sys.stderr)
+            report['results'].append(measure_size(path, output_path, size, args.model, args.inference_size,
+                                                  args.repeat, args.warmup))
+        if args.batch_images > 0:
+            print(f"Benchmarking batch throughput over {args.batch_images} images...", file=sys.stderr)
+            report['batch'] = measure_batch(paths, workdir, args.model, args.inference_size,
+                                            args.batch_images, args.workers)
+        if not args.skip_encoders:
+            print("Benchmarking encoder profiles...", file=sys.stderr)
+            report['encoders'] = measure_encoders(paths[-1], sizes[-1], args.model, args.inference_size)
+    finally:
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, 'w', encoding='utf-8') as f:
+            f.write(text + '\n')
+    else:
+        print(text)
+
+    for result in report['results']:
+        width, height = result['size']
+        print(f"{width}x{height}: {result['total']['mean'] * 1000:.0f}ms/image, "
+              f"{result['images_per_sec']:.2f} images/s", file=sys.stderr)
+    for name, encoder in report.get('encoders', {}).get('profiles', {}).items():
+        print(f"{name}: {encoder['seconds'] * 1000:.0f}ms, {encoder['bytes'] / 1024:.0f}KB", file=sys.stderr)
+    return 0
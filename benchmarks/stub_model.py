@@ -0,0 +1,46 @@
+import time
+
+import numpy as np
+from PIL import Image
+
+from session_manager import register_session_factory
+
+STUB_MODEL = "stub"
+
+# Input resolution of the real u2net family, which the stub imitates
+STUB_INPUT_SIZE = 320
+
+
+class StubSession:
+    """
+    Stand-in for a rembg session that needs no model weights.
+
+    It does the same shape of work as a real session: normalise a fixed-size
+    model input, "infer" by thresholding luminance (optionally sleeping to
+    imitate model latency), and resize the mask back with LANCZOS. Pipeline
+    overhead around the model is therefore measured realistically offline.
+    """
+
+    model_name = STUB_MODEL
+
+    def __init__(self, latency: float = 0.0):
+        """
+        Args:
+            latency: Seconds each predict() sleeps to stand in for model inference
+        """
+        self.latency = latency
+
+    def predict(self, img: Image.Image, *args, **kwargs):
+        small = img.convert('RGB').resize((STUB_INPUT_SIZE, STUB_INPUT_SIZE), Image.Resampling.LANCZOS)
+        data = np.asarray(small, dtype=np.float32) / 255.0
+        data = (data - (0.485, 0.456, 0.406)) / (0.229, 0.224, 0.225)
+        if self.latency:
+            time.sleep(self.latency)
+        luminance = data.mean(axis=2)
+        mask = (luminance > luminance.mean()).astype(np.uint8) * 255
+        return [Image.fromarray(mask).resize(img.size, Image.Resampling.LANCZOS)]
+
+
+def register_stub_model(latency: float = 0.0):
+    """Make STUB_MODEL available through session_manager.get_session()"""
+    register_session_factory(STUB_MODEL, lambda intra_op_threads: StubSession(latency))
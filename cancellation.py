@@ -0,0 +1,58 @@
+import threading
+from typing import Callable, List, Optional
+
+
+class ProcessingCancelled(Exception):
+    """Raised by work that stopped because its CancellationToken was cancelled"""
+
+
+class CancellationToken:
+    """
+    Tells running work that it should stop.
+
+    Work checks the token at its stage boundaries and raises
+    ProcessingCancelled there; a stage already running (such as an ONNX run)
+    is finished but its result is dropped. Callbacks registered with
+    on_cancel() let owners of uninterruptible work, such as worker
+    processes, stop it in their own way.
+    """
+
+    def __init__(self):
+        self._event = threading.Event()
+        self._callbacks: List[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    @property
+    def cancelled(self) -> bool:
+        return self._event.is_set()
+
+    def cancel(self):
+        """Cancel the work; safe to call from any thread and more than once"""
+        with self._lock:
+            if self._event.is_set():
+                return
+            self._event.set()
+            callbacks, self._callbacks = self._callbacks, []
+        for callback in callbacks:
+            try:
+                callback()
+            except Exception as e:
+                print(f"Cancellation callback failed: {str(e)}")
+
+    def on_cancel(self, callback: Callable[[], None]):
+        """Call callback once the token is cancelled, right away if it already is"""
+        with self._lock:
+            if not self._event.is_set():
+                self._callbacks.append(callback)
+                return
+        callback()
+
+    def raise_if_cancelled(self):
+        if self._event.is_set():
+            raise ProcessingCancelled()
+
+
+def check_cancelled(token: Optional[CancellationToken]):
+    """Raise ProcessingCancelled if token is given and cancelled"""
+    if token is not None:
+        token.raise_if_cancelled()
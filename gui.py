@@ -1,24 +1,78 @@
 import tkinter as tk
-from tkinter import ttk, filedialog, messagebox
+from tkinter import ttk, filedialog, messagebox, colorchooser
 from tkinterdnd2 import DND_FILES, TkinterDnD
 from PIL import Image, ImageTk
 import os
-from image_processor import remove_background, process_image_async
+from image_processor import (remove_background, process_image_async, process_preview_async,
+                             processing_estimate, upscale_preview, DEFAULT_INFERENCE_SIZE, PREVIEW_MODEL)
+from mask_refine import inference_dimensions
+from input_policy import InputPolicy
+from job_manifest import JobManifest, job_settings
+from ui_bus import UIBus
+from cancellation import CancellationToken
+from progress import EtaEstimator, StageReporter, STAGE_LABELS, format_duration
+import threading
+import time
+from batch_engine import BatchEngine, default_worker_count
+from backends import BACKENDS
+from outputs import (DEFAULT_PROFILE, ENCODER_PROFILES, OutputWriter, auto_save_image, available_profiles,
+                     get_profile, measure_profiles, profile_for_path, save_result)
+from result_cache import get_default_cache
+from result_store import ResultStore
+from models import MODELS
+from session_manager import DEFAULT_MODEL
 from utils import create_scroll_image_view
+from watch_folder import FolderWatcher, ThroughputMeter
+
+# Seconds between chunks of checked files posted to the queue list
+ADMISSION_POST_INTERVAL = 0.1
+# Files named individually in the large-image and rejected-file summaries
+ADMISSION_SUMMARY_LINES = 10
+# Long edge of the batch previews, which the engine composites off the Tk thread
+BATCH_PREVIEW_SIZE = 1024
 
 class BackgroundRemoverApp(ttk.Frame):
-    def __init__(self, master):
+    def __init__(self, master, input_policy=None, model_name=DEFAULT_MODEL):
         super().__init__(master)
         self.master = master
+        self.input_policy = input_policy or InputPolicy()
+        # Sessions load on first use and are unloaded by the session pool's memory budget
+        self.model_var = tk.StringVar(value=model_name)
+        # Show a quick result from a small model while the full pass runs
+        self.two_pass_var = tk.BooleanVar(value=True)
+        self.preview_result = None  # MaskResult of the quick pass, at preview resolution
+        self.refining = False  # Preview shown, full-quality pass still running
+        self._single_run = None
+        self._admission = None  # CancellationToken of files still being checked for the queue
         self.master.drop_target_register(DND_FILES)
         self.master.dnd_bind('<<Drop>>', self.handle_drop)
         self.master = master
         self.input_image = None
         self.output_image = None
+        self.output_result = None  # MaskResult behind output_image
         self.processing_queue = []
-        self.processed_images = []  # Store processed images for batch saving
+        self.processed_images = ResultStore()  # Batch results, spilled to disk past its memory budget
+        self.output_writer = OutputWriter()  # Encodes and writes saved images off the Tk thread
+        self.profile_var = tk.StringVar(value=DEFAULT_PROFILE)  # Encoder profile outputs are saved with
+        self.batch_profile = DEFAULT_PROFILE  # profile_var as of the batch run's start, read by encode threads
+        self.job_manifest = None  # Records batch progress in the output directory so it can be resumed
+        # Watch-folder mode: new images in the watched folder are queued and processed as they arrive
+        self.watch_var = tk.BooleanVar(value=False)
+        self.folder_watcher = None
+        self.watch_throughput = None
+        self.watch_done = 0
+        self.watch_failed = 0
+        self._watch_in_flight = set()
+        self._watch_job = None
         self.current_thread = None
+        self.batch_engine = None
         self.cancelled = False
+        # Worker threads report through this instead of touching Tk
+        self.ui_bus = UIBus(self.master)
+        self.ui_bus.start()
+        # Observed stage timings and throughput, shared by single and batch runs
+        self.eta = EtaEstimator()
+        self._progress_job = None
         self.setup_ui()
         self.setup_bindings()
 
@@ -263,6 +317,7 @@ class BackgroundRemoverApp(ttk.Frame):
         # Header with success message
         header_frame = ttk.Frame(self.main_container)
         header_frame.pack(fill=tk.X, pady=(0, 25))
+        self.result_header = header_frame
 
         # Success icon and text
         success_container = ttk.Frame(header_frame)
@@ -378,6 +433,39 @@ class BackgroundRemoverApp(ttk.Frame):
                                    state='disabled')
         self.cancel_btn.pack(side=tk.RIGHT)
 
+        # Parallelism settings
+        settings_frame = ttk.Frame(controls_frame)
+        settings_frame.pack(fill=tk.X, padx=20, pady=(0, 15))
+
+        ttk.Label(settings_frame, text="Workers:",
+                 font=('Segoe UI', 10, 'bold'),
+                 foreground='#2c3e50').pack(side=tk.LEFT)
+
+        if not hasattr(self, 'workers_var'):
+            self.workers_var = tk.IntVar(value=default_worker_count())
+        ttk.Spinbox(settings_frame, from_=1, to=max(os.cpu_count() or 1, 1), width=5,
+                    textvariable=self.workers_var).pack(side=tk.LEFT, padx=(8, 0))
+
+        ttk.Label(settings_frame, text="Backend:",
+                 font=('Segoe UI', 10, 'bold'),
+                 foreground='#2c3e50').pack(side=tk.LEFT, padx=(20, 0))
+
+        # Threads start instantly; processes avoid GIL contention on big batches
+        if not hasattr(self, 'backend_var'):
+            self.backend_var = tk.StringVar(value=BACKENDS[0])
+        ttk.Combobox(settings_frame, textvariable=self.backend_var, values=BACKENDS,
+                     state='readonly', width=10).pack(side=tk.LEFT, padx=(8, 0))
+
+        ttk.Label(settings_frame, text="Batch:",
+                 font=('Segoe UI', 10, 'bold'),
+                 foreground='#2c3e50').pack(side=tk.LEFT, padx=(20, 0))
+
+        # Images per model run; larger batches suit queues of small images
+        if not hasattr(self, 'batch_size_var'):
+            self.batch_size_var = tk.IntVar(value=1)
+        ttk.Spinbox(settings_frame, from_=1, to=16, width=5,
+                    textvariable=self.batch_size_var).pack(side=tk.LEFT, padx=(8, 0))
+
         # Progress section with improved styling
         progress_frame = ttk.Frame(controls_frame)
         progress_frame.pack(fill=tk.X, padx=20, pady=(0, 20))
@@ -511,8 +599,18 @@ class BackgroundRemoverApp(ttk.Frame):
         menubar.add_cascade(label="File", menu=file_menu, underline=0)
         file_menu.add_command(label="Open Image...", command=self.open_single_file, accelerator="Ctrl+O", underline=0)
         file_menu.add_command(label="Add Images to Queue...", command=self.open_file, accelerator="Ctrl+Shift+O", underline=0)
+        file_menu.add_command(label="Resume Batch Job...", command=self.resume_job, underline=0)
+        file_menu.add_checkbutton(label="Watch Folder...", variable=self.watch_var,
+                                  command=self.toggle_watch_folder, underline=0)
         file_menu.add_separator()
         file_menu.add_command(label="Save Image", command=self.save_image, accelerator="Ctrl+S", underline=0)
+        format_menu = tk.Menu(file_menu, tearoff=0)
+        file_menu.add_cascade(label="Output Format", menu=format_menu, underline=7)
+        for name in available_profiles():
+            profile = ENCODER_PROFILES[name]
+            format_menu.add_radiobutton(label=f"{profile.label} - {profile.description}", value=name,
+                                        variable=self.profile_var)
+        file_menu.add_command(label="Compare Output Formats...", command=self.show_format_comparison, underline=0)
         file_menu.add_separator()
         file_menu.add_command(label="New Session", command=self.reset_to_simple, accelerator="Ctrl+N", underline=0)
         file_menu.add_separator()
@@ -528,6 +626,15 @@ class BackgroundRemoverApp(ttk.Frame):
         menubar.add_cascade(label="Process", menu=process_menu, underline=0)
         process_menu.add_command(label="Start Processing", command=self.process_image, accelerator="F5", underline=0)
         process_menu.add_command(label="Cancel Processing", command=self.cancel_processing, accelerator="Esc", underline=0)
+        process_menu.add_separator()
+        process_menu.add_checkbutton(label="Quick Preview First", variable=self.two_pass_var, underline=0)
+
+        # Model menu
+        model_menu = tk.Menu(menubar, tearoff=0)
+        menubar.add_cascade(label="Model", menu=model_menu, underline=0)
+        for model in MODELS.values():
+            model_menu.add_radiobutton(label=f"{model.label} - {model.description}", value=model.name,
+                                       variable=self.model_var, command=self._on_model_changed)
 
         # Help menu
         help_menu = tk.Menu(menubar, tearoff=0)
@@ -622,6 +729,12 @@ class BackgroundRemoverApp(ttk.Frame):
         self.batch_mode = False
         self.input_image = None
         self.output_image = None
+        self.output_result = None
+        self.preview_result = None
+        self.refining = False
+        self._cancel_single_run()  # Work still running stops, late results are ignored
+        self._cancel_admission()
+        self.stop_watch_folder()
         self.processing_queue.clear()
         self.processed_images.clear()
         self.create_simple_interface()
@@ -646,26 +759,22 @@ class BackgroundRemoverApp(ttk.Frame):
                 return
 
             # Check file size
-            file_size = os.path.getsize(path)
-            if file_size > 50 * 1024 * 1024:  # 50MB
+            size_error = self.input_policy.file_size_error(path)
+            if size_error:
                 messagebox.showerror("File Too Large",
-                                   f"The file is too large to process.\n"
-                                   f"Maximum file size is 50MB.\n"
-                                   f"Current file size: {file_size / (1024*1024):.1f}MB")
+                                   f"The file is too large to process.\n{size_error}")
                 return
 
             # Load and validate image
             with Image.open(path) as img:
                 # Check image dimensions
-                if img.width > 8000 or img.height > 8000:
-                    result = messagebox.askyesno("Large Image",
-                                               f"This image is very large ({img.width}x{img.height} pixels).\n"
-                                               f"Processing may take a long time. Continue?")
-                    if not result:
+                if self.input_policy.is_large(img.size):
+                    if not self._confirm_large_image("This image is very large", img.size):
                         return
 
                 # Load the image
                 self.input_image = img.copy()
+                self.input_path = path
 
             self.status_var.set(f"Loaded: {os.path.basename(path)} ({self.input_image.width}x{self.input_image.height})")
 
@@ -681,65 +790,277 @@ class BackgroundRemoverApp(ttk.Frame):
                                f"Could not load '{os.path.basename(path)}':\n{error_msg}")
             # Stay on the simple interface if loading fails
     
+    def _confirm_large_image(self, message, size):
+        """Ask before processing a very large image, with an estimate of how long it takes"""
+        width, height = size
+        inference_width, inference_height = inference_dimensions(size, DEFAULT_INFERENCE_SIZE)
+        seconds = processing_estimate.estimate(size)
+        return messagebox.askyesno("Large Image",
+                                   f"{message} ({width}x{height} pixels).\n"
+                                   f"It will be analysed at {inference_width}x{inference_height} and the "
+                                   f"mask refined to full size.\n"
+                                   f"Estimated processing time: about {max(1, round(seconds))} seconds. "
+                                   f"Continue?")
+
     def process_single_image(self):
-        """Process a single image"""
+        """Process a single image, showing a quick preview first when two-pass mode is on"""
         if not self.input_image:
             return
         
         self.cancelled = False
+        # Cancels the work of this run; late results of earlier runs are told apart by it
+        self._cancel_single_run()
+        run = self._single_run = CancellationToken()
+        self.preview_result = None
+        self.refining = False
+        if self.two_pass_var.get() and self.model_var.get() != PREVIEW_MODEL:
+            self._process_preview(run)
+        else:
+            self._process_full(run, refining=False)
+
+    def _process_preview(self, run):
+        """Show a fast low-resolution result first, then refine it at full quality"""
+        def show_preview(result, output_image):
+            if run is not self._single_run:
+                return
+            self.preview_result = result
+            self.output_result = None  # Saving waits for the full-quality pass
+            self.output_image = output_image
+            self.create_result_interface()
+            if hasattr(self, 'input_preview'):
+                self.input_preview.set_image(self.input_image)
+            if hasattr(self, 'output_preview'):
+                self.output_preview.set_image(output_image)
+            self._show_refine_bar()
+            self.refining = True
+            self._process_full(run, refining=True)
         
-        def on_progress(value):
-            if not self.cancelled:
-                self.progress['value'] = value
-                # Update processing status with more detailed feedback
-                if hasattr(self, 'processing_status'):
-                    if value < 30:
-                        self.processing_status.set("Analyzing image...")
-                    elif value < 60:
-                        self.processing_status.set("Detecting objects...")
-                    elif value < 90:
-                        self.processing_status.set("Removing background...")
-                    else:
-                        self.processing_status.set("Finalizing...")
-                self.update_idletasks()
+        def show_failure(error):
+            # The preview is only a head start, carry on with the full pass
+            print(f"Preview failed: {str(error)}")
+            if run is self._single_run:
+                self._process_full(run, refining=False)
         
+        # on_* run on the worker thread and must not touch Tk
         def on_complete(result):
-            if not self.cancelled:
-                self.output_image = result
-                self.create_result_interface()
-                
-                # Set the images in the preview
-                if hasattr(self, 'input_preview'):
-                    self.input_preview.set_image(self.input_image)
+            self.ui_bus.post(show_preview, result, result.to_rgba())
+        
+        def on_error(error):
+            self.ui_bus.post(show_failure, error)
+        
+        if hasattr(self, 'processing_status'):
+            self.processing_status.set("Preparing preview...")
+        process_preview_async(self.input_image, on_complete, on_error)
+
+    def _process_full(self, run, refining):
+        """
+        Run the full-quality pass.
+
+        When refining, a preview is already on the result screen; the result
+        replaces it there instead of building the result screen.
+        """
+        started = time.monotonic()
+        # Latest stage state as seen on the Tk thread: (stage, stage start, finished timings)
+        state = {'stage': None, 'since': started, 'timings': {}}
+        expected = self.eta.image_duration() or processing_estimate.estimate(self.input_image.size)
+        
+        # show_* run on the Tk thread, posted through the UI bus
+        def show_stage(update, timings):
+            state['timings'] = timings
+            if update.state == 'started':
+                state['stage'], state['since'] = update.stage, update.timestamp
+            elif update.stage == state['stage']:
+                state['stage'] = None
+        
+        def tick():
+            # Progress from the stages actually reached, timed against earlier images
+            if run is not self._single_run:
+                self._progress_job = None
+                return
+            now = time.monotonic()
+            fraction = self.eta.image_progress(state['timings'], state['stage'], now - state['since'])
+            if fraction is None:
+                fraction = min((now - started) / expected, 0.95) if expected else 0.0
+            self.progress['value'] = fraction * 100
+            if hasattr(self, 'processing_status') and state['stage']:
+                duration = self.eta.image_duration() or expected
+                remaining = max(duration - (now - started), 0)
+                self.processing_status.set(f"{STAGE_LABELS[state['stage']]}... "
+                                           f"about {format_duration(remaining)} left")
+            self._progress_job = self.after(200, tick)
+        
+        def show_progress(value):
+            if run is self._single_run:
+                self.progress['value'] = value
+        
+        def show_result(result, output_image):
+            if run is not self._single_run:
+                return
+            self._stop_progress_ticker()
+            if 'inference' in reporter.timings:  # Cache hits say nothing about speed
+                self.eta.record(reporter.timings)
+            self.output_result = result
+            self.output_image = output_image
+            if refining:
+                # Swap the full-quality result in for the preview
+                self.refining = False
+                self._hide_refine_bar()
+                self.save_btn.config(state='normal')
                 if hasattr(self, 'output_preview'):
                     self.output_preview.set_image(self.output_image)
-                
-                self.status_var.set("Background removed successfully!")
+                self.status_var.set("Full-quality result ready")
+                return
+            self.create_result_interface()
+            
+            # Set the images in the preview
+            if hasattr(self, 'input_preview'):
+                self.input_preview.set_image(self.input_image)
+            if hasattr(self, 'output_preview'):
+                self.output_preview.set_image(self.output_image)
+            
+            self.status_var.set("Background removed successfully!")
         
-        def on_error(error):
+        def show_error(error):
+            if run is not self._single_run:
+                return
+            self._stop_progress_ticker()
             error_msg = self._get_user_friendly_error_message(str(error))
+            if refining:
+                self._keep_preview(run, f"Full-quality pass failed ({error_msg}) - keeping the preview")
+                return
             messagebox.showerror("Processing Failed",
                                f"Failed to process the image:\n{error_msg}\n\n"
                                f"Please try again with a different image or check that the image is valid.")
             self.status_var.set("Processing failed - please try again")
             self.reset_to_simple()
         
-        self.status_var.set("Processing image...")
+        # on_* run on the worker thread and must not touch Tk
+        def on_stage(update):
+            self.ui_bus.post_latest('single-stage', show_stage, update, dict(reporter.timings))
+        
+        def on_progress(value):
+            self.ui_bus.post_latest('single-progress', show_progress, value)
+        
+        def on_complete(result):
+            # Composite the preview here rather than on the Tk thread
+            with reporter.stage('composite'):
+                output_image = result.to_rgba()
+            self.ui_bus.post(show_result, result, output_image)
+        
+        def on_error(error):
+            self.ui_bus.post(show_error, error)
+        
+        reporter = StageReporter(on_stage)
+        self.status_var.set("Refining at full quality..." if refining else "Processing image...")
+        self._stop_progress_ticker()
+        self._progress_job = self.after(200, tick)
         self.current_thread = process_image_async(
             self.input_image,
             on_complete,
             on_error,
-            on_progress
+            on_progress,
+            model_name=self.model_var.get(),
+            source_path=getattr(self, 'input_path', None),
+            stages=reporter,
+            token=run
         )
 
+    def _cancel_single_run(self):
+        if self._single_run is not None:
+            self._single_run.cancel()
+            self._single_run = None
+
+    def _is_refining(self):
+        return self.refining
+
+    def _show_refine_bar(self):
+        """Progress of the full-quality pass, shown on the result screen above the preview"""
+        self.save_btn.config(state='disabled')
+        self.refine_frame = ttk.Frame(self.main_container)
+        self.refine_frame.pack(fill=tk.X, pady=(0, 15), after=self.result_header)
+
+        ttk.Label(self.refine_frame, text="Preview - refining at full quality",
+                 font=('Segoe UI', 10, 'bold'),
+                 foreground='#2c3e50').pack(side=tk.LEFT)
+
+        # The ticker of the full pass drives these like the processing screen's
+        self.processing_status = tk.StringVar(value="Starting...")
+        ttk.Label(self.refine_frame, textvariable=self.processing_status,
+                 font=('Segoe UI', 9),
+                 foreground='#7f8c8d').pack(side=tk.LEFT, padx=(12, 0))
+
+        tk.Button(self.refine_frame, text="✕ Keep Preview",
+                  command=self._cancel_refine,
+                  font=('Segoe UI', 9),
+                  bg='#e74c3c', fg='white',
+                  relief='raised', bd=1,
+                  padx=10, pady=4,
+                  cursor='hand2').pack(side=tk.RIGHT)
+
+        self.progress = ttk.Progressbar(self.refine_frame, mode='determinate',
+                                       style="Custom.Horizontal.TProgressbar", length=200)
+        self.progress.pack(side=tk.RIGHT, padx=(0, 12))
+
+    def _hide_refine_bar(self):
+        if getattr(self, 'refine_frame', None) is not None:
+            self.refine_frame.destroy()
+            self.refine_frame = None
+
+    def _cancel_refine(self):
+        """Stop waiting for the full-quality pass and keep the preview as the result"""
+        if not self._is_refining():
+            return
+        # The pass stops at its next stage boundary; keeping the preview is a new run
+        self._cancel_single_run()
+        run = self._single_run = CancellationToken()
+        self._stop_progress_ticker()
+        self._keep_preview(run, "Refinement cancelled - keeping the preview")
+
+    def _keep_preview(self, run, message):
+        """Make the preview the result, scaled to full size on a worker thread so it can be saved"""
+        self.refining = False
+        self._hide_refine_bar()
+        self.status_var.set("Scaling the preview to full size...")
+        preview, image = self.preview_result, self.input_image
+        
+        def show(result):
+            if run is self._single_run:
+                self.output_result = result
+                self.save_btn.config(state='normal')
+                self.status_var.set(message)
+        
+        def upscale():
+            try:
+                result = upscale_preview(preview, image)
+            except Exception as e:
+                print(f"Could not scale the preview: {str(e)}")
+                self.ui_bus.post(self.status_var.set, "Could not keep the preview - please process the image again")
+                return
+            self.ui_bus.post(show, result)
+        
+        thread = threading.Thread(target=upscale)
+        thread.daemon = True
+        thread.start()
+
+    def _on_model_changed(self):
+        model = MODELS.get(self.model_var.get())
+        # Timings of one model say little about another
+        self.eta = EtaEstimator()
+        label = model.label if model else self.model_var.get()
+        self.status_var.set(f"Using {label}; it is loaded when processing starts")
+
+    def _stop_progress_ticker(self):
+        if self._progress_job is not None:
+            self.after_cancel(self._progress_job)
+            self._progress_job = None
+
     def open_file(self):
         filetypes = (
             ('Image files', '*.png *.jpg *.jpeg *.bmp *.gif'),
             ('All files', '*.*')
         )
         filenames = filedialog.askopenfilenames(filetypes=filetypes)
-        for filename in filenames:
-            self.add_to_queue(filename)
+        self.add_files_to_queue(filenames)
 
     def load_image(self, path):
         """Legacy method for batch mode compatibility"""
@@ -769,15 +1090,13 @@ class BackgroundRemoverApp(ttk.Frame):
                                  "You dropped multiple images. Would you like to switch to batch mode to process them all?"):
                 self.batch_mode = True
                 self.create_batch_interface()
-                for file in files:
-                    self.add_to_queue(file)
+                self.add_files_to_queue(files)
             else:
                 # Just process the first image
                 self.load_single_image(files[0])
         else:
             # Batch mode - add all files to queue
-            for file in files:
-                self.add_to_queue(file)
+            self.add_files_to_queue(files)
 
     def process_image(self):
         # This method is only used for batch processing now
@@ -791,7 +1110,7 @@ class BackgroundRemoverApp(ttk.Frame):
             messagebox.showwarning("Warning", "Please add images to the queue first")
             return
             
-        if self.current_thread and self.current_thread.is_alive():
+        if self._is_batch_running():
             return
         
         # For batch processing, ask for output directory first
@@ -801,12 +1120,57 @@ class BackgroundRemoverApp(ttk.Frame):
             )
             if not self.output_directory:
                 return  # User cancelled
-            
-        # Initialize batch processing only once at the start
-        if not hasattr(self, 'batch_total'):
-            self.batch_total = len(self.processing_queue)
-            self.batch_current = 0
-            self.processed_files = []  # Track processed file names
+        
+        if not self._open_job_manifest():
+            return
+        if not self.processing_queue:
+            self.status_var.set("All queued images were already processed into this folder")
+            return
+        
+        self._begin_batch()
+
+    def _read_batch_settings(self):
+        """
+        Validate the Workers and Batch spinboxes, which also accept typed-in text.
+
+        Values above a spinbox's range are clamped to it.
+
+        Returns:
+            (workers, batch_size), or None after telling the user what is wrong
+        """
+        limits = (('Workers', 'workers_var', default_worker_count(), max(os.cpu_count() or 1, 1)),
+                  ('Batch', 'batch_size_var', 1, 16))
+        values = []
+        for label, name, default, upper in limits:
+            variable = getattr(self, name, None)
+            try:
+                value = variable.get() if variable is not None else default
+            except tk.TclError:
+                value = None
+            if value is None or value < 1:
+                messagebox.showerror("Invalid Setting", f"{label} must be a whole number from 1 to {upper}.")
+                return None
+            if value > upper:
+                value = upper
+                variable.set(value)
+            values.append(value)
+        return tuple(values)
+
+    def _reset_batch_controls(self):
+        self.cancel_btn.config(state='disabled')
+        self.process_btn.configure(text="▶ Start Processing")
+        self.process_btn.config(state='normal')
+
+    def _begin_batch(self):
+        """Reset the batch progress and start processing the queue"""
+        settings = self._read_batch_settings()
+        if settings is None:
+            return
+        self.batch_workers, self.batch_size = settings
+        self.batch_total = len(self.processing_queue)
+        self.batch_current = 0
+        self.batch_failures = []
+        self.processed_files = []  # Track processed file names
             
         self.process_btn.configure(text="⏳ Processing...")
         self.process_btn.config(state='disabled')
@@ -814,148 +1178,405 @@ class BackgroundRemoverApp(ttk.Frame):
         self.progress['value'] = 0
         self.cancelled = False
         
-        # Load the first image from queue
-        if self.processing_queue and not self.input_image:
-            self._load_next_from_queue()
-        
-        def on_progress(value):
-            if not self.cancelled:
-                # Calculate overall progress for batch
-                batch_progress = (self.batch_current / self.batch_total) * 100
-                individual_progress = (value / 100) * (100 / self.batch_total)
-                total_progress = batch_progress + individual_progress
-                self.progress['value'] = min(total_progress, 100)
-                self.update_idletasks()
-        
-        def on_complete(result):
-            if not self.cancelled:
-                self.output_image = result
-                self.processed_images.append(result)
-                if hasattr(self, 'output_preview'):
-                    self.output_preview.set_image(self.output_image)
-                if hasattr(self, 'save_btn'):
-                    self.save_btn.config(state='normal')
-                
-                # Auto-save for batch processing
-                if hasattr(self, 'output_directory') and self.output_directory:
-                    self._auto_save_image(result)
-                
-                self.batch_current += 1
-                
-                # Update status with batch progress
-                if self.batch_total > 1:
-                    self.status_var.set(f"Processed {self.batch_current} of {self.batch_total} images")
-                else:
-                    self.status_var.set("Background removed successfully")
-                
-                self.process_next()
-        
-        def on_error(error):
-            messagebox.showerror("Error", f"Failed to process image: {str(error)}")
-            self.status_var.set("Processing failed")
-            self.batch_current += 1
-            self.process_next()
-        
-        # Show current processing status
+        self._start_batch_run()
+
+    def _start_batch_run(self):
+        """
+        Hand everything currently queued to a new batch engine.
+
+        Uses the worker and batch sizes _begin_batch() validated, so editing the
+        spinboxes during a run doesn't affect images added to it.
+        """
+        self.batch_profile = self.profile_var.get()
+        if self.job_manifest is not None:
+            # Model or format may have changed since the manifest was opened, e.g. while watching
+            self.job_manifest.settings = self._job_settings()
+            self.job_manifest.record_queued(self.processing_queue)
+        try:
+            engine = BatchEngine(
+                workers=self.batch_workers,
+                model_name=self.model_var.get(),
+                batch_size=self.batch_size,
+                output_handler=self._batch_output_handler,
+                cache=get_default_cache(),
+                backend=self.backend_var.get() if hasattr(self, 'backend_var') else BACKENDS[0],
+                estimator=self.eta,
+                manifest=self.job_manifest,
+                preview_size=BATCH_PREVIEW_SIZE
+            )
+        except (ValueError, OSError) as e:
+            self._reset_batch_controls()
+            self.status_var.set("Processing could not start")
+            messagebox.showerror("Error", f"Could not start processing: {str(e)}")
+            return
+        # Engine events arrive on worker threads, Tk must only be touched from its own thread
+        engine.subscribe(lambda event: self._post_batch_event(engine, event))
+        self.batch_engine = engine
+        engine.start(list(self.processing_queue))
+
         if self.batch_total > 1:
-            self.status_var.set(f"Processing image {self.batch_current + 1} of {self.batch_total}...")
+            self.status_var.set(f"Processing {self.batch_total} images with {self.batch_engine.workers} workers...")
         else:
             self.status_var.set("Processing...")
-            
-        self.current_thread = process_image_async(
-            self.input_image,
-            on_complete,
-            on_error,
-            on_progress
+
+    def _open_job_manifest(self):
+        """
+        Open the job manifest of the output directory, offering to skip images an earlier run completed.
+
+        Returns:
+            False if the manifest can't be used and the batch should not start
+        """
+        self._close_job_manifest()
+        if not getattr(self, 'output_directory', None):
+            return True
+        try:
+            self.job_manifest = JobManifest(self.output_directory, settings=self._job_settings())
+        except OSError as e:
+            messagebox.showerror("Error", f"Cannot record progress in the output folder:\n{str(e)}")
+            return False
+        completed = [path for path in self.processing_queue if self.job_manifest.is_completed(path)]
+        if completed and messagebox.askyesno(
+                "Resume Job",
+                f"{len(completed)} of {len(self.processing_queue)} queued images were already processed "
+                f"into this folder by an earlier run.\nSkip them?"):
+            for path in completed:
+                self._remove_from_pending(path)
+        return True
+
+    def _job_settings(self):
+        """Settings batch outputs are written with, so a job resumed with other ones redoes its images"""
+        return job_settings(self.model_var.get(), self.profile_var.get(), DEFAULT_INFERENCE_SIZE)
+
+    def _close_job_manifest(self):
+        if self.job_manifest is not None:
+            self.job_manifest.close()
+            self.job_manifest = None
+
+    def resume_job(self):
+        """Queue the images an interrupted batch job left unprocessed, from the manifest in its output folder"""
+        if self._is_batch_running():
+            messagebox.showinfo("Resume Batch Job", "Wait for the running batch to finish or cancel it first.")
+            return
+        directory = filedialog.askdirectory(title="Select the Output Folder of the Job to Resume")
+        if not directory:
+            return
+        try:
+            manifest = JobManifest(directory)
+        except OSError as e:
+            messagebox.showerror("Error", f"Cannot read the job in this folder:\n{str(e)}")
+            return
+        try:
+            remaining = manifest.unfinished()
+            total = len(manifest)
+        finally:
+            manifest.close()
+        if not remaining:
+            messagebox.showinfo("Resume Batch Job",
+                                f"Nothing left to process: {total} image(s) recorded in this folder are done."
+                                if total else "No batch job was recorded in this folder.")
+            return
+        if not self.batch_mode:
+            self.batch_mode = True
+            self.create_batch_interface()
+        # Results go where the job was writing them
+        self.output_directory = directory
+        self.add_files_to_queue(remaining)
+        self.status_var.set(f"Resuming job: {len(remaining)} of {total} images left - press Start to continue")
+
+    def toggle_watch_folder(self):
+        if self.watch_var.get():
+            self.start_watch_folder()
+        else:
+            self.stop_watch_folder()
+
+    def start_watch_folder(self):
+        """Watch a folder and process images written into it, auto-saving them to the output folder"""
+        self.watch_var.set(False)  # Set again once watching actually starts
+        if self.folder_watcher is not None:
+            return
+        directory = filedialog.askdirectory(title="Select a Folder to Watch for New Images")
+        if not directory:
+            return
+        if not getattr(self, 'output_directory', None):
+            self.output_directory = filedialog.askdirectory(title="Select Directory to Save Processed Images")
+            if not self.output_directory:
+                return
+        if os.path.abspath(directory) == os.path.abspath(self.output_directory):
+            messagebox.showerror("Watch Folder", "Processed images can't be saved into the watched folder.\n"
+                                                 "Choose a different output folder with File > New Session first.")
+            return
+        if not self.batch_mode:
+            self.batch_mode = True
+            self.create_batch_interface()
+        if self.job_manifest is None:
+            try:
+                # Images completed into this output folder before are skipped
+                self.job_manifest = JobManifest(self.output_directory, settings=self._job_settings())
+            except OSError as e:
+                messagebox.showerror("Error", f"Cannot record progress in the output folder:\n{str(e)}")
+                return
+
+        self.watch_throughput = ThroughputMeter()
+        self.watch_done = 0
+        self.watch_failed = 0
+        self._watch_in_flight = set()
+        self.folder_watcher = FolderWatcher(
+            directory,
+            # Reported on the watcher thread
+            on_files=lambda paths: self.ui_bus.post(self._on_watched_files, paths),
+            exclude=[self.output_directory]
         )
+        self.folder_watcher.start()
+        self.watch_var.set(True)
+        self._watch_tick()
+
+    def stop_watch_folder(self):
+        if self.folder_watcher is None:
+            return
+        self.folder_watcher.stop(timeout=1.0)
+        self.folder_watcher = None
+        self.watch_var.set(False)
+        if self._watch_job is not None:
+            self.after_cancel(self._watch_job)
+            self._watch_job = None
+        if not self._is_batch_running():
+            self._close_job_manifest()
+        self.status_var.set(f"Stopped watching: {self.watch_done} processed, {self.watch_failed} failed")
+
+    def _on_watched_files(self, paths):
+        """New, completely written images in the watched folder"""
+        if self.folder_watcher is None:
+            return
+        if self.job_manifest is not None:
+            paths = [path for path in paths if not self.job_manifest.is_completed(path)]
+        self.add_files_to_queue(paths, unattended=True)
+
+    def _count_watch_event(self, event):
+        if event.kind == 'started':
+            self._watch_in_flight.add(event.path)
+        elif event.kind in ('completed', 'failed'):
+            self._watch_in_flight.discard(event.path)
+            if event.kind == 'completed':
+                self.watch_done += 1
+                self.watch_throughput.record()
+            else:
+                self.watch_failed += 1
+
+    def _watch_tick(self):
+        """Refresh the watch status every second so the rate and backlog stay current when idle"""
+        self._watch_job = None
+        if self.folder_watcher is None:
+            return
+        self._update_watch_status()
+        self._watch_job = self.after(1000, self._watch_tick)
+
+    def _update_watch_status(self):
+        """Throughput and backlog of the watch in the status bar"""
+        watcher = self.folder_watcher
+        if watcher is None:
+            return
+        backlog = len(self.processing_queue) + len(self._watch_in_flight) + watcher.settling
+        failed = f", {self.watch_failed} failed" if self.watch_failed else ""
+        self.status_var.set(f"Watching {os.path.basename(watcher.directory)}: {self.watch_done} processed{failed}, "
+                            f"{backlog} waiting - {self.watch_throughput.rate() * 60:.1f} images/min")
+
+    def _is_batch_running(self):
+        return getattr(self, 'batch_engine', None) is not None and self.batch_engine.is_running
+
+    def _batch_output_handler(self, original_path, result):
+        """Runs on a batch encode thread, must not touch Tk"""
+        if hasattr(self, 'output_directory') and self.output_directory:
+            return self._auto_save_image(result, original_path)
+        return None
+
+    def _remove_from_pending(self, path):
+        """Drop a path from the visible queue once the engine has picked it up"""
+        if path in self.processing_queue:
+            index = self.processing_queue.index(path)
+            del self.processing_queue[index]
+            self.queue_list.delete(index)
+
+    def _post_batch_event(self, engine, event):
+        """Runs on engine threads; hands the event to the Tk thread through the UI bus"""
+        self.ui_bus.post(self._on_batch_event, engine, event)
+        # Previews only need the latest image, so bursts redraw once
+        if event.kind == 'started':
+            self.ui_bus.post_latest('batch-input-preview', self._show_batch_preview, engine, event)
+        elif event.kind == 'completed':
+            self.ui_bus.post_latest('batch-output-preview', self._show_batch_preview, engine, event)
+
+    def _show_batch_preview(self, engine, event):
+        if engine is not self.batch_engine:
+            return
+        if event.kind == 'started':
+            self.input_image = event.image
+            self.input_preview.set_image(self.input_image)
+        else:
+            # Composited at preview size by the engine; the full output is only built when saved
+            self.output_image = event.preview
+            self.output_preview.set_image(self.output_image)
+
+    def _on_batch_event(self, engine, event):
+        """Handle a BatchEngine event on the Tk thread"""
+        if engine is not self.batch_engine:
+            return  # Late event from a cancelled run
+
+        if self.folder_watcher is not None:
+            self._count_watch_event(event)
+
+        if event.kind == 'started':
+            self._remove_from_pending(event.path)
+            if self.batch_total > 1:
+                self.status_var.set(f"Processing: {os.path.basename(event.path)} "
+                                    f"({self.batch_current + 1} of {self.batch_total})")
+            else:
+                self.status_var.set(f"Processing: {os.path.basename(event.path)}")
+
+        elif event.kind == 'completed':
+            self.output_result = event.result
+            # Auto-saved PNGs hold the mask as their alpha, so the store can keep the file instead
+            self.processed_images.add(event.result, event.output_path,
+                                      saved_mask=get_profile(self.batch_profile).file_format == 'PNG')
+            self.save_btn.config(state='normal')
+            self.batch_current += 1
+            self.progress['value'] = min(self.batch_current / max(self.batch_total, 1) * 100, 100)
+
+            # Update status with batch progress and auto-save
+            if event.output_path:
+                if not hasattr(self, 'auto_saved_files'):
+                    self.auto_saved_files = []
+                self.auto_saved_files.append(event.output_path)
+                self.processed_files.append(event.path)
+                filename_only = os.path.basename(event.output_path)
+                if self.batch_total > 1:
+                    self.status_var.set(f"Auto-saved: {filename_only} "
+                                        f"({self.batch_current}/{self.batch_total}){self._batch_eta_text()}")
+                else:
+                    self.status_var.set(f"Auto-saved: {filename_only}")
+            elif self.batch_total > 1:
+                self.status_var.set(f"Processed {self.batch_current} of {self.batch_total} images"
+                                    f"{self._batch_eta_text()}")
+            else:
+                self.status_var.set("Background removed successfully")
+
+        elif event.kind == 'failed':
+            self._remove_from_pending(event.path)
+            self.batch_current += 1
+            self.batch_failures.append((event.path, event.error))
+            self.progress['value'] = min(self.batch_current / max(self.batch_total, 1) * 100, 100)
+
+        elif event.kind == 'finished':
+            self._on_batch_finished(event)
+            return
+
+        if self.folder_watcher is not None:
+            self._update_watch_status()
+
+    def _batch_eta_text(self):
+        """Remaining time of the batch from observed throughput, as a status suffix"""
+        workers = self.batch_engine.workers if self.batch_engine is not None else 1
+        seconds = self.eta.batch_eta(self.batch_total - self.batch_current, workers)
+        if not seconds:
+            return ""
+        return f" - about {format_duration(seconds)} left"
+
+    def _on_batch_finished(self, event):
+        self.batch_engine = None
+        if self.processing_queue:
+            # Images added while the batch was running
+            self.batch_total += len(self.processing_queue)
+            self._start_batch_run()
+            return
+
+        if self.folder_watcher is not None:
+            # Idle until the next image arrives; failures are counted in the status
+            # bar rather than interrupting an unattended watch with a dialog
+            self._reset_batch_controls()
+            self._update_watch_status()
+            return
+
+        self._close_job_manifest()
+        self._reset_batch_controls()
+
+        if self.batch_failures:
+            self.status_var.set(f"Processed {self.batch_current - len(self.batch_failures)} of "
+                                f"{self.batch_total} images, {len(self.batch_failures)} failed")
+            details = "\n".join(f"• {os.path.basename(path)}: {str(error)}"
+                                for path, error in self.batch_failures[:10])
+            if len(self.batch_failures) > 10:
+                details += f"\n… and {len(self.batch_failures) - 10} more"
+            messagebox.showerror("Error", f"Failed to process {len(self.batch_failures)} image(s):\n\n{details}")
+        else:
+            self.status_var.set("All images processed")
+
+        # Reset batch processing state
+        if hasattr(self, 'batch_total'):
+            delattr(self, 'batch_total')
 
     def save_image(self):
-        if not self.output_image and len(self.processed_images) == 0:
+        if not self.batch_mode and self._is_refining():
+            messagebox.showinfo("Still Refining",
+                                "The full-quality result is still being computed.\n"
+                                "Wait for it, or choose Keep Preview to save the preview.")
+            return
+        if not self.output_result and len(self.processed_images) == 0:
             messagebox.showwarning("Warning", "No processed images to save")
             return
             
         # For single image (simple mode)
-        if not self.batch_mode and self.output_image:
+        if not self.batch_mode and self.output_result:
             self._save_single_image()
         # For batch saving
         else:
             self._save_batch_images()
     
     def _save_single_image(self):
+        profile = ENCODER_PROFILES[self.profile_var.get()]
+        # The chosen profile's type first, then one entry per other extension
+        filetypes, extensions = [], set()
+        for name in [profile.name] + available_profiles():
+            candidate = ENCODER_PROFILES[name]
+            if candidate.extension not in extensions:
+                extensions.add(candidate.extension)
+                filetypes.append((f"{candidate.file_format} files", f"*{candidate.extension}"))
         filename = filedialog.asksaveasfilename(
-            defaultextension=".png",
-            filetypes=[
-                ("PNG files", "*.png"),
-                ("JPEG files", "*.jpg"),
-                ("All files", "*.*")
-            ],
+            defaultextension=profile.extension,
+            filetypes=filetypes + [("All files", "*.*")],
             title="Save Processed Image"
         )
         
         if filename:
-            try:
-                # Convert to RGB if saving as JPEG
-                if filename.lower().endswith(('.jpg', '.jpeg')):
-                    # Create a white background for JPEG
-                    rgb_image = Image.new('RGB', self.output_image.size, (255, 255, 255))
-                    rgb_image.paste(self.output_image, mask=self.output_image.split()[-1])
-                    rgb_image.save(filename, quality=95)
-                else:
-                    self.output_image.save(filename)
-                    
-                self.status_var.set(f"✅ Saved: {os.path.basename(filename)}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save image: {str(e)}")
-    
-    def _auto_save_image(self, image, original_path=None):
-        """Automatically save processed image to the selected output directory"""
-        try:
-            if not hasattr(self, 'output_directory') or not self.output_directory:
-                return
+            def show_saved(future):
+                try:
+                    future.result()
+                    self.status_var.set(f"✅ Saved: {os.path.basename(filename)}")
+                except Exception as e:
+                    messagebox.showerror("Error", f"Failed to save image: {str(e)}")
             
-            # Generate filename based on original image name or current count
-            if original_path:
-                # Use original filename with "_processed" suffix
-                original_name = os.path.splitext(os.path.basename(original_path))[0]
-                filename = f"{original_name}_processed.png"
-            else:
-                # Fallback to numbered naming
-                filename = f"processed_{self.batch_current + 1}.png"
-            
-            # Full path for saving
-            save_path = os.path.join(self.output_directory, filename)
-            
-            # Handle duplicate filenames by adding a counter
-            counter = 1
-            base_path = save_path
-            while os.path.exists(save_path):
-                name, ext = os.path.splitext(base_path)
-                save_path = f"{name}_{counter}{ext}"
-                counter += 1
-            
-            # Save the image
-            image.save(save_path)
-            
-            # Track saved files
-            if not hasattr(self, 'auto_saved_files'):
-                self.auto_saved_files = []
-            self.auto_saved_files.append(save_path)
-            
-            # Update status to show auto-save
-            filename_only = os.path.basename(save_path)
-            if hasattr(self, 'batch_total') and self.batch_total > 1:
-                self.status_var.set(f"Auto-saved: {filename_only} ({self.batch_current + 1}/{self.batch_total})")
-            else:
-                self.status_var.set(f"Auto-saved: {filename_only}")
-                
-        except Exception as e:
-            print(f"Auto-save failed: {str(e)}")  # Log error but don't interrupt processing
+            # A different extension picks that format's profile; JPEG is composited onto white
+            profile = profile_for_path(filename, self.profile_var.get())
+            self.status_var.set(f"Saving {os.path.basename(filename)} as {profile.label}...")
+            future = self.output_writer.submit(save_result, self.output_result, filename, profile.name)
+            future.add_done_callback(lambda future: self.ui_bus.post(show_saved, future))
+    
+    def _auto_save_image(self, result, original_path=None):
+        """
+        Automatically save processed image to the selected output directory.
+
+        Called from batch encode threads, so it only touches the filesystem and
+        returns the saved path (or None) for the caller to report. A failed
+        save raises, so the batch engine counts the image as failed.
+        """
+        if not hasattr(self, 'output_directory') or not self.output_directory:
+            return None
+        return auto_save_image(result, self.output_directory, original_path,
+                               index=self.batch_current + 1, profile=self.batch_profile)
 
     def _save_batch_images(self):
         # Create a custom dialog for batch save options
         dialog = tk.Toplevel(self.master)
         dialog.title("Batch Save Options")
-        dialog.geometry("400x300")
+        dialog.geometry("460x560")
         dialog.transient(self.master)
         dialog.grab_set()
         
@@ -1002,11 +1623,57 @@ class BackgroundRemoverApp(ttk.Frame):
         format_frame = ttk.Frame(dialog)
         format_frame.pack(fill=tk.X, padx=10, pady=5)
         
-        self.file_format = tk.StringVar(value="PNG")
-        ttk.Radiobutton(format_frame, text="PNG (with transparency)", variable=self.file_format, 
-                       value="PNG").pack(anchor='w')
-        ttk.Radiobutton(format_frame, text="JPEG (white background)", variable=self.file_format, 
-                       value="JPEG").pack(anchor='w')
+        format_buttons = {}
+        for name in available_profiles():
+            profile = ENCODER_PROFILES[name]
+            button = ttk.Radiobutton(format_frame, text=f"{profile.label} - {profile.description}",
+                                     variable=self.profile_var, value=name)
+            button.pack(anchor='w')
+            format_buttons[name] = button
+        
+        def show_measurement(measurement):
+            # Measured on the first image, so operators can weigh speed against size
+            if dialog.winfo_exists():
+                profile = ENCODER_PROFILES[measurement.profile]
+                format_buttons[measurement.profile].config(
+                    text=f"{profile.label} - {self._format_measurement(measurement)}")
+        
+        measuring = CancellationToken()
+        dialog.bind('<Destroy>', lambda event: measuring.cancel())
+        if len(self.processed_images) > 0:
+            self._measure_profiles_async(self.processed_images[0], show_measurement, measuring)
+        
+        # Background and crop, composited from the stored masks
+        ttk.Label(dialog, text="Background:", font=('TkDefaultFont', 10, 'bold')).pack(pady=(5, 5))
+        
+        background_frame = ttk.Frame(dialog)
+        background_frame.pack(fill=tk.X, padx=10, pady=5)
+        
+        self.background_choice = tk.StringVar(value="transparent")
+        self.background_color = (255, 255, 255)
+        color_label = ttk.Label(background_frame, text="#ffffff")
+        
+        def choose_color():
+            rgb, hex_color = colorchooser.askcolor(color=color_label.cget('text'), parent=dialog,
+                                                   title="Background Colour")
+            if rgb:
+                self.background_color = tuple(int(v) for v in rgb)
+                color_label.config(text=hex_color)
+                self.background_choice.set("custom")
+        
+        ttk.Radiobutton(background_frame, text="Transparent", variable=self.background_choice,
+                       value="transparent").pack(side=tk.LEFT)
+        ttk.Radiobutton(background_frame, text="White", variable=self.background_choice,
+                       value="white").pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Radiobutton(background_frame, text="Custom", variable=self.background_choice,
+                       value="custom").pack(side=tk.LEFT, padx=(5, 0))
+        ttk.Button(background_frame, text="Pick...", command=choose_color,
+                  style="Secondary.TButton").pack(side=tk.LEFT, padx=(5, 0))
+        color_label.pack(side=tk.LEFT, padx=(5, 0))
+        
+        self.crop_to_subject = tk.BooleanVar(value=False)
+        ttk.Checkbutton(dialog, text="Crop to subject",
+                       variable=self.crop_to_subject).pack(anchor='w', padx=10)
         
         # Buttons
         button_frame = ttk.Frame(dialog)
@@ -1023,88 +1690,190 @@ class BackgroundRemoverApp(ttk.Frame):
                 return
             
             pattern = self.naming_pattern.get()
-            file_format = self.file_format.get()
+            profile = self.profile_var.get()
+            background = {
+                "transparent": None,
+                "white": (255, 255, 255),
+                "custom": self.background_color,
+            }[self.background_choice.get()]
+            crop = self.crop_to_subject.get()
             
-            try:
-                saved_count = 0
-                for i, img in enumerate(self.processed_images):
-                    # Generate filename
-                    if "{index}" in pattern:
-                        base_name = pattern.replace("{index}", str(i + 1))
-                    else:
-                        base_name = f"{pattern}_{i + 1}"
-                    
-                    # Add extension
-                    if file_format == "PNG":
-                        filename = os.path.join(directory, f"{base_name}.png")
-                        img.save(filename)
-                    else:  # JPEG
-                        filename = os.path.join(directory, f"{base_name}.jpg")
-                        # Convert to RGB with white background
-                        rgb_image = Image.new('RGB', img.size, (255, 255, 255))
-                        rgb_image.paste(img, mask=img.split()[-1])
-                        rgb_image.save(filename, quality=95)
-                    
-                    saved_count += 1
-                
-                self.status_var.set(f"✅ Saved {saved_count} images to {os.path.basename(directory)}")
+            filenames = []
+            for i in range(len(self.processed_images)):
+                # Generate filename
+                if "{index}" in pattern:
+                    base_name = pattern.replace("{index}", str(i + 1))
+                else:
+                    base_name = f"{pattern}_{i + 1}"
+                filenames.append(os.path.join(directory, f"{base_name}{ENCODER_PROFILES[profile].extension}"))
+            
+            save_btn.config(state='disabled')
+            self.status_var.set(f"Saving {len(filenames)} images...")
+            # Encoding runs on the writer pool; submitting blocks when it is busy,
+            # so it happens on a thread of its own instead of freezing the dialog
+            thread = threading.Thread(target=write_all, args=(directory, filenames, profile, background, crop))
+            thread.daemon = True
+            thread.start()
+        
+        def write_all(directory, filenames, profile, background, crop):
+            done = [0]
+            lock = threading.Lock()
+            
+            def written(_):
+                with lock:
+                    done[0] += 1
+                    count = done[0]
+                self.ui_bus.post_latest('batch-save-progress', self.status_var.set,
+                                        f"Saving... {count} of {len(filenames)} images written")
+            
+            futures = []
+            errors = []
+            # Results stream out of the store and are composited one at a time per writer
+            for index, filename in enumerate(filenames):
+                try:
+                    result = self.processed_images[index]
+                except OSError as e:
+                    errors.append(e)  # e.g. its auto-saved file was changed since
+                    continue
+                future = self.output_writer.submit(save_result, result, filename, profile, background, crop)
+                future.add_done_callback(written)
+                futures.append(future)
+            for future in futures:
+                try:
+                    future.result()
+                except Exception as e:
+                    errors.append(e)
+            self.ui_bus.post(finish_save, directory, len(filenames) - len(errors),
+                             errors[0] if errors else None)
+        
+        def finish_save(directory, saved_count, error):
+            if error is not None:
+                messagebox.showerror("Error", f"Failed to save images: {str(error)}")
+                self.status_var.set(f"Saved {saved_count} images to {os.path.basename(directory)}")
+                if dialog.winfo_exists():
+                    save_btn.config(state='normal')
+                return
+            self.status_var.set(f"✅ Saved {saved_count} images to {os.path.basename(directory)}")
+            if dialog.winfo_exists():
                 dialog.destroy()
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to save images: {str(e)}")
         
-        ttk.Button(button_frame, text="💾 Save All", command=save_batch,
-                  style="Success.TButton").pack(side=tk.RIGHT, padx=(5, 0))
+        save_btn = ttk.Button(button_frame, text="💾 Save All", command=save_batch,
+                             style="Success.TButton")
+        save_btn.pack(side=tk.RIGHT, padx=(5, 0))
         ttk.Button(button_frame, text="Cancel", command=dialog.destroy,
                   style="Secondary.TButton").pack(side=tk.RIGHT)
 
     def add_to_queue(self, path):
-        """Add image to processing queue with comprehensive validation"""
-        try:
-            # Check if file exists
-            if not os.path.exists(path):
-                messagebox.showerror("File Not Found", f"The file '{os.path.basename(path)}' could not be found.")
-                return
-
-            # Check file size (limit to 50MB)
-            file_size = os.path.getsize(path)
-            if file_size > 50 * 1024 * 1024:  # 50MB
-                messagebox.showerror("File Too Large",
-                                   f"The file '{os.path.basename(path)}' is too large.\n"
-                                   f"Maximum file size is 50MB.\n"
-                                   f"Current file size: {file_size / (1024*1024):.1f}MB")
+        """Add an image to the processing queue"""
+        self.add_files_to_queue([path])
+
+    def add_files_to_queue(self, paths, unattended=False):
+        """
+        Check files from their headers on a background thread and queue them.
+
+        Rows appear in the queue as files pass; very large images and files
+        that can't be added are reported together once all are checked.
+        Pixels are only decoded when an image reaches a batch worker.
+        Unattended additions, from a watched folder, queue large images
+        without asking and only log files that can't be added.
+        """
+        paths = list(paths)
+        if not paths:
+            return
+        if self._admission is None:
+            self._admission = CancellationToken()
+        token = self._admission
+        self.status_var.set(f"Checking {len(paths)} file(s)...")
+        thread = threading.Thread(target=self._admit_files, args=(paths, token, unattended))
+        thread.daemon = True
+        thread.start()
+
+    def _admit_files(self, paths, token, unattended):
+        """Runs off the Tk thread: reads file headers and posts accepted rows in chunks"""
+        accepted, large, rejected = [], [], []
+        last_post = time.monotonic()
+        for path in paths:
+            if token.cancelled:
                 return
-
-            # Validate image format and integrity
-            with Image.open(path) as img:
-                # Check image dimensions
-                if img.width > 8000 or img.height > 8000:
-                    result = messagebox.askyesno("Large Image",
-                                               f"The image '{os.path.basename(path)}' is very large "
-                                               f"({img.width}x{img.height} pixels).\n"
-                                               f"Processing may take a long time. Continue?")
-                    if not result:
-                        return
-
-                # Check if image is already in queue
-                if path in self.processing_queue:
-                    messagebox.showwarning("Duplicate Image",
-                                         f"'{os.path.basename(path)}' is already in the queue.")
-                    return
-
-                # Add to queue
-                self.processing_queue.append(path)
-                self.queue_list.insert(tk.END, f"{os.path.basename(path)} ({img.width}x{img.height})")
-
-                if hasattr(self, 'process_btn'):
-                    self.process_btn.config(state='normal')
-
-                self.status_var.set(f"Added to queue: {os.path.basename(path)} ({len(self.processing_queue)} images total)")
-
-        except Exception as e:
-            error_msg = self._get_user_friendly_error_message(str(e))
-            messagebox.showerror("Invalid Image",
-                               f"Failed to add '{os.path.basename(path)}':\n{error_msg}")
+            size, error = self.input_policy.check(path)
+            if error:
+                rejected.append((path, error))
+            elif self.input_policy.is_large(size):
+                large.append((path, size))
+            else:
+                accepted.append((path, size))
+            if accepted and time.monotonic() - last_post >= ADMISSION_POST_INTERVAL:
+                self.ui_bus.post(self._insert_queue_rows, token, accepted)
+                accepted = []
+                last_post = time.monotonic()
+        self.ui_bus.post(self._insert_queue_rows, token, accepted)
+        self.ui_bus.post(self._finish_admission, token, len(paths), large, rejected, unattended)
+
+    def _insert_queue_rows(self, token, rows):
+        """Append checked files to the queue, skipping ones already in it"""
+        if token.cancelled or not self.batch_mode or not rows:
+            return 0
+        queued = set(self.processing_queue)
+        added = 0
+        for path, (width, height) in rows:
+            if path in queued:
+                continue
+            queued.add(path)
+            self.processing_queue.append(path)
+            self.queue_list.insert(tk.END, f"{os.path.basename(path)} ({width}x{height})")
+            added += 1
+        if added:
+            if hasattr(self, 'process_btn'):
+                self.process_btn.config(state='normal')
+            self.status_var.set(f"Added {os.path.basename(rows[-1][0])} ({len(self.processing_queue)} images total)")
+            if self.folder_watcher is not None and not self._is_batch_running():
+                self._begin_batch()
+        return added
+
+    def _finish_admission(self, token, total, large, rejected, unattended=False):
+        """Ask once about all very large images and report all rejected files together"""
+        if token.cancelled or not self.batch_mode:
+            return
+        if unattended:
+            self._insert_queue_rows(token, large)
+            for path, error in rejected:
+                print(f"Not processing {path}: {error}")
+            if self.folder_watcher is not None:
+                self.watch_failed += len(rejected)
+                self._update_watch_status()
+            return
+        if large and self._confirm_large_images(large):
+            self._insert_queue_rows(token, large)
+
+        if rejected:
+            lines = [f"{os.path.basename(path)}: {self._get_user_friendly_error_message(error).splitlines()[0]}"
+                     for path, error in rejected[:ADMISSION_SUMMARY_LINES]]
+            if len(rejected) > ADMISSION_SUMMARY_LINES:
+                lines.append(f"...and {len(rejected) - ADMISSION_SUMMARY_LINES} more")
+            messagebox.showwarning("Some Files Not Added",
+                                   f"{len(rejected)} of {total} file(s) could not be added:\n\n" + "\n".join(lines))
+        self.status_var.set(f"{len(self.processing_queue)} images in queue")
+
+    def _confirm_large_images(self, large):
+        """Ask once whether to queue very large images, listing them with an estimate"""
+        if len(large) == 1:
+            path, size = large[0]
+            return self._confirm_large_image(f"The image '{os.path.basename(path)}' is very large", size)
+        lines = [f"{os.path.basename(path)} ({width}x{height})" for path, (width, height) in large[:ADMISSION_SUMMARY_LINES]]
+        if len(large) > ADMISSION_SUMMARY_LINES:
+            lines.append(f"...and {len(large) - ADMISSION_SUMMARY_LINES} more")
+        seconds = sum(processing_estimate.estimate(size) for _, size in large)
+        return messagebox.askyesno("Large Images",
+                                   f"{len(large)} images are very large:\n\n" + "\n".join(lines) + "\n\n"
+                                   f"They will be analysed at a reduced size and their masks refined to full size.\n"
+                                   f"Estimated processing time: about {max(1, round(seconds))} seconds in total. "
+                                   f"Add them to the queue?")
+
+    def _cancel_admission(self):
+        """Drop files still being checked for the queue"""
+        if self._admission is not None:
+            self._admission.cancel()
+            self._admission = None
 
     def _get_user_friendly_error_message(self, error_str):
         """Convert technical error messages to user-friendly ones"""
@@ -1121,29 +1890,14 @@ class BackgroundRemoverApp(ttk.Frame):
         else:
             return f"An error occurred: {error_str}"
 
-    def _load_next_from_queue(self):
-        """Load the next image from the processing queue"""
-        if self.processing_queue:
-            next_image_path = self.processing_queue[0]  # Don't pop yet, will be done in process_next
-            try:
-                self.input_image = Image.open(next_image_path)
-                self.input_preview.set_image(self.input_image)
-                self.output_preview.clear()
-                self.status_var.set(f"Loaded from queue: {os.path.basename(next_image_path)}")
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load image from queue: {str(e)}")
-                # Remove the problematic image and try the next one
-                self.processing_queue.pop(0)
-                self.queue_list.delete(0)
-                self._load_next_from_queue()
-
     def clear_queue(self):
-        if not self.cancelled and self.current_thread and self.current_thread.is_alive():
+        if not self.cancelled and self._is_batch_running():
             if messagebox.askyesno("Warning", "Processing in progress. Cancel and clear queue?"):
                 self.cancel_processing()
             else:
                 return
                 
+        self._cancel_admission()
         self.processing_queue.clear()
         self.queue_list.delete(0, tk.END)
         self.status_var.set("Queue cleared")
@@ -1163,101 +1917,24 @@ class BackgroundRemoverApp(ttk.Frame):
         if not self.processing_queue and not self.input_image:
             self.process_btn.config(state='disabled')
 
-    def process_next(self):
-        self.progress['value'] = 0
-        if self.cancelled:
-            self.status_var.set("Processing cancelled")
-            self.cancel_btn.config(state='disabled')
-            self.process_btn.configure(text="▶ Start Processing")
-            self.process_btn.config(state='normal')
-            # Reset batch processing state
-            if hasattr(self, 'batch_total'):
-                delattr(self, 'batch_total')
-            return
-
-        if len(self.processing_queue) > 0:
-            next_image_path = self.processing_queue.pop(0)
-            self.queue_list.delete(0)
-            
-            try:
-                self.input_image = Image.open(next_image_path)
-                self.input_preview.set_image(self.input_image)
-                self.output_preview.clear()
-                self.status_var.set(f"Processing: {os.path.basename(next_image_path)}")
-                
-                # Process the next image directly without calling process_image()
-                def on_progress(value):
-                    if not self.cancelled:
-                        # Calculate overall progress for batch
-                        if hasattr(self, 'batch_total') and self.batch_total > 0:
-                            batch_progress = (self.batch_current / self.batch_total) * 100
-                            individual_progress = (value / 100) * (100 / self.batch_total)
-                            total_progress = batch_progress + individual_progress
-                            self.progress['value'] = min(total_progress, 100)
-                        else:
-                            self.progress['value'] = value
-                        self.update_idletasks()
-                
-                def on_complete(result):
-                    if not self.cancelled:
-                        self.output_image = result
-                        self.processed_images.append(result)
-                        self.output_preview.set_image(self.output_image)
-                        self.save_btn.config(state='normal')
-                        
-                        # Auto-save for batch processing
-                        if hasattr(self, 'output_directory') and self.output_directory:
-                            self._auto_save_image(result, next_image_path)
-                        
-                        self.batch_current += 1
-                        
-                        # Update status with batch progress
-                        if hasattr(self, 'batch_total') and self.batch_total > 1:
-                            self.status_var.set(f"Processed {self.batch_current} of {self.batch_total} images")
-                        else:
-                            self.status_var.set("Background removed successfully")
-                        
-                        # Continue to next image
-                        self.process_next()
-                
-                def on_error(error):
-                    messagebox.showerror("Error", f"Failed to process image: {str(error)}")
-                    self.status_var.set("Processing failed")
-                    self.batch_current += 1
-                    self.process_next()
-                
-                # Show current processing status
-                if hasattr(self, 'batch_total') and self.batch_total > 1:
-                    self.status_var.set(f"Processing image {self.batch_current + 1} of {self.batch_total}...")
-                else:
-                    self.status_var.set("Processing...")
-                    
-                self.current_thread = process_image_async(
-                    self.input_image,
-                    on_complete,
-                    on_error,
-                    on_progress
-                )
-                
-            except Exception as e:
-                messagebox.showerror("Error", f"Failed to load image: {str(e)}")
-                self.batch_current += 1
-                self.process_next()
-        else:
-            self.status_var.set("All images processed")
-            self.cancel_btn.config(state='disabled')
-            self.process_btn.configure(text="▶ Start Processing")
-            self.process_btn.config(state='normal')
-            # Reset batch processing state
-            if hasattr(self, 'batch_total'):
-                delattr(self, 'batch_total')
-            
     def cancel_processing(self):
+        if not self.batch_mode and self._is_refining():
+            # The preview is already on screen, only stop the full-quality pass
+            self._cancel_refine()
+            return
         self.cancelled = True
+        self.stop_watch_folder()  # Otherwise the next arriving image would start a new batch
         self.status_var.set("Cancelling...")
         if hasattr(self, 'cancel_btn'):
             self.cancel_btn.config(state='disabled')
         
+        # Stop the batch engine from starting any more images and ignore
+        # whatever it still reports
+        if getattr(self, 'batch_engine', None) is not None:
+            self.batch_engine.cancel()
+            self.batch_engine = None
+        self._close_job_manifest()
+        
         # Return to appropriate interface
         if not self.batch_mode:
             self.reset_to_simple()
@@ -1268,6 +1945,77 @@ class BackgroundRemoverApp(ttk.Frame):
             if hasattr(self, 'process_btn'):
                 self.process_btn.configure(text="▶ Start Processing")
                 self.process_btn.config(state='normal')
+            self.status_var.set("Processing cancelled")
+
+    def show_format_comparison(self):
+        """Encode the current result with every output format and list the time and size each took"""
+        if self.output_result is not None:
+            result = self.output_result
+        elif len(self.processed_images) > 0:
+            result = self.processed_images[0]
+        else:
+            messagebox.showinfo("Compare Output Formats", "Process an image first to compare output formats on it.")
+            return
+        
+        dialog = tk.Toplevel(self.master)
+        dialog.title("Compare Output Formats")
+        dialog.geometry("520x300")
+        dialog.transient(self.master)
+        
+        ttk.Label(dialog, text="Encoding the current image with each format...",
+                 font=('TkDefaultFont', 9), foreground='gray').pack(pady=(10, 5))
+        table = ttk.Treeview(dialog, columns=('format', 'time', 'size'), show='headings', height=8)
+        for column, heading, width in (('format', "Format", 220), ('time', "Encode Time", 120), ('size', "File Size", 120)):
+            table.heading(column, text=heading)
+            table.column(column, width=width, anchor='w')
+        table.pack(fill=tk.BOTH, expand=True, padx=10)
+        
+        def show_measurement(measurement):
+            if dialog.winfo_exists():
+                profile = ENCODER_PROFILES[measurement.profile]
+                table.insert('', tk.END, iid=profile.name, values=(
+                    profile.label, f"{measurement.seconds:.2f}s", self._format_file_size(measurement.size)))
+        
+        def use_selected():
+            selected = table.selection()
+            if selected:
+                self.profile_var.set(selected[0])
+                self.status_var.set(f"Saving as {ENCODER_PROFILES[selected[0]].label}")
+            dialog.destroy()
+        
+        button_frame = ttk.Frame(dialog)
+        button_frame.pack(side=tk.BOTTOM, fill=tk.X, padx=10, pady=10)
+        ttk.Button(button_frame, text="Use Selected", command=use_selected,
+                  style="Success.TButton").pack(side=tk.RIGHT, padx=(5, 0))
+        ttk.Button(button_frame, text="Close", command=dialog.destroy,
+                  style="Secondary.TButton").pack(side=tk.RIGHT)
+        
+        measuring = CancellationToken()
+        dialog.bind('<Destroy>', lambda event: measuring.cancel())
+        self._measure_profiles_async(result, show_measurement, measuring)
+
+    def _measure_profiles_async(self, result, on_measured, token):
+        """Encode result with each output format on a background thread, reporting each to on_measured on the Tk thread"""
+        def measure():
+            try:
+                for measurement in measure_profiles(result):
+                    if token.cancelled:
+                        return
+                    self.ui_bus.post(on_measured, measurement)
+            except Exception as e:
+                print(f"Measuring output formats failed: {str(e)}")  # Only informational
+        
+        thread = threading.Thread(target=measure)
+        thread.daemon = True
+        thread.start()
+
+    def _format_measurement(self, measurement):
+        return f"{measurement.seconds:.2f}s, {self._format_file_size(measurement.size)}"
+
+    def _format_file_size(self, size):
+        if size >= 1024 * 1024:
+            return f"{size / (1024 * 1024):.1f} MB"
+        return f"{max(1, round(size / 1024))} KB"
 
     def show_shortcuts(self):
         """Show keyboard shortcuts help dialog"""
@@ -1304,6 +2052,7 @@ Features:
 • Batch processing mode
 • Drag & drop support
 • Multiple export formats
+• Selectable segmentation models
 • Keyboard shortcuts
 
 Built with Python, Tkinter, and rembg
@@ -0,0 +1,156 @@
+import glob
+import os
+import sys
+import time
+from typing import Iterable, Iterator
+
+from batch_engine import BatchEngine
+from input_policy import IMAGE_EXTENSIONS
+from job_manifest import JobManifest, job_settings
+from progress import STAGES
+from outputs import auto_save_image
+from result_cache import ResultCache
+from watch_folder import FolderWatcher, ThroughputMeter, WatchFeed
+
+
+def _scan_directory(directory: str, recursive: bool) -> Iterator[str]:
+    """Yield image files in directory one at a time without listing it up front"""
+    stack = [directory]
+    while stack:
+        current = stack.pop()
+        try:
+            with os.scandir(current) as entries:
+                for entry in entries:
+                    if entry.is_dir(follow_symlinks=False):
+                        if recursive:
+                            stack.append(entry.path)
+                    elif entry.name.lower().endswith(IMAGE_EXTENSIONS):
+                        yield entry.path
+        except OSError as e:
+            print(f"Skipping {current}: {str(e)}", file=sys.stderr)
+
+
+def iter_input_files(inputs: Iterable[str], recursive: bool = False) -> Iterator[str]:
+    """
+    Expand input arguments into a lazy stream of image paths.
+
+    Args:
+        inputs: Files, directories or glob patterns
+        recursive: Descend into subdirectories of directory inputs; also
+            enables "**" in glob patterns
+
+    Yields:
+        Paths of image files
+    """
+    for source in inputs:
+        if os.path.isdir(source):
+            yield from _scan_directory(source, recursive)
+        elif os.path.isfile(source):
+            yield source
+        else:
+            matched = False
+            for path in glob.iglob(source, recursive=recursive):
+                if os.path.isfile(path):
+                    matched = True
+                    yield path
+            if not matched:
+                print(f"No files match: {source}", file=sys.stderr)
+
+
+def run_headless(args) -> int:
+    """
+    Process images without a window, writing the results into args.output.
+
+    Args:
+        args: Parsed command line arguments from main.parse_args()
+
+    Returns:
+        Process exit code, non-zero when any image failed
+    """
+    os.makedirs(args.output, exist_ok=True)
+    # Completed inputs are recorded as they finish, so an interrupted run can be resumed;
+    # a watch always continues its folder's job so restarting it doesn't redo the day's files
+    manifest = JobManifest(args.output, resume=args.resume or args.watch,
+                           settings=job_settings(args.model, args.format, args.inference_size))
+
+    def save_result(original_path, result):
+        return auto_save_image(result, args.output, original_path, profile=args.format)
+
+    engine = BatchEngine(
+        workers=args.workers,
+        model_name=args.model,
+        backend=args.backend,
+        inference_size=args.inference_size,
+        batch_size=args.batch_size,
+        cache=ResultCache(args.cache_dir) if args.cache else None,
+        output_handler=save_result,
+        manifest=manifest
+    )
+
+    started = time.monotonic()
+    stage_totals = {}
+    feed = None
+    throughput = ThroughputMeter()
+
+    def watch_status(event):
+        """Backlog and recent throughput, appended to each line while watching"""
+        if feed is None:
+            return ""
+        in_flight = event.submitted - event.completed - event.failed
+        return f" | backlog {feed.backlog + in_flight}, {throughput.rate() * 60:.1f} images/min"
+
+    def report(event):
+        if event.kind == 'completed':
+            throughput.record()
+            for stage, duration in (event.timings or {}).items():
+                stage_totals[stage] = stage_totals.get(stage, 0.0) + duration
+            cached = " (cached)" if event.cached else ""
+            print(f"[{event.completed + event.failed}] {event.path} -> {event.output_path}{cached}"
+                  f"{watch_status(event)}")
+        elif event.kind == 'failed':
+            print(f"[{event.completed + event.failed}] {event.path} FAILED: {str(event.error)}"
+                  f"{watch_status(event)}", file=sys.stderr)
+
+    engine.subscribe(report)
+    if args.watch:
+        # The output folder may sit inside a watched one; its files must not be fed back in
+        feed = WatchFeed([FolderWatcher(directory, recursive=args.recursive, exclude=[args.output])
+                          for directory in args.inputs])
+        feed.start()
+        paths = feed
+        print(f"Watching {', '.join(args.inputs)} for new images, press Ctrl+C to stop", file=sys.stderr)
+    else:
+        paths = iter_input_files(args.inputs, args.recursive)
+    engine.start(manifest.pending(paths) if args.resume or args.watch else paths)
+
+    try:
+        try:
+            engine.join()
+        except KeyboardInterrupt:
+            if feed is None:
+                raise
+            # Stop taking new files but finish the ones already picked up
+            print("Stopping the watch, finishing images in progress (Ctrl+C again to cancel)...", file=sys.stderr)
+            feed.stop()
+            engine.join()
+    except KeyboardInterrupt:
+        print("Cancelling...", file=sys.stderr)
+        if feed is not None:
+            feed.stop()
+        engine.cancel()
+        engine.join()
+        return 130
+    finally:
+        manifest.close()
+
+    elapsed = time.monotonic() - started
+    rate = engine.completed / elapsed if elapsed > 0 else 0.0
+    print(f"Processed {engine.completed} image(s), {engine.failed} failed, "
+          f"in {elapsed:.1f}s ({rate:.2f} images/s) with {engine.workers} {args.backend} worker(s)")
+    if manifest.skipped:
+        print(f"Skipped {manifest.skipped} image(s) completed by an earlier run")
+    if engine.completed and stage_totals:
+        breakdown = ", ".join(f"{stage} {stage_totals[stage] / engine.completed * 1000:.0f}ms"
+                              for stage in STAGES if stage in stage_totals)
+        print(f"Average time per image: {breakdown}")
+    return 1 if engine.failed else 0
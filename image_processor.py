@@ -1,12 +1,355 @@
 from rembg import remove
 import PIL
-from PIL import Image
+from PIL import Image, ImageOps
 import threading
-from typing import Union, Callable
+from typing import Union, Callable, Iterator, Optional, Tuple
+from session_manager import DEFAULT_MODEL, get_session
+from result_cache import ResultCache, file_cache_key, get_default_cache
+from mask_refine import downscale_for_inference, inference_dimensions, upsample_mask
+from progress import StageReporter
+from cancellation import CancellationToken, check_cancelled
+
+# Long edge images are segmented at; the models' own input is 320-1024px, so
+# larger copies only cost time. The mask is refined back to full size.
+DEFAULT_INFERENCE_SIZE = 1024
+
+# Rows composited at a time by MaskResult.composite_strips
+COMPOSITE_STRIP_HEIGHT = 512
+
+# Small model and long edge of the quick first pass of two-pass processing
+PREVIEW_MODEL = "u2netp"
+PREVIEW_SIZE = 640
+
+def apply_mask(image: PIL.Image.Image, mask: PIL.Image.Image) -> PIL.Image.Image:
+    """
+    Cut an image out with a previously computed alpha mask.
+
+    Produces the same result as rembg's default compositing, so a cached
+    mask gives the same output as running inference again.
+    
+    Args:
+        image: Original PIL Image
+        mask: 8-bit ("L") mask matching the image after EXIF orientation
+    
+    Returns:
+        RGBA PIL Image with background removed
+    """
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    if mask.size != image.size:
+        raise ValueError(f"Mask size {mask.size} does not match image size {image.size}")
+    empty = Image.new('RGBA', image.size, 0)
+    return Image.composite(image, empty, mask)
+
+def mask_options(inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE) -> dict:
+    """Settings that change a mask, for use as result cache key options"""
+    return {'inference_size': inference_size or 0}
+
+class ProcessingEstimate:
+    """
+    Running estimate of how long segmenting an image takes.
+
+    Inference runs on a copy of bounded size, so its cost is roughly fixed
+    per image; decoding, mask refinement and compositing scale with the
+    pixel count. Both parts are measured as images are processed.
+    """
+
+    def __init__(self, inference_seconds: float = 1.5, seconds_per_megapixel: float = 0.05):
+        self.inference_seconds = inference_seconds
+        self.seconds_per_megapixel = seconds_per_megapixel
+        self._lock = threading.Lock()
+
+    def record(self, inference_seconds: float, full_res_seconds: float, megapixels: float):
+        # Moving averages, so a cold first run fades out
+        with self._lock:
+            self.inference_seconds += 0.3 * (inference_seconds - self.inference_seconds)
+            if megapixels > 0:
+                per_mp = full_res_seconds / megapixels
+                self.seconds_per_megapixel += 0.3 * (per_mp - self.seconds_per_megapixel)
+
+    def estimate(self, size: Tuple[int, int]) -> float:
+        """Expected seconds to segment an image of the given (width, height)"""
+        megapixels = size[0] * size[1] / 1e6
+        with self._lock:
+            return self.inference_seconds + megapixels * self.seconds_per_megapixel
+
+processing_estimate = ProcessingEstimate()
+
+def load_source(path: str) -> PIL.Image.Image:
+    """Load an image file the way it is fed to the model: EXIF-oriented RGB"""
+    with Image.open(path) as img:
+        img.load()
+        # In place, so a large file is decoded into a single copy
+        ImageOps.exif_transpose(img, in_place=True)
+        return img.convert('RGB') if img.mode != 'RGB' else img
+
+def decode_for_inference(fp, inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE) -> PIL.Image.Image:
+    """
+    Decode an image file straight to the EXIF-oriented RGB copy that is segmented.
+
+    JPEGs are decoded with draft(), so libjpeg scales them down by up to 8x
+    while decoding instead of producing every full-resolution pixel first.
+    The mask is refined against the full-resolution image afterwards, which
+    is decoded separately when the output is written.
+
+    Args:
+        fp: Path or file object of the image
+        inference_size: Long edge to segment at; None or 0 decodes at full size
+
+    Returns:
+        RGB image at most inference_size on its long edge
+    """
+    with Image.open(fp) as img:
+        if inference_size and img.format == 'JPEG':
+            # Orientation only swaps the axes, the long edge stays the same
+            img.draft('RGB', inference_dimensions(img.size, inference_size))
+        img.load()
+        ImageOps.exif_transpose(img, in_place=True)
+        image = img.convert('RGB') if img.mode != 'RGB' else img
+    return downscale_for_inference(image, inference_size)
+
+class MaskResult:
+    """
+    Background removal result kept as an 8-bit mask plus the original image.
+
+    The original is referenced by path where possible, so a result costs one
+    byte per pixel. Every output (PNG with alpha, JPEG on white, a custom
+    background colour, cropped to the subject) is composited on demand from
+    the mask and the original, without running inference again.
+    """
+
+    def __init__(self, mask: PIL.Image.Image, source_path: Optional[str] = None,
+                 source: Optional[PIL.Image.Image] = None):
+        """
+        Args:
+            mask: 8-bit ("L") alpha mask
+            source_path: File the original image can be reloaded from
+            source: Original image in memory, used instead of source_path when given
+        """
+        if source_path is None and source is None:
+            raise ValueError("MaskResult needs a source_path or a source image")
+        self.mask = mask
+        self.source_path = source_path
+        self._source = source
+
+    @property
+    def size(self) -> Tuple[int, int]:
+        return self.mask.size
+
+    def with_source(self, source: PIL.Image.Image) -> 'MaskResult':
+        """Return a result sharing this mask that composites from an in-memory original"""
+        return MaskResult(self.mask, self.source_path, source)
+
+    def load_source(self) -> PIL.Image.Image:
+        """Return the original image the mask applies to"""
+        if self._source is not None:
+            return self._source
+        return load_source(self.source_path)
+
+    def bbox(self) -> Optional[Tuple[int, int, int, int]]:
+        """Bounding box of the subject, or None if the mask is empty"""
+        return self.mask.getbbox()
+
+    def output_box(self, crop: bool = False) -> Tuple[int, int, int, int]:
+        """Region of the original an output covers"""
+        box = self.bbox() if crop else None
+        return box or (0, 0) + self.size
+
+    def composite_strips(self, background: Optional[Tuple[int, int, int]] = None,
+                         crop: bool = False,
+                         strip_height: int = COMPOSITE_STRIP_HEIGHT) -> Iterator[PIL.Image.Image]:
+        """
+        Build an output image a horizontal strip at a time, top to bottom.
+
+        Only one strip of output exists at a time, so writers that stream
+        their rows never hold a full-size RGBA copy.
+
+        Args:
+            background: RGB colour to put behind the subject; None keeps transparency
+            crop: Crop the output to the subject's bounding box
+            strip_height: Rows per strip
+
+        Yields:
+            RGBA strips when background is None, otherwise RGB
+        """
+        source = self.load_source()
+        left, top, right, bottom = self.output_box(crop)
+        for y in range(top, bottom, strip_height):
+            box = (left, y, right, min(y + strip_height, bottom))
+            strip = source.crop(box)
+            mask = self.mask.crop(box)
+            if background is None:
+                # Same compositing as apply_mask, one strip at a time
+                strip = Image.composite(strip, Image.new('RGBA', strip.size, 0), mask)
+            else:
+                # Blend the colour in where the mask is transparent
+                strip.paste(tuple(background), mask=ImageOps.invert(mask))
+            yield strip
+
+    def composite(self, background: Optional[Tuple[int, int, int]] = None,
+                  crop: bool = False) -> PIL.Image.Image:
+        """
+        Build an output image from the mask.
+
+        Args:
+            background: RGB colour to put behind the subject; None keeps transparency
+            crop: Crop the output to the subject's bounding box
+
+        Returns:
+            RGBA image when background is None, otherwise RGB
+        """
+        source = self.load_source()
+        mask = self.mask
+        box = self.bbox() if crop else None
+        if box:
+            source = source.crop(box)
+            mask = mask.crop(box)
+
+        if background is None:
+            return apply_mask(source, mask)
+        output = Image.new('RGB', mask.size, tuple(background))
+        output.paste(source, mask=mask)
+        return output
+
+    def to_rgba(self) -> PIL.Image.Image:
+        """The cut-out with transparency, as returned by remove_background"""
+        return self.composite()
+
+def segment(
+    image: PIL.Image.Image,
+    model_name: str = DEFAULT_MODEL,
+    session=None,
+    cache_key: Optional[str] = None,
+    cache: Optional[ResultCache] = None,
+    source_path: Optional[str] = None,
+    inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE,
+    stages: Optional[StageReporter] = None,
+    token: Optional[CancellationToken] = None,
+    record_estimate: bool = True
+) -> MaskResult:
+    """
+    Compute the foreground mask of an image.
+
+    Large images are segmented on a copy scaled to inference_size, and the
+    mask is upsampled to the original resolution with edge-aware refinement,
+    so inference time does not grow with the input's pixel count.
+    
+    Args:
+        image: PIL Image to segment
+        model_name: rembg model to use when no session is given
+        session: Optional rembg session, defaults to the shared warm session for model_name
+        cache_key: Key of the input in the mask cache; inference is skipped on a hit
+        cache: Mask cache to use with cache_key, defaults to the shared cache
+        source_path: File the image was loaded from; the result then refers to
+            the file instead of keeping the image in memory
+        inference_size: Long edge to segment at; None or 0 uses the full resolution
+        stages: Reporter timing the preprocess, inference and postprocess stages
+        token: Checked between stages; raises ProcessingCancelled once cancelled
+        record_estimate: Feed the timings to processing_estimate, which is
+            per megapixel of the original; callers passing a reduced copy turn
+            this off and record against the original's size themselves
+    
+    Returns:
+        MaskResult for the image
+    """
+    if not isinstance(image, PIL.Image.Image):
+        raise ValueError("Input must be a PIL Image object")
+    stages = stages or StageReporter()
+
+    check_cancelled(token)
+    with stages.stage('preprocess'):
+        # Masks are computed on the EXIF-oriented image, like rembg does
+        image = ImageOps.exif_transpose(image)
+        if image.mode != 'RGB':
+            image = image.convert('RGB')
+
+    mask = None
+    if cache_key:
+        cache = cache or get_default_cache()
+        mask = cache.get(cache_key)
+        if mask is not None and mask.size != image.size:
+            mask = None  # Stale entry, recompute below
+
+    if mask is None:
+        # Checked before loading the model too, which can take longer than inference
+        check_cancelled(token)
+        # Reuse a pooled session instead of letting rembg build one per call
+        if session is None:
+            session = get_session(model_name)
+        with stages.stage('preprocess'):
+            small = downscale_for_inference(image, inference_size)
+        check_cancelled(token)
+        with stages.stage('inference'):
+            mask = remove(small, session=session, only_mask=True)
+        check_cancelled(token)
+        with stages.stage('postprocess'):
+            mask = upsample_mask(mask, image)
+            if cache_key:
+                try:
+                    cache.put(cache_key, mask)
+                except Exception as e:
+                    print(f"Could not cache mask: {str(e)}")  # Caching is best effort
+
+        timings = stages.timings
+        if record_estimate:
+            processing_estimate.record(timings['inference'],
+                                       timings['preprocess'] + timings['postprocess'],
+                                       image.width * image.height / 1e6)
+
+    check_cancelled(token)
+    if source_path:
+        return MaskResult(mask, source_path)
+    return MaskResult(mask, source=image)
+
+def segment_preview(
+    image: PIL.Image.Image,
+    model_name: str = PREVIEW_MODEL,
+    size: int = PREVIEW_SIZE
+) -> MaskResult:
+    """
+    Quickly segment a reduced copy of an image.
+
+    Meant to be shown while the full-quality pass runs: the result refers to
+    the reduced copy, whose long edge is at most size pixels. Its timings are
+    kept out of processing_estimate, which describes full passes.
+
+    Args:
+        image: PIL Image to segment
+        model_name: rembg model to use, normally a small fast one
+        size: Long edge of the reduced copy
+
+    Returns:
+        MaskResult for the reduced, EXIF-oriented copy
+    """
+    image = ImageOps.exif_transpose(image)
+    small = downscale_for_inference(image, size)
+    if small.mode != 'RGB':
+        small = small.convert('RGB')
+    mask = remove(small, session=get_session(model_name), only_mask=True)
+    return MaskResult(mask, source=small)
+
+def upscale_preview(preview: MaskResult, image: PIL.Image.Image) -> MaskResult:
+    """
+    Bring a preview's mask to the full resolution of the image it was made from.
+
+    Used when the full-quality pass is skipped, so the preview can be saved
+    at the original size.
+    """
+    image = ImageOps.exif_transpose(image)
+    if image.mode != 'RGB':
+        image = image.convert('RGB')
+    return MaskResult(upsample_mask(preview.mask, image), source=image)
 
 def remove_background(
     image: Union[PIL.Image.Image, bytes],
-    progress_callback: Callable[[int], None] = None
+    progress_callback: Callable[[int], None] = None,
+    model_name: str = DEFAULT_MODEL,
+    session=None,
+    cache_key: Optional[str] = None,
+    cache: Optional[ResultCache] = None,
+    inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE,
+    stages: Optional[StageReporter] = None
 ) -> PIL.Image.Image:
     """
     Remove the background from an image using rembg library.
@@ -14,46 +357,70 @@ def remove_background(
     Args:
         image: PIL Image object or bytes containing the image data
         progress_callback: Optional callback function to report progress (0-100)
+        model_name: rembg model to use when no session is given
+        session: Optional rembg session, defaults to the shared warm session for model_name
+        cache_key: Key of the input in the mask cache; inference is skipped on a hit
+        cache: Mask cache to use with cache_key, defaults to the shared cache
+        inference_size: Long edge to segment at; None or 0 uses the full resolution
+        stages: Reporter timing each processing stage
     
     Returns:
         PIL Image object with background removed
     """
-    if isinstance(image, PIL.Image.Image):
-        # Convert PIL Image to bytes
-        if image.mode != 'RGB':
-            image = image.convert('RGB')
-            
-        # Process the image
-        output = remove(image)
+    stages = stages or StageReporter()
+    result = segment(image, model_name, session, cache_key, cache,
+                     inference_size=inference_size, stages=stages)
+    with stages.stage('composite'):
+        output = result.to_rgba()
+    
+    if progress_callback:
+        progress_callback(100)
         
-        if progress_callback:
-            progress_callback(100)
-            
-        return output
-    else:
-        raise ValueError("Input must be a PIL Image object")
+    return output
 
 def process_image_async(
     image: PIL.Image.Image,
-    on_complete: Callable[[PIL.Image.Image], None],
+    on_complete: Callable[[MaskResult], None],
     on_error: Callable[[Exception], None],
-    progress_callback: Callable[[int], None] = None
+    progress_callback: Callable[[int], None] = None,
+    model_name: str = DEFAULT_MODEL,
+    source_path: Optional[str] = None,
+    inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE,
+    stages: Optional[StageReporter] = None,
+    token: Optional[CancellationToken] = None
 ) -> threading.Thread:
     """
     Process image in a background thread to keep UI responsive.
     
     Args:
         image: PIL Image to process
-        on_complete: Callback function to handle the processed image
+        on_complete: Callback function to handle the MaskResult
         on_error: Callback function to handle any errors
         progress_callback: Optional callback function to report progress
+        model_name: rembg model to use
+        source_path: File the image was loaded from; enables the mask cache
+        inference_size: Long edge to segment at; None or 0 uses the full resolution
+        stages: Reporter timing each processing stage; its callback runs on the
+            processing thread
+        token: Stops the work at its next stage boundary once cancelled;
+            on_error then receives ProcessingCancelled
     
     Returns:
         Thread object that is processing the image
     """
+    reporter = stages or StageReporter()
+
     def process_thread():
         try:
-            result = remove_background(image, progress_callback)
+            key = None
+            check_cancelled(token)
+            if source_path:
+                with reporter.stage('preprocess'):
+                    key = file_cache_key(source_path, model_name, mask_options(inference_size))
+            result = segment(image, model_name, cache_key=key, source_path=source_path,
+                             inference_size=inference_size, stages=reporter, token=token)
+            if progress_callback:
+                progress_callback(100)
             on_complete(result)
         except Exception as e:
             on_error(e)
@@ -61,4 +428,35 @@ def process_image_async(
     thread = threading.Thread(target=process_thread)
     thread.daemon = True
     thread.start()
+    return thread
+
+def process_preview_async(
+    image: PIL.Image.Image,
+    on_complete: Callable[[MaskResult], None],
+    on_error: Callable[[Exception], None],
+    model_name: str = PREVIEW_MODEL,
+    size: int = PREVIEW_SIZE
+) -> threading.Thread:
+    """
+    Run segment_preview() in a background thread.
+
+    Args:
+        image: PIL Image to preview
+        on_complete: Callback function to handle the preview MaskResult
+        on_error: Callback function to handle any errors
+        model_name: rembg model to use
+        size: Long edge of the reduced copy
+
+    Returns:
+        Thread object that is processing the image
+    """
+    def preview_thread():
+        try:
+            on_complete(segment_preview(image, model_name, size))
+        except Exception as e:
+            on_error(e)
+
+    thread = threading.Thread(target=preview_thread)
+    thread.daemon = True
+    thread.start()
     return thread
\ No newline at end of file
@@ -0,0 +1,118 @@
+import itertools
+import threading
+from collections import OrderedDict
+from typing import Tuple
+
+from PIL import Image
+
+DEFAULT_PYRAMID_MEMORY = 128 * 1024 * 1024  # 128MB of downsampled levels
+
+# Modes reduce() can't filter, and what they are converted to first; palette
+# images are converted to RGB or RGBA depending on their transparency
+_REDUCIBLE_MODES = {'1': 'L', 'PA': 'RGBA', 'I;16': 'I', 'I;16B': 'I', 'I;16L': 'I', 'I;16N': 'I'}
+
+
+def _image_bytes(image: Image.Image) -> int:
+    return image.width * image.height * len(image.getbands())
+
+
+class PyramidCache:
+    """
+    Least recently used store for pyramid levels, shared by all pyramids.
+
+    Keeping one budget for every preview means several views of large images
+    cannot together hold more than max_bytes of downsampled copies.
+    """
+
+    def __init__(self, max_bytes: int = DEFAULT_PYRAMID_MEMORY):
+        self.max_bytes = max_bytes
+        self._levels = OrderedDict()  # (pyramid id, level) -> image
+        self._size = 0
+        self._lock = threading.Lock()
+
+    def get(self, key):
+        with self._lock:
+            image = self._levels.get(key)
+            if image is not None:
+                self._levels.move_to_end(key)
+            return image
+
+    def put(self, key, image: Image.Image):
+        with self._lock:
+            previous = self._levels.pop(key, None)
+            if previous is not None:
+                self._size -= _image_bytes(previous)
+            self._levels[key] = image
+            self._size += _image_bytes(image)
+            while self._size > self.max_bytes and len(self._levels) > 1:
+                _, evicted = self._levels.popitem(last=False)
+                self._size -= _image_bytes(evicted)
+
+    def discard(self, pyramid_id: int):
+        """Drop every level of one pyramid"""
+        with self._lock:
+            for key in [key for key in self._levels if key[0] == pyramid_id]:
+                self._size -= _image_bytes(self._levels.pop(key))
+
+
+def _halve(image: Image.Image) -> Image.Image:
+    """Box-filter an image down by 2, in a mode that can be filtered"""
+    if image.mode == 'P':
+        image = image.convert('RGBA' if 'transparency' in image.info else 'RGB')
+    elif image.mode in _REDUCIBLE_MODES:
+        image = image.convert(_REDUCIBLE_MODES[image.mode])
+    try:
+        return image.reduce(2)
+    except ValueError:
+        # Sized like reduce() would
+        return image.resize(((image.width + 1) // 2, (image.height + 1) // 2), Image.BOX)
+
+
+_default_cache = PyramidCache()
+_ids = itertools.count()
+
+
+class ImagePyramid:
+    """
+    Power-of-two downsamples of an image, built on first use.
+
+    Level n is the image reduced by 2**n, each level box-filtered from the one
+    above it; palette, bilevel and 16-bit images are converted to a mode that
+    can be filtered from level 1 on. Levels live in a shared PyramidCache and are rebuilt if they
+    were evicted; level 0 is the original image and is never cached.
+    """
+
+    def __init__(self, image: Image.Image, cache: PyramidCache = None):
+        self.image = image
+        self.cache = cache or _default_cache
+        self._id = next(_ids)
+
+    def level(self, n: int) -> Image.Image:
+        """Return the image reduced by 2**n"""
+        if n <= 0:
+            return self.image
+        key = (self._id, n)
+        image = self.cache.get(key)
+        if image is None:
+            image = _halve(self.level(n - 1))
+            self.cache.put(key, image)
+        return image
+
+    def for_zoom(self, zoom: float) -> Tuple[Image.Image, float, float]:
+        """
+        Pick the smallest level that still has at least as many pixels as the
+        zoomed image needs.
+
+        Returns:
+            (level image, x scale, y scale) where the scales map original
+            image coordinates to level coordinates
+        """
+        n = 0
+        while zoom * (2 ** (n + 1)) <= 1.0 and min(self.image.size) >> (n + 1) > 0:
+            n += 1
+        level = self.level(n)
+        return level, level.width / self.image.width, level.height / self.image.height
+
+    def release(self):
+        """Free the cached levels of this pyramid"""
+        self.cache.discard(self._id)
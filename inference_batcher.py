@@ -0,0 +1,214 @@
+import queue
+import threading
+import time
+from concurrent.futures import Future
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+DEFAULT_MAX_BATCH_SIZE = 8
+
+# How long the first image of a batch waits for company, in seconds
+DEFAULT_MAX_WAIT = 0.01
+
+# Models already reported as not batching, so each is only reported once
+_reported_unbatched = set()
+_reported_lock = threading.Lock()
+
+
+@dataclass(frozen=True)
+class ModelInput:
+    """Normalisation and input resolution of a model, as its rembg session.predict() applies them"""
+    mean: Tuple[float, float, float]
+    std: Tuple[float, float, float]
+    size: Tuple[int, int]
+
+
+# Models whose predict() is a single run on one normalised tensor followed by
+# min-max scaling of the first output, so several inputs can share one run
+MODEL_INPUTS: Dict[str, ModelInput] = {
+    'u2net': ModelInput((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'u2netp': ModelInput((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'u2net_human_seg': ModelInput((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'silueta': ModelInput((0.485, 0.456, 0.406), (0.229, 0.224, 0.225), (320, 320)),
+    'isnet-general-use': ModelInput((0.5, 0.5, 0.5), (1.0, 1.0, 1.0), (1024, 1024)),
+    'isnet-anime': ModelInput((0.485, 0.456, 0.406), (1.0, 1.0, 1.0), (1024, 1024)),
+}
+
+
+def preprocess(image: Image.Image, spec: ModelInput) -> np.ndarray:
+    """
+    Build the (3, height, width) float32 model input for one image.
+
+    Matches rembg's BaseSession.normalize(), minus the batch dimension.
+    """
+    data = np.asarray(image.convert('RGB').resize(spec.size, Image.Resampling.LANCZOS), dtype=np.float32)
+    data /= max(float(data.max()), 1e-6)
+    data -= np.asarray(spec.mean, dtype=np.float32)
+    data /= np.asarray(spec.std, dtype=np.float32)
+    return data.transpose((2, 0, 1))
+
+
+def prediction_to_mask(prediction: np.ndarray, size: Tuple[int, int]) -> Image.Image:
+    """Scale one raw model output to a 0-255 mask of the given size, as rembg does"""
+    low, high = float(prediction.min()), float(prediction.max())
+    prediction = (prediction - low) / max(high - low, 1e-6)
+    mask = Image.fromarray((prediction.clip(0, 1) * 255).astype(np.uint8), mode='L')
+    return mask.resize(size, Image.Resampling.LANCZOS)
+
+
+def session_batch_limit(session) -> Optional[int]:
+    """
+    Largest batch the session's graph accepts.
+
+    Returns:
+        None if any batch size works, otherwise the fixed batch dimension
+    """
+    inputs = session.inner_session.get_inputs()
+    batch_dim = inputs[0].shape[0] if inputs and inputs[0].shape else None
+    return batch_dim if isinstance(batch_dim, int) and batch_dim > 0 else None
+
+
+@dataclass
+class _Request:
+    tensor: np.ndarray
+    future: Future
+
+
+class InferenceBatcher:
+    """
+    Groups concurrent predictions on one session into batched ONNX runs.
+
+    Every input of a model is resized to the same resolution, so inputs from
+    any number of callers can be stacked into one tensor. A batch is run as
+    soon as it holds max_batch_size inputs or its first input has waited
+    max_wait seconds, so a lone caller is delayed by at most max_wait.
+    Normalising inputs and scaling masks back happen on the calling threads;
+    the runner threads only stack tensors and run the graph.
+
+    The batcher has the predict() API of a rembg session, so it can be passed
+    to rembg.remove() and segment() in place of the session. Models not in
+    MODEL_INPUTS, graphs with a fixed batch size of 1, and stand-in sessions
+    without an ONNX graph are run per image on the calling thread.
+    """
+
+    def __init__(self, session, max_batch_size: int = DEFAULT_MAX_BATCH_SIZE,
+                 max_wait: float = DEFAULT_MAX_WAIT, runners: int = 1):
+        """
+        Args:
+            session: rembg session to run
+            max_batch_size: Most inputs stacked into one run
+            max_wait: Seconds a batch waits to fill up before it is run anyway
+            runners: Number of batches that may run on the session at the same time
+        """
+        self.session = session
+        self.model_name = getattr(session, 'model_name', None)
+        self.max_wait = max_wait
+        self.spec = MODEL_INPUTS.get(self.model_name)
+        self.max_batch_size = max(1, max_batch_size)
+        if self.spec is not None and hasattr(session, 'inner_session'):
+            limit = session_batch_limit(session)
+            if limit is not None:
+                self.max_batch_size = min(self.max_batch_size, limit)
+        else:
+            self.spec = None
+        self.batching = self.spec is not None and self.max_batch_size > 1
+        if max_batch_size > 1:
+            self._report_batching(session, max_batch_size)
+
+        self._requests = queue.Queue()
+        self._threads: List[threading.Thread] = []
+        self._closed = False
+        if self.batching:
+            for i in range(max(1, runners)):
+                thread = threading.Thread(target=self._run_loop, name=f"inference-batcher-{i}")
+                thread.daemon = True
+                self._threads.append(thread)
+                thread.start()
+
+    def _report_batching(self, session, requested: int):
+        """Say once per model when batches come out smaller than asked for, so no speedup is assumed"""
+        if self.model_name not in MODEL_INPUTS:
+            reason = "its predictions can't be combined into one run"
+        elif not hasattr(session, 'inner_session'):
+            reason = "its session has no ONNX graph to batch"
+        elif self.max_batch_size < requested:
+            reason = f"its ONNX graph has a fixed batch size of {self.max_batch_size}"
+        else:
+            return
+        with _reported_lock:
+            if self.model_name in _reported_unbatched:
+                return
+            _reported_unbatched.add(self.model_name)
+        if self.batching:
+            print(f"Batches of model '{self.model_name}' are limited to {self.max_batch_size} images: {reason}")
+        else:
+            print(f"Model '{self.model_name}' can't be batched and runs one image at a time: {reason}")
+
+    def predict(self, img: Image.Image, *args, **kwargs) -> List[Image.Image]:
+        """Return [mask] for the image, like a rembg session; blocks until its batch has run"""
+        if not self.batching:
+            return self.session.predict(img, *args, **kwargs)
+        prediction = self.submit(img).result()
+        return [prediction_to_mask(prediction, img.size)]
+
+    def submit(self, image: Image.Image) -> Future:
+        """Queue an image and return a Future for its raw (height, width) model output"""
+        if self._closed:
+            raise RuntimeError("Batcher is closed")
+        if not self.batching:
+            raise RuntimeError(f"Model '{self.model_name}' can't be batched")
+        future = Future()
+        self._requests.put(_Request(preprocess(image, self.spec), future))
+        return future
+
+    def close(self):
+        """Run what is queued, then stop the runner threads"""
+        if self._closed:
+            return
+        self._closed = True
+        for _ in self._threads:
+            self._requests.put(None)
+        for thread in self._threads:
+            thread.join()
+
+    def _next_batch(self) -> Tuple[List[_Request], bool]:
+        """Collect the next batch; the flag is True once close() was seen"""
+        first = self._requests.get()
+        if first is None:
+            return [], True
+        batch = [first]
+        deadline = time.monotonic() + self.max_wait
+        while len(batch) < self.max_batch_size:
+            remaining = deadline - time.monotonic()
+            try:
+                request = self._requests.get(timeout=remaining) if remaining > 0 else self._requests.get_nowait()
+            except queue.Empty:
+                break
+            if request is None:
+                return batch, True
+            batch.append(request)
+        return batch, False
+
+    def _run_loop(self):
+        while True:
+            batch, stopping = self._next_batch()
+            if batch:
+                self._run(batch)
+            if stopping:
+                return
+
+    def _run(self, batch: List[_Request]):
+        try:
+            inner = self.session.inner_session
+            tensor = np.stack([request.tensor for request in batch])
+            outputs = inner.run(None, {inner.get_inputs()[0].name: tensor})
+            predictions = outputs[0][:, 0, :, :]
+        except Exception as e:
+            for request in batch:
+                request.future.set_exception(e)
+            return
+        for request, prediction in zip(batch, predictions):
+            request.future.set_result(prediction)
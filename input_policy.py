@@ -0,0 +1,69 @@
+import os
+from dataclasses import dataclass
+from typing import Optional, Tuple
+
+from PIL import Image
+
+MB = 1024 * 1024
+
+# Defaults the GUI has always applied to opened images
+DEFAULT_MAX_FILE_SIZE = 50 * MB
+DEFAULT_LARGE_DIMENSION = 8000
+
+# Extensions picked up when a directory is scanned or watched for images
+IMAGE_EXTENSIONS = ('.png', '.jpg', '.jpeg', '.bmp', '.gif', '.webp', '.tif', '.tiff')
+
+
+def read_image_size(path: str) -> Tuple[int, int]:
+    """Width and height of an image file, read from its header without decoding pixels"""
+    with Image.open(path) as img:
+        return img.size
+
+
+@dataclass
+class InputPolicy:
+    """
+    Limits applied to images before they are accepted for processing.
+
+    Output is composited and written in strips, so the size of an input no
+    longer decides whether it can be processed; these limits are a choice
+    about what to accept, not a memory safeguard.
+
+    Attributes:
+        max_file_size: Largest accepted file in bytes; None accepts any size
+        large_dimension: Width or height past which the user is asked to confirm
+    """
+    max_file_size: Optional[int] = DEFAULT_MAX_FILE_SIZE
+    large_dimension: int = DEFAULT_LARGE_DIMENSION
+
+    def file_size_error(self, path: str) -> Optional[str]:
+        """Return a message explaining why path is too large, or None if it is accepted"""
+        if self.max_file_size is None:
+            return None
+        file_size = os.path.getsize(path)
+        if file_size <= self.max_file_size:
+            return None
+        return (f"Maximum file size is {self.max_file_size / MB:.0f}MB.\n"
+                f"Current file size: {file_size / MB:.1f}MB")
+
+    def is_large(self, size: Tuple[int, int]) -> bool:
+        """Whether an image of (width, height) needs confirmation"""
+        return size[0] > self.large_dimension or size[1] > self.large_dimension
+
+    def check(self, path: str) -> Tuple[Optional[Tuple[int, int]], Optional[str]]:
+        """
+        Validate a file from its size on disk and its image header only.
+
+        Returns:
+            ((width, height), None) if the file is accepted, otherwise
+            (None, reason it was rejected)
+        """
+        if not os.path.exists(path):
+            return None, "The file could not be found."
+        try:
+            error = self.file_size_error(path)
+            if error:
+                return None, error
+            return read_image_size(path), None
+        except Exception as e:
+            return None, str(e)
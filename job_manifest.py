@@ -0,0 +1,191 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Dict, Iterable, Iterator, List, Optional
+
+# Kept in the output directory, hidden so it is not mistaken for an output
+MANIFEST_FILENAME = ".rembg-ui-job.jsonl"
+
+QUEUED = 'queued'
+COMPLETED = 'completed'
+FAILED = 'failed'
+
+
+def job_settings(model_name: str, profile: str, inference_size: Optional[int]) -> dict:
+    """The options that shape a job's outputs, as recorded with each of its entries"""
+    return {'model': model_name, 'profile': profile, 'inference_size': inference_size or 0}
+
+
+def file_digest(path: str) -> str:
+    """SHA-256 of a file's contents, read in chunks"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+
+class JobManifest:
+    """
+    Append-only record of a batch job, kept as JSON lines in its output directory.
+
+    Every change to an input's state appends one line with its path, status,
+    content hash, output path and stage timings; the last line for a path
+    wins. Lines are flushed as they are written, so after a crash the
+    manifest still says which inputs were finished, and a torn last line is
+    ignored when the manifest is read back.
+
+    Entries also record the job's settings (see job_settings()); an input
+    completed with other settings, such as another model or output format,
+    is not counted as completed.
+    """
+
+    def __init__(self, directory: str, resume: bool = True, settings: Optional[dict] = None):
+        """
+        Args:
+            directory: Output directory of the job
+            resume: Continue the manifest already in directory; False starts
+                a new job, discarding it
+            settings: Settings the outputs are written with, from job_settings();
+                may be replaced between runs of the job. None accepts entries
+                completed with any settings
+        """
+        self.path = os.path.join(directory, MANIFEST_FILENAME)
+        self.settings = settings
+        self._entries: Dict[str, dict] = {}
+        self._lock = threading.Lock()
+        self.skipped = 0
+        if resume:
+            self._load()
+        elif os.path.exists(self.path):
+            os.remove(self.path)
+        os.makedirs(directory, exist_ok=True)
+        self._file = open(self.path, 'a', encoding='utf-8')
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _load(self):
+        try:
+            with open(self.path, 'r', encoding='utf-8') as f:
+                lines, torn = 0, False
+                for line in f:
+                    lines += 1
+                    try:
+                        if not line.endswith('\n'):
+                            raise ValueError("Unterminated line")
+                        entry = json.loads(line)
+                        self._entries[entry['path']] = entry
+                    except (ValueError, KeyError, TypeError):
+                        torn = True  # Torn write from an interrupted run
+        except FileNotFoundError:
+            return
+        # Appending after a torn line would fuse the next record onto it
+        if torn or lines > 2 * len(self._entries):
+            self._compact()
+
+    def _compact(self):
+        """Rewrite the manifest with only the latest line per input"""
+        temp_path = f"{self.path}.tmp"
+        with open(temp_path, 'w', encoding='utf-8') as f:
+            for entry in self._entries.values():
+                f.write(json.dumps(entry) + '\n')
+        os.replace(temp_path, self.path)
+
+    def entry(self, path: str) -> Optional[dict]:
+        """The latest record of an input, or None if the job has not seen it"""
+        with self._lock:
+            return self._entries.get(os.path.abspath(path))
+
+    def is_completed(self, path: str) -> bool:
+        """
+        Whether an input was processed in this job and needs no rerun.
+
+        The input must still be the file that was processed, by size and
+        modification time or failing that by content hash, it must have been
+        processed with the current settings, and its output must still exist.
+        """
+        entry = self.entry(path)
+        if entry is None or entry.get('status') != COMPLETED:
+            return False
+        if self.settings is not None and entry.get('settings') != self.settings:
+            return False
+        # The manifest lives in the output directory, so a completed input without an output was never saved
+        output = entry.get('output')
+        if not output or not os.path.exists(output):
+            return False
+        try:
+            stat = os.stat(path)
+        except OSError:
+            return False
+        if stat.st_size == entry.get('size') and stat.st_mtime_ns == entry.get('mtime_ns'):
+            return True
+        try:
+            return entry.get('hash') is not None and file_digest(path) == entry['hash']
+        except OSError:
+            return False
+
+    def pending(self, paths: Iterable[str]) -> Iterator[str]:
+        """Yield the paths that still need processing, counting the others in skipped"""
+        for path in paths:
+            if self.is_completed(path):
+                self.skipped += 1
+            else:
+                yield path
+
+    def unfinished(self) -> List[str]:
+        """Inputs of the job that were queued or failed and not completed since, in the order first seen"""
+        with self._lock:
+            entries = list(self._entries.values())
+        return [entry['path'] for entry in entries
+                if entry.get('status') != COMPLETED and os.path.exists(entry['path'])]
+
+    def record_queued(self, paths: Iterable[str]):
+        """Note inputs as part of the job before any of them is processed"""
+        for path in paths:
+            if not self.is_completed(path):
+                self.record(path, QUEUED)
+
+    def record(self, path: str, status: str, digest: Optional[str] = None, output: Optional[str] = None,
+               timings: Optional[Dict[str, float]] = None, error: Optional[str] = None):
+        """
+        Append the new state of an input.
+
+        Args:
+            path: Input file
+            status: QUEUED, COMPLETED or FAILED
+            digest: SHA-256 of the input's contents, if known
+            output: Path the result was written to
+            timings: Seconds the input spent in each stage
+            error: Why processing failed
+        """
+        path = os.path.abspath(path)
+        entry = {'path': path, 'status': status, 'time': time.time()}
+        try:
+            stat = os.stat(path)
+            entry['size'] = stat.st_size
+            entry['mtime_ns'] = stat.st_mtime_ns
+        except OSError:
+            pass
+        if digest is not None:
+            entry['hash'] = digest
+        if output is not None:
+            entry['output'] = os.path.abspath(output)
+        if timings:
+            entry['timings'] = timings
+        if error is not None:
+            entry['error'] = error
+        if self.settings is not None:
+            entry['settings'] = self.settings
+        with self._lock:
+            if self._file.closed:
+                return
+            self._entries[path] = entry
+            self._file.write(json.dumps(entry) + '\n')
+            self._file.flush()
+
+    def close(self):
+        with self._lock:
+            self._file.close()
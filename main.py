@@ -1,13 +1,88 @@
 #!/usr/bin/env python3
-import tkinter as tk
-from tkinter import messagebox
-from tkinterdnd2 import TkinterDnD
-from gui import BackgroundRemoverApp
+import argparse
+import os
 import sys
 import subprocess
 import importlib.util
 
+def parse_args(argv=None):
+    from backends import BACKENDS
+    from image_processor import DEFAULT_INFERENCE_SIZE
+    from outputs import DEFAULT_PROFILE, available_profiles
+    from models import model_names
+    from session_manager import DEFAULT_MODEL, DEFAULT_SESSION_MEMORY
+
+    parser = argparse.ArgumentParser(
+        description="Remove backgrounds from images. Starts the GUI unless --headless is given."
+    )
+    parser.add_argument('--headless', action='store_true',
+                        help="process files from the command line without opening a window")
+    parser.add_argument('inputs', nargs='*', metavar='INPUT',
+                        help="image files, directories or glob patterns (headless mode)")
+    parser.add_argument('-o', '--output', help="directory to write processed images to (headless mode)")
+    parser.add_argument('-r', '--recursive', action='store_true',
+                        help="descend into subdirectories and allow ** in glob patterns")
+    parser.add_argument('--model', default=DEFAULT_MODEL,
+                        help=f"rembg model to use, e.g. {', '.join(model_names())} (default: {DEFAULT_MODEL})")
+    parser.add_argument('--list-models', action='store_true', help="list the offered models and exit")
+    parser.add_argument('--model-memory', type=float, default=DEFAULT_SESSION_MEMORY / (1024 * 1024), metavar='MB',
+                        help="memory loaded models may use before the least recently used is unloaded "
+                             f"(default: {DEFAULT_SESSION_MEMORY // (1024 * 1024)})")
+    parser.add_argument('--format', default=DEFAULT_PROFILE, type=str.lower, choices=available_profiles(),
+                        help="output format and encoder profile, jpeg is composited onto white; "
+                             f"see --list-formats (default: {DEFAULT_PROFILE})")
+    parser.add_argument('--list-formats', action='store_true', help="list the output formats and exit")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="number of concurrent inference workers (default: based on CPU cores)")
+    parser.add_argument('--backend', default=BACKENDS[0], choices=BACKENDS,
+                        help=f"inference backend (default: {BACKENDS[0]})")
+    parser.add_argument('--batch-size', type=int, default=1, metavar='N',
+                        help="images each worker stacks into one model run; helps with many small "
+                             "images (default: 1)")
+    parser.add_argument('--inference-size', type=int, default=DEFAULT_INFERENCE_SIZE, metavar='PIXELS',
+                        help="long edge images are segmented at before the mask is refined to full "
+                             f"resolution; 0 segments at full resolution (default: {DEFAULT_INFERENCE_SIZE})")
+    parser.add_argument('--max-file-size', type=float, default=50, metavar='MB',
+                        help="largest input file the GUI accepts, 0 for no limit (default: 50)")
+    parser.add_argument('--watch', action='store_true',
+                        help="keep watching the INPUT folders and process images as they are written "
+                             "into them, until Ctrl+C (headless mode)")
+    parser.add_argument('--resume', action='store_true',
+                        help="continue the job recorded in the output directory, skipping images it completed")
+    parser.add_argument('--no-cache', dest='cache', action='store_false',
+                        help="always run inference instead of reusing cached masks")
+    parser.add_argument('--cache-dir', default=None,
+                        help="directory for cached masks (default: per-user cache directory)")
+
+    args = parser.parse_args(argv)
+    if args.list_models or args.list_formats:
+        return args
+    if args.headless:
+        if not args.inputs:
+            parser.error("--headless needs at least one INPUT")
+        if not args.output:
+            parser.error("--headless needs --output")
+        if args.watch:
+            for source in args.inputs:
+                if not os.path.isdir(source):
+                    parser.error(f"--watch needs folders as INPUT, not '{source}'")
+                if os.path.abspath(source) == os.path.abspath(args.output):
+                    parser.error("--watch can't write into the folder it watches, choose another --output")
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.inference_size < 0:
+        parser.error("--inference-size must not be negative")
+    if args.max_file_size < 0:
+        parser.error("--max-file-size must not be negative")
+    if args.model_memory <= 0:
+        parser.error("--model-memory must be positive")
+    return args
+
 def check_dependencies():
+    from tkinter import messagebox
+
     required_packages = {
         'rembg': 'rembg[cli]',
         'onnxruntime': 'onnxruntime'
@@ -36,7 +111,12 @@ def check_dependencies():
         return False
     return True
 
-def main():
+def run_gui(args):
+    import tkinter as tk
+    from tkinterdnd2 import TkinterDnD
+    from gui import BackgroundRemoverApp
+    from input_policy import MB, InputPolicy
+
     # Create a temporary root window for dependency check dialog
     temp_root = tk.Tk()
     temp_root.withdraw()  # Hide the temporary window
@@ -72,10 +152,41 @@ def main():
     if not install_dependencies(root):
         return
     
-    app = BackgroundRemoverApp(root)
+    policy = InputPolicy(max_file_size=int(args.max_file_size * MB) if args.max_file_size else None)
+    app = BackgroundRemoverApp(root, input_policy=policy, model_name=args.model)
     app.pack(fill=tk.BOTH, expand=True)
     
     root.mainloop()
 
+def list_models():
+    from models import MODELS, model_memory
+
+    for model in MODELS.values():
+        memory = f"~{model_memory(model.name) // (1024 * 1024)}MB"
+        print(f"{model.name:<24}{model.label:<16}{memory:<9}{model.description}")
+
+def list_formats():
+    from outputs import ENCODER_PROFILES, profile_available
+
+    for profile in ENCODER_PROFILES.values():
+        note = "" if profile_available(profile) else " (not supported by the installed Pillow)"
+        print(f"{profile.name:<16}{profile.label:<18}{profile.description}{note}")
+
+def main(argv=None):
+    args = parse_args(argv)
+    if args.list_models:
+        list_models()
+        return 0
+    if args.list_formats:
+        list_formats()
+        return 0
+    from session_manager import set_session_memory_budget
+    set_session_memory_budget(int(args.model_memory * 1024 * 1024))
+    if args.headless:
+        from headless import run_headless
+        return run_headless(args)
+    run_gui(args)
+    return 0
+
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    sys.exit(main())
\ No newline at end of file
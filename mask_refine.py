@@ -0,0 +1,123 @@
+from typing import Optional, Tuple
+
+import numpy as np
+from PIL import Image
+
+# Rows refined per step; bounds the float buffers to a few MB at any width
+STRIP_HEIGHT = 256
+
+
+def inference_dimensions(size: Tuple[int, int], long_edge: Optional[int]) -> Tuple[int, int]:
+    """
+    Size an image is segmented at for a long-edge target.
+
+    Args:
+        size: Original (width, height)
+        long_edge: Target length of the longer side; None or 0 keeps the original size
+
+    Returns:
+        (width, height) no larger than the original
+    """
+    width, height = size
+    if not long_edge or max(width, height) <= long_edge:
+        return size
+    scale = long_edge / max(width, height)
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def downscale_for_inference(image: Image.Image, long_edge: Optional[int]) -> Image.Image:
+    """Return a copy of image reduced to the long-edge target, or image itself if already small"""
+    target = inference_dimensions(image.size, long_edge)
+    if target == image.size:
+        return image
+    # reducing_gap first shrinks by an integer factor, which keeps huge inputs fast
+    return image.resize(target, Image.BILINEAR, reducing_gap=3.0)
+
+
+def _box_mean(x: np.ndarray, r: int) -> np.ndarray:
+    """Mean over a (2r+1) square window, shrinking the window at the array edges"""
+    out = x
+    for axis in (0, 1):
+        n = out.shape[axis]
+        summed = np.cumsum(out, axis=axis, dtype=np.float32)
+        summed = np.insert(summed, 0, 0, axis=axis)
+        idx = np.arange(n)
+        lo = np.clip(idx - r, 0, n)
+        hi = np.clip(idx + r + 1, 0, n)
+        counts = (hi - lo).astype(np.float32)
+        if axis == 0:
+            out = (summed[hi] - summed[lo]) / counts[:, None]
+        else:
+            out = (summed[:, hi] - summed[:, lo]) / counts[None, :]
+    return out
+
+
+def _guided_coefficients(guide: np.ndarray, mask: np.ndarray, r: int, eps: float):
+    """Smoothed linear coefficients (a, b) of a guided filter, so that mask ~ a * guide + b"""
+    mean_i = _box_mean(guide, r)
+    mean_p = _box_mean(mask, r)
+    var_i = _box_mean(guide * guide, r) - mean_i * mean_i
+    cov_ip = _box_mean(guide * mask, r) - mean_i * mean_p
+    a = cov_ip / (var_i + eps)
+    b = mean_p - a * mean_i
+    return _box_mean(a, r), _box_mean(b, r)
+
+
+def upsample_mask(
+    mask: Image.Image,
+    guide: Image.Image,
+    radius: int = 2,
+    eps: float = 1e-3
+) -> Image.Image:
+    """
+    Scale a low-resolution mask up to the size of guide, snapping edges to it.
+
+    Uses a fast guided filter: the filter's linear coefficients are fitted
+    at the mask's resolution against a downscaled guide, then upsampled and
+    applied to the full-resolution image, so mask edges follow detail the
+    downscaled copy lost while the cost stays close to a plain resize. The
+    full-resolution pass runs in horizontal strips to bound memory, and
+    strips where the mask is uniform are filled without filtering.
+
+    Args:
+        mask: 8-bit ("L") mask computed on a downscaled copy
+        guide: Full-resolution original image
+        radius: Filter radius in mask pixels
+        eps: Regularisation; smaller values follow image edges more closely
+
+    Returns:
+        8-bit ("L") mask the size of guide
+    """
+    if mask.size == guide.size:
+        return mask
+
+    gray = guide.convert('L')
+    small_guide = gray.resize(mask.size, Image.BILINEAR, reducing_gap=3.0)
+    a, b = _guided_coefficients(np.asarray(small_guide, dtype=np.float32) / 255.0,
+                                np.asarray(mask, dtype=np.float32) / 255.0, radius, eps)
+    a_image = Image.fromarray(a.astype(np.float32))
+    b_image = Image.fromarray((b * 255.0).astype(np.float32))
+
+    output = Image.new('L', guide.size)
+    scale_y = mask.height / guide.height
+    # Mask rows within reach of the coefficients of a strip
+    reach = 2 * radius + 1
+
+    for top in range(0, guide.height, STRIP_HEIGHT):
+        bottom = min(top + STRIP_HEIGHT, guide.height)
+        small_top, small_bottom = top * scale_y, bottom * scale_y
+        lowest, highest = mask.crop((0, max(0, int(small_top) - reach), mask.width,
+                                     min(mask.height, int(small_bottom) + reach + 1))).getextrema()
+        if lowest == highest:
+            output.paste(lowest, (0, top, guide.width, bottom))
+            continue
+
+        strip_size = (guide.width, bottom - top)
+        box = (0, small_top, mask.width, small_bottom)
+        a_strip = np.asarray(a_image.resize(strip_size, Image.BILINEAR, box=box))
+        b_strip = np.asarray(b_image.resize(strip_size, Image.BILINEAR, box=box))
+        i = np.asarray(gray.crop((0, top, guide.width, bottom)), dtype=np.float32)
+        refined = np.clip(a_strip * i + b_strip + 0.5, 0, 255).astype(np.uint8)
+        output.paste(Image.fromarray(refined), (0, top))
+
+    return output
@@ -0,0 +1,63 @@
+import os
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import List
+
+MB = 1024 * 1024
+
+# Assumed for models that are neither registered nor downloaded yet
+DEFAULT_MODEL_MEMORY = 400 * MB
+
+# A loaded session holds the weights plus onnxruntime's working buffers,
+# which for these networks come to roughly the size of the weights again
+_RESIDENT_FACTOR = 2
+
+
+@dataclass(frozen=True)
+class ModelInfo:
+    """
+    A rembg model offered to users.
+
+    memory is a rough resident size of a loaded session in bytes, used to
+    budget how many sessions stay loaded until the real file size is known.
+    """
+    name: str
+    label: str
+    description: str
+    memory: int
+
+
+MODELS = OrderedDict((model.name, model) for model in (
+    ModelInfo('u2net', "U2-Net", "General purpose, good quality", 350 * MB),
+    ModelInfo('u2netp', "U2-Net lite", "Small and fast, rougher edges; suited to previews", 40 * MB),
+    ModelInfo('u2net_human_seg', "U2-Net human", "Tuned for people", 350 * MB),
+    ModelInfo('silueta', "Silueta", "U2-Net compressed to a quarter of the size", 100 * MB),
+    ModelInfo('isnet-general-use', "ISNet", "General purpose, finer detail, slower", 700 * MB),
+    ModelInfo('isnet-anime', "ISNet anime", "Anime and illustration characters", 700 * MB),
+    ModelInfo('birefnet-general-lite', "BiRefNet lite", "High quality edges, slowest", 1500 * MB),
+))
+
+
+def model_names() -> List[str]:
+    """Names of the registered models, in the order they are offered"""
+    return list(MODELS)
+
+
+def model_file(model_name: str) -> str:
+    """Where rembg keeps the ONNX file of a model once it is downloaded"""
+    home = os.getenv('U2NET_HOME', os.path.join(os.getenv('XDG_DATA_HOME', '~'), '.u2net'))
+    return os.path.join(os.path.expanduser(home), f"{model_name}.onnx")
+
+
+def model_memory(model_name: str) -> int:
+    """
+    Estimated bytes a loaded session of the model keeps resident.
+
+    Uses the size of the downloaded ONNX file when there is one, otherwise
+    the registry's estimate.
+    """
+    try:
+        return os.path.getsize(model_file(model_name)) * _RESIDENT_FACTOR
+    except OSError:
+        model = MODELS.get(model_name)
+        return model.memory if model else DEFAULT_MODEL_MEMORY
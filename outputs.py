@@ -0,0 +1,362 @@
+import io
+import os
+import threading
+import time
+import uuid
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import BinaryIO, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from PIL import Image
+
+from image_processor import MaskResult
+from png_stream import PngStreamWriter
+
+
+@dataclass(frozen=True)
+class EncoderProfile:
+    """
+    Format and encoder settings offered for saving processed images.
+
+    options are passed to Pillow's encoder for file_format. PNG profiles
+    without "optimize" go through PngStreamWriter, which only takes
+    compress_level.
+    """
+    name: str
+    label: str
+    file_format: str
+    extension: str
+    description: str
+    options: Dict[str, object] = field(default_factory=dict)
+
+    @property
+    def transparency(self) -> bool:
+        return self.file_format != 'JPEG'
+
+
+ENCODER_PROFILES = OrderedDict((profile.name, profile) for profile in (
+    EncoderProfile('png', "PNG", 'PNG', '.png', "Balanced speed and size", {'compress_level': 6}),
+    EncoderProfile('png-fast', "PNG (fast)", 'PNG', '.png', "Fastest to write, somewhat larger files",
+                   {'compress_level': 1}),
+    EncoderProfile('png-optimized', "PNG (smallest)", 'PNG', '.png',
+                   "Smallest PNG, slowest; holds the whole image while encoding", {'optimize': True}),
+    EncoderProfile('jpeg', "JPEG", 'JPEG', '.jpg', "No transparency, composited onto white", {'quality': 95}),
+    EncoderProfile('webp', "WebP", 'WEBP', '.webp', "Lossy with transparency, small files", {'quality': 90}),
+    EncoderProfile('webp-lossless', "WebP (lossless)", 'WEBP', '.webp', "Lossless with transparency",
+                   {'lossless': True, 'quality': 80, 'method': 4}),
+    EncoderProfile('avif', "AVIF", 'AVIF', '.avif', "Lossy with transparency, smallest files",
+                   {'quality': 80, 'speed': 8}),
+))
+
+DEFAULT_PROFILE = 'png'
+
+# Most writes queued or running in an OutputWriter, per writer thread
+_PENDING_PER_WRITER = 2
+
+
+@dataclass
+class ProfileMeasurement:
+    """Encode time in seconds and output size in bytes of one image under a profile"""
+    profile: str
+    seconds: float
+    size: int
+
+
+def profile_available(profile: EncoderProfile) -> bool:
+    """Whether the installed Pillow can write the profile's format"""
+    Image.init()
+    return profile.file_format in Image.SAVE
+
+
+def available_profiles() -> List[str]:
+    """Names of the encoder profiles this installation can write, in the order they are offered"""
+    return [name for name, profile in ENCODER_PROFILES.items() if profile_available(profile)]
+
+
+def get_profile(name: str) -> EncoderProfile:
+    """
+    Look up an encoder profile by name, ignoring case.
+
+    Format names such as "PNG" or "JPEG" name their default profile.
+
+    Raises:
+        ValueError: If there is no such profile or Pillow can't write its format
+    """
+    profile = ENCODER_PROFILES.get(name.lower())
+    if profile is None:
+        raise ValueError(f"Unknown output format '{name}', expected one of: {', '.join(ENCODER_PROFILES)}")
+    if not profile_available(profile):
+        raise ValueError(f"This Pillow installation can't write {profile.file_format} files")
+    return profile
+
+
+def profile_for_path(path: str, default: str = DEFAULT_PROFILE) -> EncoderProfile:
+    """
+    The profile to save path with: default if its extension matches, otherwise
+    the first available profile for the extension, falling back to default.
+    """
+    profile = get_profile(default)
+    extension = os.path.splitext(path)[1].lower()
+    if extension == '.jpeg':
+        extension = '.jpg'
+    if extension and extension != profile.extension:
+        for name in available_profiles():
+            if ENCODER_PROFILES[name].extension == extension:
+                return ENCODER_PROFILES[name]
+    return profile
+
+
+def output_filename(original_path: Optional[str] = None, index: int = 1, profile: str = DEFAULT_PROFILE) -> str:
+    """
+    Build the file name used when a processed image is saved automatically.
+
+    Args:
+        original_path: Path of the source image, if known
+        index: 1-based position in the batch, used when there is no source path
+        profile: Name of an encoder profile, see ENCODER_PROFILES
+
+    Returns:
+        File name such as "photo_processed.png" or "processed_3.png"
+    """
+    extension = get_profile(profile).extension
+    if original_path:
+        # Use original filename with "_processed" suffix
+        original_name = os.path.splitext(os.path.basename(original_path))[0]
+        return f"{original_name}_processed{extension}"
+    # Fallback to numbered naming
+    return f"processed_{index}{extension}"
+
+
+def temporary_output_path(path: str) -> str:
+    """
+    Create an empty hidden file next to path to write its contents into.
+
+    Writing there and then moving it into place keeps partially written
+    files out of the output directory.
+    """
+    directory, name = os.path.split(path)
+    while True:
+        temp_path = os.path.join(directory, f".{name}.{uuid.uuid4().hex[:8]}.part")
+        try:
+            # Created like any other output file, so it gets the usual permissions
+            open(temp_path, 'xb').close()
+            return temp_path
+        except FileExistsError:
+            continue
+
+
+def publish_output(temp_path: str, directory: str, filename: str) -> str:
+    """
+    Move a finished file into directory as filename, adding a counter on duplicates.
+
+    The name is claimed with a hard link, which fails instead of replacing an
+    existing file, so concurrent writers never pick the same name and the file
+    appears complete. Filesystems without hard links fall back to a rename.
+
+    Returns:
+        Path the file ended up at
+    """
+    save_path = os.path.join(directory, filename)
+    base_name, ext = os.path.splitext(save_path)
+    counter = 1
+    while True:
+        try:
+            os.link(temp_path, save_path)
+            os.remove(temp_path)
+            return save_path
+        except FileExistsError:
+            save_path = f"{base_name}_{counter}{ext}"
+            counter += 1
+        except OSError:
+            if os.path.exists(save_path):
+                save_path = f"{base_name}_{counter}{ext}"
+                counter += 1
+                continue
+            os.replace(temp_path, save_path)
+            return save_path
+
+
+def save_result(
+    result: MaskResult,
+    path: str,
+    profile: str = DEFAULT_PROFILE,
+    background: Optional[Tuple[int, int, int]] = None,
+    crop: bool = False
+):
+    """
+    Composite a MaskResult and save it with the given encoder profile.
+
+    The file is written under a temporary name and renamed over path once
+    complete; see encode_result() for how it is encoded.
+
+    Args:
+        result: Mask and original to build the output from
+        path: Destination file
+        profile: Name of an encoder profile, see ENCODER_PROFILES
+        background: RGB colour behind the subject; None keeps transparency,
+            which JPEG turns into white
+        crop: Crop the output to the subject's bounding box
+    """
+    temp_path = temporary_output_path(path)
+    try:
+        with open(temp_path, 'wb') as f:
+            encode_result(result, f, profile, background, crop)
+        os.replace(temp_path, path)
+    except BaseException:
+        os.remove(temp_path)
+        raise
+
+
+def encode_result(
+    result: MaskResult,
+    file: BinaryIO,
+    profile: str = DEFAULT_PROFILE,
+    background: Optional[Tuple[int, int, int]] = None,
+    crop: bool = False
+):
+    """
+    Composite a MaskResult and encode it into a binary file object.
+
+    The output is composited in strips. Streamed PNG profiles write it strip
+    by strip, so no full-size output image is ever held; the other encoders
+    need the whole image, so the strips are assembled into a single image
+    without an intermediate RGBA copy.
+
+    Args:
+        result: Mask and original to build the output from
+        file: Binary file object to write to
+        profile: Name of an encoder profile, see ENCODER_PROFILES
+        background: RGB colour behind the subject; None keeps transparency,
+            which JPEG turns into white
+        crop: Crop the output to the subject's bounding box
+    """
+    profile = get_profile(profile)
+    if background is None and not profile.transparency:
+        background = (255, 255, 255)
+    left, top, right, bottom = result.output_box(crop)
+    size = (right - left, bottom - top)
+    mode = 'RGBA' if background is None else 'RGB'
+    strips = result.composite_strips(background, crop)
+    if profile.file_format == 'PNG' and not profile.options.get('optimize'):
+        writer = PngStreamWriter(file, size, mode, **profile.options)
+        for strip in strips:
+            writer.write(strip)
+        writer.close()
+        return
+    image = Image.new(mode, size)
+    y = 0
+    for strip in strips:
+        image.paste(strip, (0, y))
+        y += strip.height
+    image.save(file, profile.file_format, **profile.options)
+
+
+def measure_profiles(
+    result: MaskResult,
+    profiles: Optional[Iterable[str]] = None,
+    background: Optional[Tuple[int, int, int]] = None,
+    crop: bool = False
+) -> Iterator[ProfileMeasurement]:
+    """
+    Encode a result in memory with each profile, yielding how long it took and how big it came out.
+
+    Compositing is included in the time, as it is when saving.
+
+    Args:
+        result: Mask and original to encode
+        profiles: Profile names to measure, defaults to all available ones
+        background: RGB colour behind the subject; None keeps transparency
+        crop: Crop the output to the subject's bounding box
+    """
+    for name in (profiles if profiles is not None else available_profiles()):
+        buffer = io.BytesIO()
+        started = time.perf_counter()
+        encode_result(result, buffer, name, background, crop)
+        yield ProfileMeasurement(name, time.perf_counter() - started, buffer.tell())
+
+
+def auto_save_image(
+    result: MaskResult,
+    directory: str,
+    original_path: Optional[str] = None,
+    index: int = 1,
+    profile: str = DEFAULT_PROFILE,
+    background: Optional[Tuple[int, int, int]] = None,
+    crop: bool = False
+) -> str:
+    """
+    Save a processed image into directory using the batch naming rules.
+
+    Args:
+        result: MaskResult to composite and save
+        directory: Output directory
+        original_path: Path of the source image, if known
+        index: 1-based position in the batch, used when there is no source path
+        profile: Name of an encoder profile, see ENCODER_PROFILES
+        background: RGB colour behind the subject; None keeps transparency
+        crop: Crop the output to the subject's bounding box
+
+    Returns:
+        Path the image was written to
+    """
+    filename = output_filename(original_path, index, profile)
+    temp_path = temporary_output_path(os.path.join(directory, filename))
+    try:
+        with open(temp_path, 'wb') as f:
+            encode_result(result, f, profile, background, crop)
+        return publish_output(temp_path, directory, filename)
+    except BaseException:
+        # Don't leave the partial file behind
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        raise
+
+
+def default_writer_count() -> int:
+    """Writer threads for an OutputWriter; zlib and the image encoders run without the GIL"""
+    return max(1, min(4, os.cpu_count() or 1))
+
+
+class OutputWriter:
+    """
+    Composites, encodes and writes results on a pool of threads.
+
+    submit() blocks while max_pending writes are queued or running, so a
+    producer that outpaces the disk is held back instead of piling up
+    results waiting to be written.
+    """
+
+    def __init__(self, workers: Optional[int] = None, max_pending: Optional[int] = None):
+        """
+        Args:
+            workers: Number of writer threads, defaults to default_writer_count()
+            max_pending: Most writes queued or running at once, defaults to
+                twice the number of workers
+        """
+        self.workers = workers or default_writer_count()
+        self._slots = threading.BoundedSemaphore(max_pending or self.workers * _PENDING_PER_WRITER)
+        self._executor = ThreadPoolExecutor(self.workers, thread_name_prefix='output-writer')
+
+    def submit(self, write: Callable[..., Optional[str]], *args, **kwargs) -> Future:
+        """
+        Run write(*args, **kwargs) on a writer thread, waiting for a free slot first.
+
+        Args:
+            write: save_result, auto_save_image or another function doing the writing
+
+        Returns:
+            Future for write's return value
+        """
+        self._slots.acquire()
+        try:
+            future = self._executor.submit(write, *args, **kwargs)
+        except BaseException:
+            self._slots.release()
+            raise
+        future.add_done_callback(lambda _: self._slots.release())
+        return future
+
+    def close(self, wait: bool = True):
+        """Stop accepting writes; with wait, return once the queued ones are written"""
+        self._executor.shutdown(wait=wait)
@@ -0,0 +1,89 @@
+import struct
+import zlib
+from typing import BinaryIO, Tuple
+
+import numpy as np
+from PIL import Image
+
+PNG_SIGNATURE = b'\x89PNG\r\n\x1a\n'
+
+# PNG colour types for the modes the writer accepts, with bytes per pixel
+_COLOR_TYPES = {
+    'L': (0, 1),
+    'RGB': (2, 3),
+    'RGBA': (6, 4),
+}
+
+# Compressed bytes collected before an IDAT chunk is written
+_CHUNK_SIZE = 256 * 1024
+
+
+class PngStreamWriter:
+    """
+    Writes an 8-bit PNG from horizontal strips without holding the whole image.
+
+    Rows are filtered with the PNG "Sub" filter and fed through a single zlib
+    stream, so memory use is bounded by the strip size however large the
+    image is. Strips must be written top to bottom and add up to the height
+    given up front.
+    """
+
+    def __init__(self, file: BinaryIO, size: Tuple[int, int], mode: str, compress_level: int = 6):
+        """
+        Args:
+            file: Binary file object to write to
+            size: (width, height) of the complete image
+            mode: "L", "RGB" or "RGBA"
+            compress_level: zlib level, 0-9
+        """
+        if mode not in _COLOR_TYPES:
+            raise ValueError(f"Unsupported mode for streaming PNG: {mode}")
+        self._file = file
+        self.size = size
+        self.mode = mode
+        self._bpp = _COLOR_TYPES[mode][1]
+        self._rows_written = 0
+        self._compressor = zlib.compressobj(compress_level)
+        self._pending = []
+        self._pending_size = 0
+
+        width, height = size
+        file.write(PNG_SIGNATURE)
+        self._write_chunk(b'IHDR', struct.pack('>IIBBBBB', width, height, 8, _COLOR_TYPES[mode][0], 0, 0, 0))
+
+    def write(self, strip: Image.Image):
+        """Append the next strip of rows"""
+        if strip.mode != self.mode or strip.width != self.size[0]:
+            raise ValueError(f"Strip {strip.mode} {strip.size} does not match image {self.mode} {self.size}")
+        if self._rows_written + strip.height > self.size[1]:
+            raise ValueError("More rows written than the image height")
+
+        rows = np.asarray(strip, dtype=np.uint8).reshape(strip.height, -1)
+        filtered = np.empty((strip.height, rows.shape[1] + 1), dtype=np.uint8)
+        filtered[:, 0] = 1  # Sub filter: each byte minus the one a pixel to the left
+        filtered[:, 1:self._bpp + 1] = rows[:, :self._bpp]
+        np.subtract(rows[:, self._bpp:], rows[:, :-self._bpp], out=filtered[:, self._bpp + 1:])
+        self._queue(self._compressor.compress(filtered.tobytes()))
+        self._rows_written += strip.height
+
+    def close(self):
+        """Finish the image; every row must have been written"""
+        if self._rows_written != self.size[1]:
+            raise ValueError(f"Only {self._rows_written} of {self.size[1]} rows were written")
+        self._queue(self._compressor.flush(), force=True)
+        self._write_chunk(b'IEND', b'')
+
+    def _queue(self, data: bytes, force: bool = False):
+        if data:
+            self._pending.append(data)
+            self._pending_size += len(data)
+        if self._pending_size >= _CHUNK_SIZE or (force and self._pending):
+            self._write_chunk(b'IDAT', b''.join(self._pending))
+            self._pending = []
+            self._pending_size = 0
+
+    def _write_chunk(self, chunk_type: bytes, data: bytes):
+        self._file.write(struct.pack('>I', len(data)))
+        self._file.write(chunk_type)
+        self._file.write(data)
+        self._file.write(struct.pack('>I', zlib.crc32(data, zlib.crc32(chunk_type)) & 0xffffffff))
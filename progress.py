@@ -0,0 +1,165 @@
+import threading
+import time
+from collections import deque
+from contextlib import contextmanager
+from dataclasses import dataclass
+from typing import Callable, Dict, Optional
+
+# Processing stages of one image, in order
+STAGES = ('decode', 'preprocess', 'inference', 'postprocess', 'composite', 'encode')
+
+STAGE_LABELS = {
+    'decode': "Reading image",
+    'preprocess': "Preparing image",
+    'inference': "Detecting subject",
+    'postprocess': "Refining mask",
+    'composite': "Compositing",
+    'encode': "Saving",
+}
+
+
+@dataclass
+class StageUpdate:
+    """
+    A stage of one image starting or finishing.
+
+    state is "started" or "finished"; duration is set when finished.
+    timestamp is time.monotonic() at the moment of the update.
+    """
+    stage: str
+    state: str
+    timestamp: float
+    duration: Optional[float] = None
+
+
+class StageReporter:
+    """
+    Times the stages of processing one image.
+
+    Each stage is reported to the callback as it starts and finishes, and
+    the durations are collected in timings. Callbacks run on the thread
+    doing the work.
+    """
+
+    def __init__(self, callback: Optional[Callable[[StageUpdate], None]] = None):
+        self.callback = callback
+        self.timings: Dict[str, float] = {}
+        self.started = time.monotonic()
+
+    @contextmanager
+    def stage(self, name: str):
+        """Time the enclosed block as stage name"""
+        start = time.monotonic()
+        self._emit(StageUpdate(name, 'started', start))
+        try:
+            yield
+        finally:
+            end = time.monotonic()
+            self.timings[name] = self.timings.get(name, 0.0) + end - start
+            self._emit(StageUpdate(name, 'finished', end, end - start))
+
+    def add(self, name: str, duration: float):
+        """Record a stage that was timed elsewhere, e.g. in a worker process"""
+        self.timings[name] = self.timings.get(name, 0.0) + duration
+        self._emit(StageUpdate(name, 'finished', time.monotonic(), duration))
+
+    def _emit(self, update: StageUpdate):
+        if self.callback:
+            self.callback(update)
+
+
+def format_duration(seconds: float) -> str:
+    """Short human readable duration such as "45s" or "3m 20s\""""
+    seconds = max(0, int(round(seconds)))
+    if seconds < 60:
+        return f"{seconds}s"
+    minutes, seconds = divmod(seconds, 60)
+    if minutes < 60:
+        return f"{minutes}m {seconds:02d}s"
+    hours, minutes = divmod(minutes, 60)
+    return f"{hours}h {minutes:02d}m"
+
+
+class EtaEstimator:
+    """
+    Predicts remaining time from observed stage timings and throughput.
+
+    Per-image estimates use a moving average of each stage's duration. Batch
+    estimates use the rate images actually completed at over the last few
+    completions, which already reflects how many workers run in parallel.
+    """
+
+    def __init__(self, window: int = 20, smoothing: float = 0.3):
+        """
+        Args:
+            window: Number of recent completions the batch rate is measured over
+            smoothing: Weight of the newest sample in the stage averages
+        """
+        self.smoothing = smoothing
+        self.stage_averages: Dict[str, float] = {}
+        self._completions = deque(maxlen=window)
+        self._lock = threading.Lock()
+
+    def record(self, timings: Dict[str, float], timestamp: Optional[float] = None):
+        """Add the stage timings of a finished image"""
+        with self._lock:
+            for stage, duration in timings.items():
+                average = self.stage_averages.get(stage)
+                if average is None:
+                    self.stage_averages[stage] = duration
+                else:
+                    self.stage_averages[stage] = average + self.smoothing * (duration - average)
+            self._completions.append(time.monotonic() if timestamp is None else timestamp)
+
+    def image_duration(self) -> Optional[float]:
+        """Expected seconds for one image, or None before any was timed"""
+        with self._lock:
+            if not self.stage_averages:
+                return None
+            return sum(self.stage_averages.values())
+
+    def image_progress(self, timings: Dict[str, float], stage: Optional[str], stage_elapsed: float) -> Optional[float]:
+        """
+        Fraction of an image that is done.
+
+        Args:
+            timings: Durations of the stages that have finished
+            stage: Stage running now, if any
+            stage_elapsed: Seconds the running stage has taken so far
+
+        Returns:
+            Value between 0 and 1, or None before any image was timed
+        """
+        with self._lock:
+            if not self.stage_averages:
+                return None
+            total = sum(self.stage_averages.values())
+            done = sum(self.stage_averages.get(name, duration) for name, duration in timings.items())
+            if stage:
+                # A stage can't be more than its expected share done until it finishes
+                done += min(stage_elapsed, self.stage_averages.get(stage, stage_elapsed))
+        return min(done / total, 0.99) if total > 0 else None
+
+    def rate(self) -> Optional[float]:
+        """Images completed per second, or None until two have completed"""
+        with self._lock:
+            if len(self._completions) < 2:
+                return None
+            span = self._completions[-1] - self._completions[0]
+            if span <= 0:
+                return None
+            return (len(self._completions) - 1) / span
+
+    def batch_eta(self, remaining: int, workers: int = 1) -> Optional[float]:
+        """
+        Seconds until remaining more images are done, or None if unknown yet.
+
+        workers is only used before a completion rate has been observed.
+        """
+        if remaining <= 0:
+            return 0.0
+        rate = self.rate()
+        if rate:
+            return remaining / rate
+        duration = self.image_duration()
+        return remaining * duration / max(1, workers) if duration else None
@@ -0,0 +1,168 @@
+import hashlib
+import json
+import os
+import sys
+import tempfile
+import threading
+from typing import Optional
+
+from PIL import Image
+
+DEFAULT_CACHE_SIZE = 1024 * 1024 * 1024  # 1GB
+
+
+def default_cache_dir() -> str:
+    """Per-user directory for cached masks"""
+    if sys.platform == 'win32':
+        base = os.environ.get('LOCALAPPDATA', os.path.expanduser('~'))
+    elif sys.platform == 'darwin':
+        base = os.path.expanduser('~/Library/Caches')
+    else:
+        base = os.environ.get('XDG_CACHE_HOME', os.path.expanduser('~/.cache'))
+    return os.path.join(base, 'rembg-ui', 'masks')
+
+
+def cache_key(data: bytes, model_name: str, options: Optional[dict] = None) -> str:
+    """
+    Build the cache key for an input file.
+
+    Args:
+        data: Raw bytes of the input file
+        model_name: rembg model the mask is produced with
+        options: Any other settings that change the mask
+
+    Returns:
+        Hex digest identifying the mask
+    """
+    return _finish_key(hashlib.sha256(data), model_name, options)
+
+
+def file_cache_key(path: str, model_name: str, options: Optional[dict] = None) -> str:
+    """Build the cache key for a file on disk without reading it into memory at once"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(1024 * 1024), b''):
+            digest.update(chunk)
+    return _finish_key(digest, model_name, options)
+
+
+def _finish_key(digest, model_name: str, options: Optional[dict]) -> str:
+    digest.update(b'\0' + model_name.encode('utf-8'))
+    digest.update(b'\0' + json.dumps(options or {}, sort_keys=True).encode('utf-8'))
+    return digest.hexdigest()
+
+
+class ResultCache:
+    """
+    On-disk cache of alpha masks keyed by input content and processing options.
+
+    Only the 8-bit mask is stored; the cut-out is rebuilt from the original
+    file, which keeps entries a fraction of the size of the RGBA result.
+    Entries are evicted least recently used first once the cache grows past
+    max_size bytes, using file modification times as the access clock.
+    """
+
+    def __init__(self, directory: Optional[str] = None, max_size: int = DEFAULT_CACHE_SIZE):
+        self.directory = directory or default_cache_dir()
+        self.max_size = max_size
+        self._lock = threading.Lock()
+        self._size = None  # Computed on first write
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.directory, key[:2], f"{key}.png")
+
+    def get(self, key: str) -> Optional[Image.Image]:
+        """Return the cached mask for key, or None on a miss"""
+        path = self._path(key)
+        try:
+            with Image.open(path) as mask:
+                mask.load()
+                mask = mask.convert('L') if mask.mode != 'L' else mask.copy()
+            # Mark as recently used
+            os.utime(path)
+            return mask
+        except FileNotFoundError:
+            return None
+        except Exception as e:
+            # A damaged entry is just a miss; drop it so it gets rewritten
+            print(f"Discarding unreadable cache entry {path}: {str(e)}")
+            try:
+                os.remove(path)
+            except OSError:
+                pass
+            return None
+
+    def put(self, key: str, mask: Image.Image):
+        """Store a mask; the write is atomic so readers never see partial files"""
+        path = self._path(key)
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        fd, temp_path = tempfile.mkstemp(dir=os.path.dirname(path), suffix='.tmp')
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                mask.convert('L').save(f, 'PNG', compress_level=1)
+            previous = os.path.getsize(path) if os.path.exists(path) else 0
+            os.replace(temp_path, path)
+        except Exception:
+            os.remove(temp_path)
+            raise
+
+        with self._lock:
+            if self._size is None:
+                self._size = self._scan_size()
+            else:
+                self._size += os.path.getsize(path) - previous
+            if self._size > self.max_size:
+                self._evict()
+
+    def clear(self):
+        """Remove every cached mask"""
+        with self._lock:
+            for path, _, _ in self._entries():
+                try:
+                    os.remove(path)
+                except OSError:
+                    pass
+            self._size = 0
+
+    def _entries(self):
+        """Yield (path, size, mtime) for every cache file"""
+        if not os.path.isdir(self.directory):
+            return
+        for bucket in os.scandir(self.directory):
+            if not bucket.is_dir():
+                continue
+            for entry in os.scandir(bucket.path):
+                if entry.name.endswith('.png'):
+                    try:
+                        stat = entry.stat()
+                    except OSError:
+                        continue
+                    yield entry.path, stat.st_size, stat.st_mtime
+
+    def _scan_size(self) -> int:
+        return sum(size for _, size, _ in self._entries())
+
+    def _evict(self):
+        # Trim below the limit so every write past it doesn't rescan the directory
+        target = self.max_size * 0.9
+        for path, size, _ in sorted(self._entries(), key=lambda entry: entry[2]):
+            if self._size <= target:
+                break
+            try:
+                os.remove(path)
+                self._size -= size
+            except OSError:
+                pass
+
+
+_default_cache = None
+_default_cache_lock = threading.Lock()
+
+
+def get_default_cache() -> ResultCache:
+    """Return the application-wide mask cache"""
+    global _default_cache
+    with _default_cache_lock:
+        if _default_cache is None:
+            _default_cache = ResultCache()
+        return _default_cache
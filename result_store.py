@@ -0,0 +1,165 @@
+import os
+import shutil
+import tempfile
+import threading
+import weakref
+from collections import OrderedDict
+from typing import Iterator, Optional
+
+from PIL import Image
+
+from image_processor import MaskResult
+
+DEFAULT_MEMORY_BUDGET = 256 * 1024 * 1024  # 256MB of masks
+
+
+class _Entry:
+    __slots__ = ('source_path', 'mask', 'mask_size', 'mask_path', 'output_state')
+
+    def __init__(self, source_path: str, mask: Image.Image):
+        self.source_path = source_path
+        self.mask = mask
+        self.mask_size = mask.size
+        self.mask_path = None  # Set once the mask lives on disk
+        self.output_state = None  # (size, mtime_ns) when mask_path is a saved output, not a spill file
+
+
+class ResultStore:
+    """
+    Holds the results of a batch session within a fixed memory budget.
+
+    Results are kept as masks that refer to their source file. Once the masks
+    held in memory exceed memory_budget bytes, the oldest are written to a
+    temporary spill directory and reloaded on demand. A result the caller
+    saved as an uncropped, transparent PNG keeps only that file's path, since
+    its alpha channel is the mask; the file must be unchanged when the result
+    is read back.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_MEMORY_BUDGET, spill_dir: Optional[str] = None):
+        """
+        Args:
+            memory_budget: Bytes of masks to keep in memory before spilling
+            spill_dir: Parent directory for spill files, defaults to the system temp dir
+        """
+        self.memory_budget = memory_budget
+        self._spill_parent = spill_dir
+        self._spill_dir = None
+        self._cleanup = None
+        self._entries = []
+        self._in_memory = OrderedDict()  # index -> bytes, oldest first
+        self._memory_used = 0
+        self._lock = threading.Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    @property
+    def memory_used(self) -> int:
+        """Bytes of masks currently held in memory"""
+        return self._memory_used
+
+    def add(self, result: MaskResult, saved_path: Optional[str] = None, saved_mask: bool = False) -> int:
+        """
+        Store a result.
+
+        Args:
+            result: MaskResult that refers to its source file
+            saved_path: Where the result was already written, if anywhere
+            saved_mask: saved_path is an uncropped PNG whose alpha channel is
+                exactly this result's mask, so it is kept instead of the mask
+
+        Returns:
+            Index of the stored result
+        """
+        if not result.source_path:
+            raise ValueError("Only results backed by a source file can be stored")
+
+        entry = _Entry(result.source_path, result.mask)
+        output_state = None
+        if saved_path and saved_mask:
+            try:
+                stat = os.stat(saved_path)
+                output_state = (stat.st_size, stat.st_mtime_ns)
+            except OSError:
+                pass  # Keep the mask itself
+        with self._lock:
+            index = len(self._entries)
+            self._entries.append(entry)
+            if output_state is not None:
+                entry.mask = None
+                entry.mask_path = saved_path
+                entry.output_state = output_state
+            else:
+                size = result.mask.width * result.mask.height
+                self._in_memory[index] = size
+                self._memory_used += size
+                self._spill_over_budget()
+        return index
+
+    def __getitem__(self, index: int) -> MaskResult:
+        with self._lock:
+            entry = self._entries[index]
+            mask = entry.mask
+        if mask is None:
+            mask = self._load_mask(entry)
+        return MaskResult(mask, entry.source_path)
+
+    def __iter__(self) -> Iterator[MaskResult]:
+        """Yield results one at a time; spilled masks are loaded only as they are reached"""
+        for index in range(len(self)):
+            yield self[index]
+
+    def clear(self):
+        """Drop every result and delete the spill files"""
+        with self._lock:
+            self._entries.clear()
+            self._in_memory.clear()
+            self._memory_used = 0
+            if self._cleanup is not None:
+                self._cleanup()
+                self._cleanup = None
+                self._spill_dir = None
+
+    def _load_mask(self, entry: _Entry) -> Image.Image:
+        path = entry.mask_path
+        if entry.output_state is not None:
+            try:
+                stat = os.stat(path)
+            except OSError:
+                raise OSError(f"{os.path.basename(path)} was moved or deleted after it was saved")
+            if (stat.st_size, stat.st_mtime_ns) != entry.output_state:
+                raise OSError(f"{os.path.basename(path)} was changed after it was saved")
+        with Image.open(path) as img:
+            if entry.output_state is not None:
+                mask = img.getchannel('A') if 'A' in img.getbands() else None
+            else:
+                img.load()
+                mask = img.copy()
+        if mask is None or mask.size != entry.mask_size:
+            raise OSError(f"{os.path.basename(path)} no longer holds the result's mask")
+        return mask
+
+    def _spill_over_budget(self):
+        while self._memory_used > self.memory_budget and self._in_memory:
+            index, size = self._in_memory.popitem(last=False)
+            entry = self._entries[index]
+            try:
+                entry.mask_path = self._write_spill(index, entry.mask)
+            except OSError as e:
+                # Keep it in memory rather than lose the result
+                print(f"Could not spill result to disk: {str(e)}")
+                self._in_memory[index] = size
+                self._in_memory.move_to_end(index, last=False)
+                return
+            entry.mask = None
+            self._memory_used -= size
+
+    def _write_spill(self, index: int, mask: Image.Image) -> str:
+        if self._spill_dir is None:
+            self._spill_dir = tempfile.mkdtemp(prefix='rembg-ui-results-', dir=self._spill_parent)
+            # Removed when the store is cleared, collected or the interpreter exits
+            self._cleanup = weakref.finalize(self, shutil.rmtree, self._spill_dir, ignore_errors=True)
+        path = os.path.join(self._spill_dir, f"{index}.png")
+        mask.save(path, 'PNG', compress_level=1)
+        return path
@@ -0,0 +1,634 @@
+#!/usr/bin/env python3
+import argparse
+import asyncio
+import email.parser
+import email.policy
+import io
+import json
+import os
+import sys
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from http import HTTPStatus
+from typing import Dict, List, Optional, Tuple
+from urllib.parse import parse_qs, urlsplit
+
+from PIL import Image, UnidentifiedImageError
+
+from backends import ThreadBackend
+from batch_engine import DEFAULT_INTRA_OP_THREADS, default_worker_count
+from cancellation import CancellationToken, ProcessingCancelled
+from image_processor import DEFAULT_INFERENCE_SIZE, MaskResult, load_source
+from models import MODELS
+from outputs import DEFAULT_PROFILE, encode_result, get_profile
+from progress import StageReporter
+from session_manager import DEFAULT_MODEL, DEFAULT_SESSION_MEMORY, session_pool, set_session_memory_budget
+from watch_folder import ThroughputMeter
+
+DEFAULT_HOST = '127.0.0.1'
+DEFAULT_PORT = 7000
+
+# Requests admitted at once, queued or running; more are turned away with 503
+DEFAULT_MAX_QUEUE = 64
+
+DEFAULT_MAX_BODY = 50 * 1024 * 1024
+
+# Encoded chunks an encoder may run ahead of a slow client
+_STREAM_CHUNKS = 8
+
+_MAX_HEADERS = 100
+
+# Counted for requests whose client disconnected before the response was sent
+_CLIENT_CLOSED = 499
+
+_CONTENT_TYPES = {
+    'PNG': 'image/png',
+    'JPEG': 'image/jpeg',
+    'WEBP': 'image/webp',
+    'AVIF': 'image/avif',
+}
+
+
+class HttpError(Exception):
+    """Ends a request with the given status and a JSON error body"""
+
+    def __init__(self, status: int, message: str):
+        super().__init__(message)
+        self.status = status
+        self.message = message
+
+
+@dataclass
+class Request:
+    method: str
+    path: str
+    query: Dict[str, str]
+    headers: Dict[str, str]
+    length: int = 0
+    body: Optional[bytes] = None  # Left on the connection until an endpoint reads it
+    reader: Optional[asyncio.StreamReader] = field(default=None, repr=False)
+    keep_alive: bool = True
+    streaming: bool = False  # Set once a streamed response has started
+
+    async def read_body(self) -> bytes:
+        if self.body is None:
+            self.body = await self.reader.readexactly(self.length) if self.length > 0 else b''
+        return self.body
+
+    @property
+    def body_unread(self) -> bool:
+        return self.body is None and self.length > 0
+
+
+@dataclass
+class _Job:
+    """What one /remove request asks for"""
+    data: Optional[bytes] = None
+    path: Optional[str] = None
+    model: str = DEFAULT_MODEL
+    profile: str = DEFAULT_PROFILE
+    background: Optional[Tuple[int, int, int]] = None
+    crop: bool = False
+    output_size: Optional[Tuple[int, int]] = None  # Of the image returned, once segmented
+    token: CancellationToken = field(default_factory=CancellationToken)
+    stages: StageReporter = field(default_factory=StageReporter)
+
+
+class _ChunkStream:
+    """
+    File-like object an encoder writes to on a worker thread while the event
+    loop sends what it wrote as HTTP chunks.
+
+    write() blocks once _STREAM_CHUNKS chunks are waiting, so a slow client
+    holds the encoder back instead of the output piling up in memory.
+    """
+
+    def __init__(self, loop: asyncio.AbstractEventLoop, token: CancellationToken):
+        self._loop = loop
+        self._token = token
+        self._chunks = asyncio.Queue()
+        self._slots = threading.Semaphore(_STREAM_CHUNKS)
+
+    def write(self, data) -> int:
+        if not data:
+            return 0
+        while not self._slots.acquire(timeout=0.5):
+            self._token.raise_if_cancelled()
+        self._token.raise_if_cancelled()
+        self._loop.call_soon_threadsafe(self._chunks.put_nowait, bytes(data))
+        return len(data)
+
+    def finish(self, error: Optional[Exception] = None):
+        """Called on the encoder thread once it is done, with the exception it failed with"""
+        self._loop.call_soon_threadsafe(self._chunks.put_nowait, error or StopAsyncIteration())
+
+    async def chunks(self):
+        while True:
+            item = await self._chunks.get()
+            if isinstance(item, StopAsyncIteration):
+                return
+            if isinstance(item, Exception):
+                raise item
+            self._slots.release()
+            yield item
+
+
+class Metrics:
+    """Counters for /health and /metrics; only touched from the event loop"""
+
+    def __init__(self):
+        self.started = time.time()
+        self.requests: Dict[Tuple[str, int], int] = {}
+        self.images = 0
+        self.rejected = 0
+        self.request_seconds = 0.0
+        self.stage_seconds: Dict[str, float] = {}
+        self.throughput = ThroughputMeter()
+
+    def count_request(self, path: str, status: int):
+        key = (path, status)
+        self.requests[key] = self.requests.get(key, 0) + 1
+
+    def count_image(self, seconds: float, timings: Dict[str, float]):
+        self.images += 1
+        self.request_seconds += seconds
+        self.throughput.record()
+        for stage, duration in timings.items():
+            self.stage_seconds[stage] = self.stage_seconds.get(stage, 0.0) + duration
+
+
+class InferenceServer:
+    """
+    Background removal over HTTP, sharing warm sessions between requests.
+
+    Built on asyncio streams so it needs nothing beyond the standard library.
+    The event loop only reads requests and sends responses. Parsing and
+    decoding uploads, inference and encoding each run on their own thread
+    pool, so slow uploads don't hold inference slots, and a request turned
+    away for load is answered before its body is read. Inference goes
+    through a ThreadBackend per model, so with batch_size above 1 concurrent
+    requests share ONNX runs. At most max_queue requests are admitted at once; the
+    rest get 503 with Retry-After, which keeps latency bounded under load.
+
+    Endpoints:
+        POST /remove  Image bytes as the body, a multipart upload, or JSON
+                      {"path": ...} for files under allowed_dirs. Query
+                      parameters: model, format, crop, background (hex).
+                      The output is streamed back with chunked encoding.
+        GET /health   JSON status, loaded models and queue depth
+        GET /metrics  Counters in the Prometheus text format
+    """
+
+    def __init__(
+        self,
+        model_name: str = DEFAULT_MODEL,
+        workers: Optional[int] = None,
+        batch_size: int = 1,
+        intra_op_threads: int = DEFAULT_INTRA_OP_THREADS,
+        inference_size: Optional[int] = DEFAULT_INFERENCE_SIZE,
+        max_queue: int = DEFAULT_MAX_QUEUE,
+        max_body: int = DEFAULT_MAX_BODY,
+        allowed_dirs: Optional[List[str]] = None
+    ):
+        """
+        Args:
+            model_name: Model used when a request does not name one
+            workers: Concurrent inference workers, defaults to physical cores
+                divided by intra_op_threads
+            batch_size: Most concurrent requests stacked into one model run per worker
+            intra_op_threads: ONNX intra-op threads used by each inference call
+            inference_size: Long edge images are segmented at; None or 0 uses
+                the full resolution
+            max_queue: Requests admitted at once, queued or running
+            max_body: Largest accepted request body in bytes
+            allowed_dirs: Folders whose files may be named by path; None
+                disables path inputs
+        """
+        self.model_name = model_name
+        self.workers = workers or default_worker_count(intra_op_threads)
+        self.batch_size = max(1, batch_size)
+        self.intra_op_threads = intra_op_threads
+        self.inference_size = inference_size
+        self.max_queue = max(1, max_queue)
+        self.max_body = max_body
+        self.allowed_dirs = [os.path.abspath(directory) for directory in allowed_dirs or []]
+        self.metrics = Metrics()
+        self.pending = 0
+        self._backends: Dict[str, ThreadBackend] = {}
+        self._backends_lock = threading.Lock()
+        # Enough callers to fill every worker's batch, as in BatchEngine
+        self._decode_pool = ThreadPoolExecutor(self.workers, thread_name_prefix='server-decode')
+        self._infer_pool = ThreadPoolExecutor(self.workers * self.batch_size, thread_name_prefix='server-infer')
+        self._encode_pool = ThreadPoolExecutor(self.workers, thread_name_prefix='server-encode')
+
+    def _backend(self, model_name: str) -> ThreadBackend:
+        with self._backends_lock:
+            backend = self._backends.get(model_name)
+            if backend is None:
+                backend = ThreadBackend(self.workers, model_name, self.intra_op_threads, self.inference_size,
+                                        self.batch_size)
+                self._backends[model_name] = backend
+            return backend
+
+    def _release_evicted(self):
+        """Let go of models the pool unloaded for others, which idle backends would otherwise keep loaded"""
+        with self._backends_lock:
+            backends = list(self._backends.values())
+        for backend in backends:
+            backend.release_evicted()
+
+    async def preload(self):
+        """Load the default model before the first request needs it"""
+        loop = asyncio.get_running_loop()
+        await loop.run_in_executor(self._infer_pool, session_pool().get, self.model_name, self.intra_op_threads)
+
+    async def serve(self, host: str = DEFAULT_HOST, port: int = DEFAULT_PORT):
+        server = await asyncio.start_server(self._handle_connection, host, port)
+        addresses = ", ".join(f"http://{sock.getsockname()[0]}:{sock.getsockname()[1]}" for sock in server.sockets)
+        print(f"Serving {self.model_name} on {addresses} with {self.workers} worker(s)", file=sys.stderr)
+        async with server:
+            await server.serve_forever()
+
+    def close(self):
+        self._decode_pool.shutdown(wait=False, cancel_futures=True)
+        self._infer_pool.shutdown(wait=False, cancel_futures=True)
+        self._encode_pool.shutdown(wait=False, cancel_futures=True)
+        for backend in self._backends.values():
+            backend.close()
+
+    async def _handle_connection(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter):
+        try:
+            while True:
+                try:
+                    request = await _read_request(reader, self.max_body)
+                except HttpError as e:
+                    self.metrics.count_request('other', e.status)
+                    await _send_json(writer, e.status, {'error': e.message}, keep_alive=False)
+                    return
+                if request is None:
+                    return
+                await self._dispatch(request, writer)
+                if not request.keep_alive:
+                    return
+        except (ConnectionError, asyncio.IncompleteReadError):
+            pass  # Client went away
+        except asyncio.CancelledError:
+            pass  # Server shutting down
+        finally:
+            writer.close()
+
+    async def _dispatch(self, request: Request, writer: asyncio.StreamWriter):
+        routes = {
+            '/health': ('GET', self._health),
+            '/metrics': ('GET', self._metrics),
+            '/remove': ('POST', self._remove),
+        }
+        status = HTTPStatus.OK
+        try:
+            route = routes.get(request.path)
+            if route is None:
+                raise HttpError(HTTPStatus.NOT_FOUND, f"No endpoint {request.path}")
+            if request.method != route[0]:
+                raise HttpError(HTTPStatus.METHOD_NOT_ALLOWED, f"Use {route[0]} for {request.path}")
+            if route[0] == 'GET' and request.body_unread:
+                request.keep_alive = False  # The body is never read, so the connection can't be reused
+            await route[1](request, writer)
+        except HttpError as e:
+            status = e.status
+            if request.body_unread:
+                request.keep_alive = False
+            extra = {'Retry-After': '1'} if e.status == HTTPStatus.SERVICE_UNAVAILABLE else {}
+            await _send_json(writer, e.status, {'error': e.message}, request.keep_alive, extra)
+        except (ConnectionError, asyncio.CancelledError):
+            status = _CLIENT_CLOSED
+            raise
+        except Exception as e:
+            status = HTTPStatus.INTERNAL_SERVER_ERROR
+            print(f"Request to {request.path} failed: {str(e)}")
+            request.keep_alive = False
+            if not request.streaming:
+                await _send_json(writer, status, {'error': "Internal error"}, keep_alive=False)
+        finally:
+            self.metrics.count_request(request.path if request.path in routes else 'other', int(status))
+
+    async def _health(self, request: Request, writer: asyncio.StreamWriter):
+        await _send_json(writer, HTTPStatus.OK, {
+            'status': 'ok',
+            'model': self.model_name,
+            'loaded_models': session_pool().loaded_models(),
+            'pending': self.pending,
+            'max_queue': self.max_queue,
+            'workers': self.workers,
+            'batch_size': self.batch_size,
+            'uptime_s': round(time.time() - self.metrics.started, 1),
+        }, request.keep_alive)
+
+    async def _metrics(self, request: Request, writer: asyncio.StreamWriter):
+        metrics = self.metrics
+        lines = [
+            '# TYPE rembg_requests_total counter',
+            *(f'rembg_requests_total{{path="{path}",status="{status}"}} {count}'
+              for (path, status), count in sorted(metrics.requests.items())),
+            '# TYPE rembg_images_total counter',
+            f'rembg_images_total {metrics.images}',
+            '# TYPE rembg_rejected_total counter',
+            f'rembg_rejected_total {metrics.rejected}',
+            '# TYPE rembg_request_seconds_total counter',
+            f'rembg_request_seconds_total {metrics.request_seconds:.6f}',
+            '# TYPE rembg_stage_seconds_total counter',
+            *(f'rembg_stage_seconds_total{{stage="{stage}"}} {seconds:.6f}'
+              for stage, seconds in sorted(metrics.stage_seconds.items())),
+            '# TYPE rembg_pending gauge',
+            f'rembg_pending {self.pending}',
+            '# TYPE rembg_images_per_second gauge',
+            f'rembg_images_per_second {metrics.throughput.rate():.4f}',
+            '# TYPE rembg_session_memory_bytes gauge',
+            f'rembg_session_memory_bytes {session_pool().memory_used()}',
+        ]
+        body = ('\n'.join(lines) + '\n').encode('utf-8')
+        await _send(writer, HTTPStatus.OK, {'Content-Type': 'text/plain; version=0.0.4'}, body, request.keep_alive)
+
+    async def _remove(self, request: Request, writer: asyncio.StreamWriter):
+        # Decided on the headers alone, so a busy server doesn't take in uploads it turns away
+        if self.pending >= self.max_queue:
+            self.metrics.rejected += 1
+            raise HttpError(HTTPStatus.SERVICE_UNAVAILABLE, "Server busy, retry shortly")
+        self.pending += 1
+        started = time.perf_counter()
+        loop = asyncio.get_running_loop()
+        try:
+            if request.headers.get('expect', '').lower() == '100-continue':
+                writer.write(b"HTTP/1.1 100 Continue\r\n\r\n")
+            await request.read_body()
+            try:
+                job, image = await loop.run_in_executor(self._decode_pool, self._decode, request)
+                request.body = b''
+                try:
+                    result = await loop.run_in_executor(self._infer_pool, self._segment, job, image)
+                except asyncio.CancelledError:
+                    job.token.cancel()
+                    raise
+            except UnidentifiedImageError:
+                raise HttpError(HTTPStatus.UNSUPPORTED_MEDIA_TYPE, "Not a supported image")
+            except (OSError, ValueError) as e:
+                raise HttpError(HTTPStatus.UNPROCESSABLE_ENTITY, f"Cannot process the image: {str(e)}")
+
+            profile = get_profile(job.profile)
+            # Timings known before the output is streamed, in the standard Server-Timing header
+            timing = ", ".join(f"{stage};dur={seconds * 1000:.1f}" for stage, seconds in job.stages.timings.items())
+            await _send_head(writer, HTTPStatus.OK, {
+                'Content-Type': _CONTENT_TYPES.get(profile.file_format, 'application/octet-stream'),
+                'Transfer-Encoding': 'chunked',
+                'Server-Timing': timing,
+                'X-Image-Size': f"{job.output_size[0]}x{job.output_size[1]}",
+            }, request.keep_alive)
+            request.streaming = True
+            stream = _ChunkStream(loop, job.token)
+            encoding = loop.run_in_executor(self._encode_pool, self._encode, result, stream, job)
+            try:
+                async for chunk in stream.chunks():
+                    writer.write(f"{len(chunk):x}\r\n".encode('ascii') + chunk + b"\r\n")
+                    await writer.drain()
+                writer.write(b"0\r\n\r\n")
+                await writer.drain()
+            except BaseException:
+                # The status line is out, so all that is left is to drop the connection
+                job.token.cancel()
+                request.keep_alive = False
+                raise
+            finally:
+                await asyncio.shield(encoding)
+            self.metrics.count_image(time.perf_counter() - started, dict(job.stages.timings))
+        finally:
+            self.pending -= 1
+
+    def _parse_job(self, request: Request) -> _Job:
+        query = dict(request.query)
+        content_type = request.headers.get('content-type', '')
+        job = _Job()
+        if content_type.startswith('application/json'):
+            try:
+                options = json.loads(request.body or b'{}')
+            except ValueError:
+                raise HttpError(HTTPStatus.BAD_REQUEST, "Body is not valid JSON")
+            if not isinstance(options, dict) or not options.get('path'):
+                raise HttpError(HTTPStatus.BAD_REQUEST, 'Expected {"path": ...}')
+            job.path = self._allowed_path(str(options.pop('path')))
+            query.update({key: str(value) for key, value in options.items()})
+        elif content_type.startswith('multipart/form-data'):
+            job.data = _multipart_file(content_type, request.body)
+        else:
+            job.data = request.body
+        if job.data is not None and not job.data:
+            raise HttpError(HTTPStatus.BAD_REQUEST, "No image in the request body")
+
+        job.model = query.get('model', self.model_name)
+        if job.model not in MODELS and job.model != self.model_name:
+            raise HttpError(HTTPStatus.BAD_REQUEST, f"Unknown model '{job.model}'")
+        job.profile = query.get('format', DEFAULT_PROFILE)
+        try:
+            get_profile(job.profile)
+        except ValueError as e:
+            raise HttpError(HTTPStatus.BAD_REQUEST, str(e))
+        job.crop = query.get('crop', '').lower() in ('1', 'true', 'yes')
+        if query.get('background'):
+            job.background = _parse_color(query['background'])
+        return job
+
+    def _allowed_path(self, path: str) -> str:
+        path = os.path.realpath(path)
+        if not any(path.startswith(directory + os.sep) for directory in self.allowed_dirs):
+            raise HttpError(HTTPStatus.FORBIDDEN, "Path inputs are not allowed for this file; see --allow-path")
+        if not os.path.isfile(path):
+            raise HttpError(HTTPStatus.NOT_FOUND, "No such file")
+        return path
+
+    def _decode(self, request: Request) -> Tuple[_Job, Image.Image]:
+        """Runs on a decode thread: parse the request and decode its image"""
+        job = self._parse_job(request)
+        with job.stages.stage('decode'):
+            image = load_source(job.path if job.path else io.BytesIO(job.data))
+        job.data = None
+        return job, image
+
+    def _segment(self, job: _Job, image: Image.Image) -> MaskResult:
+        """Runs on an inference thread"""
+        # segment() times preprocess, inference and postprocess itself
+        mask = self._backend(job.model).predict_mask(image, job.stages, job.token)
+        # Loading this model may have pushed another out of the pool
+        self._release_evicted()
+        result = MaskResult(mask, source=image)
+        left, top, right, bottom = result.output_box(job.crop)
+        job.output_size = (right - left, bottom - top)
+        return result
+
+    def _encode(self, result: MaskResult, stream: _ChunkStream, job: _Job):
+        """Runs on an encode thread, writing into the stream the event loop sends from"""
+        try:
+            with job.stages.stage('encode'):
+                encode_result(result, stream, job.profile, job.background, job.crop)
+        except ProcessingCancelled:
+            stream.finish(ConnectionAbortedError("Client went away"))
+        except Exception as e:
+            stream.finish(e)
+        else:
+            stream.finish()
+
+
+def _parse_color(text: str) -> Tuple[int, int, int]:
+    value = text.lstrip('#')
+    if len(value) == 3:
+        value = ''.join(ch * 2 for ch in value)
+    try:
+        if len(value) != 6:
+            raise ValueError(text)
+        return tuple(int(value[i:i + 2], 16) for i in (0, 2, 4))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, f"Background must be a hex colour such as ffffff, not '{text}'")
+
+
+def _multipart_file(content_type: str, body: bytes) -> bytes:
+    """The first file part of a multipart/form-data body"""
+    message = email.parser.BytesParser(policy=email.policy.HTTP).parsebytes(
+        f"Content-Type: {content_type}\r\n\r\n".encode('latin-1') + body)
+    for part in message.iter_parts():
+        if part.get_filename() or part.get_param('name', header='content-disposition') in ('image', 'file'):
+            return part.get_payload(decode=True) or b''
+    raise HttpError(HTTPStatus.BAD_REQUEST, "No file in the multipart upload")
+
+
+async def _readline(reader: asyncio.StreamReader) -> bytes:
+    try:
+        return await reader.readline()
+    except ValueError:
+        # Longer than the stream's 64KB buffer
+        raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Request line or header too long")
+
+
+async def _read_request(reader: asyncio.StreamReader, max_body: int) -> Optional[Request]:
+    """
+    Read the head of one HTTP/1.1 request, leaving its body for Request.read_body().
+
+    Returns:
+        The request, or None once the client closed the connection
+    """
+    line = await _readline(reader)
+    if not line.strip():
+        return None
+    try:
+        method, target, version = line.decode('latin-1').split()
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Malformed request line")
+    headers = {}
+    while True:
+        line = await _readline(reader)
+        if line in (b'\r\n', b'\n', b''):
+            break
+        if len(headers) >= _MAX_HEADERS:
+            raise HttpError(HTTPStatus.REQUEST_HEADER_FIELDS_TOO_LARGE, "Too many headers")
+        name, _, value = line.decode('latin-1').partition(':')
+        headers[name.strip().lower()] = value.strip()
+
+    if 'chunked' in headers.get('transfer-encoding', '').lower():
+        raise HttpError(HTTPStatus.LENGTH_REQUIRED, "Send the body with a Content-Length")
+    try:
+        length = int(headers.get('content-length', '0'))
+    except ValueError:
+        raise HttpError(HTTPStatus.BAD_REQUEST, "Invalid Content-Length")
+    if length > max_body:
+        raise HttpError(HTTPStatus.REQUEST_ENTITY_TOO_LARGE, f"Body larger than {max_body} bytes")
+
+    url = urlsplit(target)
+    connection = headers.get('connection', '').lower()
+    keep_alive = connection != 'close' if version == 'HTTP/1.1' else connection == 'keep-alive'
+    query = {key: values[-1] for key, values in parse_qs(url.query).items()}
+    return Request(method.upper(), url.path, query, headers, length, reader=reader, keep_alive=keep_alive)
+
+
+async def _send_head(writer: asyncio.StreamWriter, status: int, headers: Dict[str, str], keep_alive: bool):
+    lines = [f"HTTP/1.1 {int(status)} {HTTPStatus(status).phrase}"]
+    headers = dict(headers, Connection='keep-alive' if keep_alive else 'close')
+    lines.extend(f"{name}: {value}" for name, value in headers.items())
+    writer.write(('\r\n'.join(lines) + '\r\n\r\n').encode('latin-1'))
+    await writer.drain()
+
+
+async def _send(writer: asyncio.StreamWriter, status: int, headers: Dict[str, str], body: bytes,
+                keep_alive: bool = True):
+    await _send_head(writer, status, dict(headers, **{'Content-Length': str(len(body))}), keep_alive)
+    writer.write(body)
+    await writer.drain()
+
+
+async def _send_json(writer: asyncio.StreamWriter, status: int, payload: dict, keep_alive: bool = True,
+                     headers: Optional[Dict[str, str]] = None):
+    body = json.dumps(payload).encode('utf-8')
+    await _send(writer, status, dict(headers or {}, **{'Content-Type': 'application/json'}), body, keep_alive)
+
+
+def parse_args(argv=None):
+    parser = argparse.ArgumentParser(
+        description="Serve background removal over HTTP, keeping the model loaded between requests."
+    )
+    parser.add_argument('--host', default=DEFAULT_HOST, help=f"address to listen on (default: {DEFAULT_HOST})")
+    parser.add_argument('--port', type=int, default=DEFAULT_PORT, help=f"port to listen on (default: {DEFAULT_PORT})")
+    parser.add_argument('--model', default=DEFAULT_MODEL,
+                        help=f"model used when a request names none (default: {DEFAULT_MODEL})")
+    parser.add_argument('--workers', type=int, default=None,
+                        help="concurrent inference workers (default: based on CPU cores)")
+    parser.add_argument('--batch-size', type=int, default=1, metavar='N',
+                        help="concurrent requests each worker stacks into one model run (default: 1)")
+    parser.add_argument('--inference-size', type=int, default=DEFAULT_INFERENCE_SIZE, metavar='PIXELS',
+                        help=f"long edge images are segmented at, 0 for full size (default: {DEFAULT_INFERENCE_SIZE})")
+    parser.add_argument('--max-queue', type=int, default=DEFAULT_MAX_QUEUE,
+                        help=f"requests admitted at once before answering 503 (default: {DEFAULT_MAX_QUEUE})")
+    parser.add_argument('--max-body', type=float, default=DEFAULT_MAX_BODY / (1024 * 1024), metavar='MB',
+                        help=f"largest accepted upload (default: {DEFAULT_MAX_BODY // (1024 * 1024)})")
+    parser.add_argument('--allow-path', action='append', default=[], metavar='DIR',
+                        help="let requests name files under DIR instead of uploading them; repeatable")
+    parser.add_argument('--model-memory', type=float, default=DEFAULT_SESSION_MEMORY / (1024 * 1024), metavar='MB',
+                        help="memory loaded models may use before the least recently used is unloaded "
+                             f"(default: {DEFAULT_SESSION_MEMORY // (1024 * 1024)})")
+    parser.add_argument('--no-preload', dest='preload', action='store_false',
+                        help="load the model on the first request instead of at startup")
+    args = parser.parse_args(argv)
+    if args.workers is not None and args.workers < 1:
+        parser.error("--workers must be at least 1")
+    if args.batch_size < 1:
+        parser.error("--batch-size must be at least 1")
+    if args.max_queue < 1:
+        parser.error("--max-queue must be at least 1")
+    return args
+
+
+def main(argv=None) -> int:
+    args = parse_args(argv)
+    set_session_memory_budget(int(args.model_memory * 1024 * 1024))
+    server = InferenceServer(
+        model_name=args.model,
+        workers=args.workers,
+        batch_size=args.batch_size,
+        inference_size=args.inference_size,
+        max_queue=args.max_queue,
+        max_body=int(args.max_body * 1024 * 1024),
+        allowed_dirs=args.allow_path
+    )
+
+    async def run():
+        if args.preload:
+            await server.preload()
+        await server.serve(args.host, args.port)
+
+    try:
+        asyncio.run(run())
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.close()
+    return 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
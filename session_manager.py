@@ -0,0 +1,192 @@
+import threading
+from collections import OrderedDict
+from typing import Callable, Dict, Hashable, List, Tuple
+
+from models import MB, model_memory
+
+DEFAULT_MODEL = "u2net"
+
+# Estimated resident size the shared pool may keep loaded
+DEFAULT_SESSION_MEMORY = 1024 * MB
+
+# Model names served by something other than rembg, see register_session_factory
+_session_factories: Dict[str, Callable[[int], object]] = {}
+
+
+def register_session_factory(model_name: str, factory: Callable[[int], object]):
+    """
+    Serve a model name from factory instead of rembg.
+
+    Used for stand-in models such as the benchmark stub, which must run
+    without downloading weights. The factory is called with the intra-op
+    thread count and returns an object with rembg's session predict() API.
+    """
+    _session_factories[model_name] = factory
+
+
+def _create_session(model_name: str, intra_op_threads: int = 0):
+    """
+    Build a new rembg session, loading the ONNX graph for the model.
+
+    Args:
+        model_name: Name of the rembg model (e.g. "u2net")
+        intra_op_threads: ONNX intra-op thread count, 0 lets onnxruntime decide
+
+    Returns:
+        rembg session object ready for inference
+    """
+    if model_name in _session_factories:
+        return _session_factories[model_name](intra_op_threads)
+
+    import onnxruntime as ort
+    from rembg import new_session
+
+    sess_opts = ort.SessionOptions()
+    if intra_op_threads > 0:
+        sess_opts.intra_op_num_threads = intra_op_threads
+        sess_opts.inter_op_num_threads = 1
+
+    return new_session(model_name, sess_opts=sess_opts)
+
+
+class SessionPool:
+    """
+    Keeps warm rembg sessions keyed by model name and runtime options.
+
+    Building a session loads the model and its ONNX graph, which is often more
+    expensive than running inference on a single image. The pool builds each
+    session on first use and hands the same object to every caller;
+    onnxruntime sessions are safe to run from several threads at the same time.
+
+    Sessions stay loaded until their estimated memory (see models.model_memory)
+    pushes the pool past memory_budget; the least recently used are dropped
+    then, before the new model loads. The session just asked for is always
+    kept, even if it alone exceeds the budget. Callers still holding a dropped
+    session keep it alive until they let go of it.
+    """
+
+    def __init__(self, memory_budget: int = DEFAULT_SESSION_MEMORY):
+        """
+        Args:
+            memory_budget: Estimated bytes of sessions to keep loaded
+        """
+        self.memory_budget = memory_budget
+        self._sessions: "OrderedDict[Tuple[Hashable, ...], object]" = OrderedDict()
+        self._memory: Dict[Tuple[Hashable, ...], int] = {}
+        self._build_locks: Dict[Tuple[Hashable, ...], threading.Lock] = {}
+        self._lock = threading.Lock()
+
+    def get(self, model_name: str = DEFAULT_MODEL, intra_op_threads: int = 0):
+        """
+        Return a warm session for the model, building it on first use.
+
+        Args:
+            model_name: Name of the rembg model
+            intra_op_threads: ONNX intra-op thread count, 0 lets onnxruntime decide
+
+        Returns:
+            rembg session object
+        """
+        key = (model_name, intra_op_threads)
+
+        with self._lock:
+            session = self._sessions.get(key)
+            if session is not None:
+                self._sessions.move_to_end(key)
+                return session
+            build_lock = self._build_locks.setdefault(key, threading.Lock())
+
+        # Build outside the pool lock so other models stay available, but only
+        # let one thread build any given key
+        with build_lock:
+            with self._lock:
+                session = self._sessions.get(key)
+                if session is not None:
+                    self._sessions.move_to_end(key)
+                    return session
+
+            memory = model_memory(model_name)
+            with self._lock:
+                # Make room first, so the old and new models are not both loaded
+                self._evict(self.memory_budget - memory)
+
+            session = _create_session(model_name, intra_op_threads)
+
+            with self._lock:
+                self._sessions[key] = session
+                self._memory[key] = memory
+                self._evict(self.memory_budget, keep=key)
+            return session
+
+    def _evict(self, budget: int, keep=None):
+        """Drop least recently used sessions until the rest fit budget; call with the lock held"""
+        for key in list(self._sessions):
+            if sum(self._memory.values()) <= budget:
+                break
+            if key != keep:
+                del self._sessions[key]
+                del self._memory[key]
+
+    def memory_used(self) -> int:
+        """Estimated bytes held by the pooled sessions"""
+        with self._lock:
+            return sum(self._memory.values())
+
+    def set_memory_budget(self, memory_budget: int):
+        """Change the budget, dropping sessions that no longer fit"""
+        with self._lock:
+            self.memory_budget = memory_budget
+            self._evict(memory_budget, keep=next(reversed(self._sessions), None))
+
+    def holds(self, session) -> bool:
+        """Whether session is one the pool still keeps loaded"""
+        with self._lock:
+            return any(pooled is session for pooled in self._sessions.values())
+
+    def loaded_models(self) -> List[str]:
+        """Names of the models with a loaded session, least recently used first"""
+        with self._lock:
+            return [key[0] for key in self._sessions]
+
+    def clear(self):
+        """Drop all pooled sessions so their memory can be reclaimed"""
+        with self._lock:
+            self._sessions.clear()
+            self._memory.clear()
+            self._build_locks.clear()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._sessions)
+
+
+_default_pool = SessionPool()
+
+
+def get_session(model_name: str = DEFAULT_MODEL, intra_op_threads: int = 0):
+    """
+    Return a warm session from the shared application-wide pool.
+
+    Args:
+        model_name: Name of the rembg model
+        intra_op_threads: ONNX intra-op thread count, 0 lets onnxruntime decide
+
+    Returns:
+        rembg session object
+    """
+    return _default_pool.get(model_name, intra_op_threads)
+
+
+def session_pool() -> SessionPool:
+    """The shared application-wide pool, e.g. to report what it has loaded"""
+    return _default_pool
+
+
+def set_session_memory_budget(memory_budget: int):
+    """Set how much estimated session memory the shared pool keeps loaded"""
+    _default_pool.set_memory_budget(memory_budget)
+
+
+def clear_sessions():
+    """Release every session held by the shared pool"""
+    _default_pool.clear()
@@ -0,0 +1,56 @@
+#!/usr/bin/env python3
+"""
+Checks that preview pyramids can be built for every kind of image the viewer is given
+"""
+import os
+import sys
+
+from PIL import Image
+
+sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+
+from image_pyramid import ImagePyramid, PyramidCache
+
+
+def _pyramid_levels(image):
+    pyramid = ImagePyramid(image, PyramidCache())
+    # Zooming out to 10% needs level 3
+    level, scale_x, scale_y = pyramid.for_zoom(0.1)
+    assert level.size == ((image.width + 7) // 8, (image.height + 7) // 8), level.size
+    assert abs(scale_x - level.width / image.width) < 1e-9
+    return level
+
+
+def test_palette_image():
+    image = Image.new('RGB', (101, 64), (200, 30, 30)).convert('P')
+    assert _pyramid_levels(image).mode == 'RGB'
+
+
+def test_transparent_palette_image():
+    image = Image.new('P', (64, 64), 0)
+    image.putpalette([255, 0, 0, 0, 255, 0])
+    image.info['transparency'] = 0
+    assert _pyramid_levels(image).mode == 'RGBA'
+
+
+def test_bilevel_image():
+    image = Image.new('1', (80, 33), 1)
+    level = _pyramid_levels(image)
+    assert level.mode == 'L' and level.getpixel((0, 0)) == 255
+
+
+def test_16_bit_image():
+    image = Image.new('I;16', (64, 48), 40000)
+    level = _pyramid_levels(image)
+    assert level.mode == 'I' and level.getpixel((0, 0)) == 40000
+
+
+def test_rgba_image_keeps_mode():
+    assert _pyramid_levels(Image.new('RGBA', (64, 64))).mode == 'RGBA'
+
+
+if __name__ == "__main__":
+    for name, check in sorted(globals().items()):
+        if name.startswith('test_'):
+            check()
+            print(f"✅ {name}")
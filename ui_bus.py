@@ -0,0 +1,75 @@
+import queue
+import threading
+from typing import Callable, Hashable
+
+# How often the Tk thread drains posted events, in milliseconds
+POLL_INTERVAL = 30
+
+
+class UIBus:
+    """
+    Hands callbacks from worker threads to the Tk thread.
+
+    Workers post callbacks onto a queue, which the Tk thread drains on a
+    master.after() timer. Posting never blocks on or touches Tk, so any
+    number of workers can report while the GUI is busy. High-frequency
+    updates such as progress can be posted with a key; only the latest
+    update per key is run when the queue is drained.
+    """
+
+    def __init__(self, master, interval: int = POLL_INTERVAL):
+        """
+        Args:
+            master: Tk widget whose after() drives the poller
+            interval: Milliseconds between drains
+        """
+        self.master = master
+        self.interval = interval
+        self._queue = queue.SimpleQueue()
+        self._latest = {}
+        self._lock = threading.Lock()
+        self._job = None
+
+    def start(self):
+        """Start draining on the Tk thread; call from the Tk thread"""
+        if self._job is None:
+            self._job = self.master.after(self.interval, self._poll)
+
+    def stop(self):
+        """Stop draining; callbacks still queued are dropped"""
+        if self._job is not None:
+            self.master.after_cancel(self._job)
+            self._job = None
+
+    def post(self, callback: Callable, *args):
+        """Run callback(*args) on the Tk thread; safe to call from any thread"""
+        self._queue.put((callback, args))
+
+    def post_latest(self, key: Hashable, callback: Callable, *args):
+        """
+        Like post(), but a later call with the same key replaces one that has
+        not run yet, so bursts of updates cost the Tk thread a single call.
+        """
+        with self._lock:
+            pending = key in self._latest
+            self._latest[key] = (callback, args)
+        if not pending:
+            self._queue.put((self._run_latest, (key,)))
+
+    def _run_latest(self, key: Hashable):
+        with self._lock:
+            callback, args = self._latest.pop(key)
+        callback(*args)
+
+    def _poll(self):
+        # Only drain what is queued now, so a flood of posts can't starve Tk
+        for _ in range(self._queue.qsize()):
+            try:
+                callback, args = self._queue.get_nowait()
+            except queue.Empty:
+                break
+            try:
+                callback(*args)
+            except Exception as e:
+                print(f"UI update failed: {str(e)}")  # Keep the poller alive
+        self._job = self.master.after(self.interval, self._poll)
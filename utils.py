@@ -2,18 +2,32 @@ import tkinter as tk
 from tkinter import ttk
 from PIL import Image, ImageTk
 from typing import Optional
+from image_pyramid import ImagePyramid
+
+# Delay before a fast-filtered view is redrawn with LANCZOS, in milliseconds
+REFINE_DELAY = 150
 
 class ScrollableImageView(ttk.Frame):
+    """
+    Zoomable, pannable image preview.
+
+    Only the part of the image visible in the canvas is resampled, starting
+    from the nearest level of an ImagePyramid, so the cost of a redraw
+    depends on the canvas size rather than the image size.
+    While the user keeps zooming or scrolling the view is drawn with a fast
+    filter, and redrawn with LANCZOS once it has settled for REFINE_DELAY ms.
+    """
+
     def __init__(self, master):
         super().__init__(master)
         self.canvas = tk.Canvas(self)
         
-        # Scrollbars
+        # Scrollbars; every view change also schedules a redraw of the visible region
         self.v_scroll = ttk.Scrollbar(self, orient=tk.VERTICAL, command=self.canvas.yview)
         self.h_scroll = ttk.Scrollbar(self, orient=tk.HORIZONTAL, command=self.canvas.xview)
         self.canvas.configure(
-            yscrollcommand=self.v_scroll.set,
-            xscrollcommand=self.h_scroll.set
+            yscrollcommand=self._on_yscroll,
+            xscrollcommand=self._on_xscroll
         )
         
         # Layout
@@ -25,9 +39,8 @@ class ScrollableImageView(ttk.Frame):
         self.grid_rowconfigure(0, weight=1)
         self.grid_columnconfigure(0, weight=1)
         
-        # Image display
-        self.image_label = ttk.Label(self.canvas)
-        self.canvas.create_window((0, 0), window=self.image_label, anchor="nw")
+        # Image display: a single canvas item holding the rendered viewport
+        self.image_item = self.canvas.create_image(0, 0, anchor="nw")
         
         # Enhanced zoom control with better styling
         zoom_frame = ttk.Frame(self)
@@ -46,7 +59,11 @@ class ScrollableImageView(ttk.Frame):
         # State
         self.photo_image = None
         self.pil_image = None
+        self.pyramid = None
         self.zoom_factor = 1.0
+        self._rendered = None  # (box, size, filter) of the current photo_image
+        self._render_job = None
+        self._refine_job = None
         
         # Bind events for better interaction
         self.canvas.bind("<Configure>", self.on_canvas_configure)
@@ -60,51 +77,143 @@ class ScrollableImageView(ttk.Frame):
         
     def set_image(self, image: Image.Image):
         """Set a new image to display"""
+        if self.pyramid is not None:
+            self.pyramid.release()
         self.pil_image = image
+        self.pyramid = ImagePyramid(image)
         self.zoom_factor = 1.0
-        self.update_view()
+        self._rendered = None
+        self.update_view(fast=False)
         
     def clear(self):
         """Clear the current image"""
+        self._cancel_jobs()
+        if self.pyramid is not None:
+            self.pyramid.release()
         self.pil_image = None
+        self.pyramid = None
         self.photo_image = None
-        self.image_label.configure(image=None)
+        self._rendered = None
+        self.canvas.itemconfigure(self.image_item, image='')
         
-    def update_view(self):
-        """Update the displayed image with current zoom factor and zoom level display"""
+    def update_view(self, fast: bool = True):
+        """
+        Apply the current zoom factor: resize the scroll region, update the
+        zoom level display and redraw the visible region.
+
+        Args:
+            fast: Draw with a fast filter now and refine with LANCZOS once
+                the view settles, instead of drawing with LANCZOS right away
+        """
         if self.pil_image:
-            # Calculate new size
-            new_width = int(self.pil_image.width * self.zoom_factor)
-            new_height = int(self.pil_image.height * self.zoom_factor)
-
-            # Resize image with high quality
-            resized = self.pil_image.resize(
-                (new_width, new_height),
-                Image.Resampling.LANCZOS
-            )
-
-            # Update photo image
-            self.photo_image = ImageTk.PhotoImage(resized)
-            self.image_label.configure(image=self.photo_image)
-
-            # Update zoom level display
-            zoom_percent = int(self.zoom_factor * 100)
-            self.zoom_var.set(f"{zoom_percent}%")
-
-            # Update canvas scroll region
-            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+            self._apply_zoom()
+            self._redraw(fast)
+
+    def _apply_zoom(self):
+        width, height = self._zoomed_size()
+        self.canvas.configure(scrollregion=(0, 0, width, height))
+
+        # Update zoom level display
+        zoom_percent = int(self.zoom_factor * 100)
+        self.zoom_var.set(f"{zoom_percent}%")
+
+    def _redraw(self, fast: bool):
+        self._cancel_jobs()
+        if fast:
+            self._render(Image.Resampling.NEAREST)
+            self._refine_job = self.after(REFINE_DELAY, self._refine)
+        else:
+            self._render(Image.Resampling.LANCZOS)
+
+    def _zoomed_size(self):
+        return (max(1, int(self.pil_image.width * self.zoom_factor)),
+                max(1, int(self.pil_image.height * self.zoom_factor)))
+
+    def _render(self, resample):
+        """Resample just the visible part of the image into the canvas"""
+        self._render_job = None
+        if not self.pil_image:
+            return
+        zoomed_width, zoomed_height = self._zoomed_size()
+        left = max(0, int(self.canvas.canvasx(0)))
+        top = max(0, int(self.canvas.canvasy(0)))
+        right = min(zoomed_width, left + max(1, self.canvas.winfo_width()))
+        bottom = min(zoomed_height, top + max(1, self.canvas.winfo_height()))
+        if right <= left or bottom <= top:
+            return
+
+        zoom = self.zoom_factor
+        box = (left / zoom, top / zoom,
+               min(self.pil_image.width, right / zoom), min(self.pil_image.height, bottom / zoom))
+        size = (right - left, bottom - top)
+        if self._rendered is not None and self._rendered[:2] == (box, size) and \
+                (self._rendered[2] == resample or resample == Image.Resampling.NEAREST):
+            return  # Already showing this region at the same or better quality
+
+        # Resample from the smallest pyramid level that keeps enough detail
+        level, scale_x, scale_y = self.pyramid.for_zoom(zoom)
+        level_box = (box[0] * scale_x, box[1] * scale_y,
+                     min(level.width, box[2] * scale_x), min(level.height, box[3] * scale_y))
+        region = level.resize(size, resample, box=level_box)
+        self.photo_image = ImageTk.PhotoImage(region)
+        self.canvas.itemconfigure(self.image_item, image=self.photo_image)
+        self.canvas.coords(self.image_item, left, top)
+        self._rendered = (box, size, resample)
+
+    def _refine(self):
+        self._refine_job = None
+        self._render(Image.Resampling.LANCZOS)
+
+    def _schedule_render(self):
+        """Redraw after the view moved; coalesces bursts of scroll events"""
+        if self.pil_image is None:
+            return
+        if self._render_job is None:
+            self._render_job = self.after_idle(self._render, Image.Resampling.NEAREST)
+        if self._refine_job is not None:
+            self.after_cancel(self._refine_job)
+        self._refine_job = self.after(REFINE_DELAY, self._refine)
+
+    def _cancel_jobs(self):
+        for job in (self._render_job, self._refine_job):
+            if job is not None:
+                self.after_cancel(job)
+        self._render_job = None
+        self._refine_job = None
+
+    def _on_xscroll(self, first, last):
+        self.h_scroll.set(first, last)
+        self._schedule_render()
+
+    def _on_yscroll(self, first, last):
+        self.v_scroll.set(first, last)
+        self._schedule_render()
+
+    def _zoom_to(self, zoom_factor: float, x: Optional[int] = None, y: Optional[int] = None):
+        """Change the zoom factor keeping the image point under canvas position (x, y) in place"""
+        if x is None:
+            x = self.canvas.winfo_width() // 2
+        if y is None:
+            y = self.canvas.winfo_height() // 2
+        image_x = self.canvas.canvasx(x) / self.zoom_factor
+        image_y = self.canvas.canvasy(y) / self.zoom_factor
+
+        self.zoom_factor = zoom_factor
+        self._apply_zoom()
+        width, height = self._zoomed_size()
+        self.canvas.xview_moveto(max(0.0, image_x * zoom_factor - x) / width)
+        self.canvas.yview_moveto(max(0.0, image_y * zoom_factor - y) / height)
+        self._redraw(fast=True)
             
     def zoom_in(self):
         """Increase zoom factor by 20%"""
         if self.pil_image:
-            self.zoom_factor *= 1.2
-            self.update_view()
+            self._zoom_to(self.zoom_factor * 1.2)
             
     def zoom_out(self):
         """Decrease zoom factor by 20%"""
         if self.pil_image:
-            self.zoom_factor *= 0.8
-            self.update_view()
+            self._zoom_to(self.zoom_factor * 0.8)
             
     def zoom_fit(self):
         """Fit image to window size"""
@@ -120,39 +229,37 @@ class ScrollableImageView(ttk.Frame):
 
                 # Use smallest factor to fit image in both dimensions
                 self.zoom_factor = min(width_factor, height_factor) * 0.9
+                self.canvas.xview_moveto(0)
+                self.canvas.yview_moveto(0)
                 self.update_view()
 
     def zoom_actual(self):
         """Reset zoom to actual size (100%)"""
         if self.pil_image:
-            self.zoom_factor = 1.0
-            self.update_view()
+            self._zoom_to(1.0)
 
     def on_mouse_wheel(self, event):
-        """Handle mouse wheel for zooming"""
+        """Handle mouse wheel for zooming around the pointer"""
         if self.pil_image:
             # Zoom in/out based on wheel direction
             if event.delta > 0:
-                self.zoom_factor *= 1.1
+                zoom_factor = self.zoom_factor * 1.1
             else:
-                self.zoom_factor *= 0.9
+                zoom_factor = self.zoom_factor * 0.9
 
             # Limit zoom range
-            self.zoom_factor = max(0.1, min(self.zoom_factor, 10.0))
-            self.update_view()
+            zoom_factor = max(0.1, min(zoom_factor, 10.0))
+            self._zoom_to(zoom_factor, event.x, event.y)
 
     def on_canvas_click(self, event):
         """Handle canvas click for panning start"""
+        self.canvas.scan_mark(event.x, event.y)
         self.last_x = event.x
         self.last_y = event.y
 
     def on_canvas_drag(self, event):
         """Handle canvas drag for panning"""
-        # Calculate movement
-        dx = event.x - self.last_x
-        dy = event.y - self.last_y
-
-        # Scroll the canvas
+        # Scroll the canvas; the scroll callbacks redraw the newly visible region
         self.canvas.scan_dragto(event.x, event.y, gain=1)
 
         # Update last position
@@ -160,10 +267,9 @@ class ScrollableImageView(ttk.Frame):
         self.last_y = event.y
 
     def on_canvas_configure(self, event):
-        """Handle canvas resize"""
+        """Handle canvas resize by redrawing the now visible region"""
         if self.pil_image:
-            # Update scroll region
-            self.canvas.configure(scrollregion=self.canvas.bbox("all"))
+            self._schedule_render()
 
 def create_scroll_image_view(master) -> ScrollableImageView:
     """Create and configure a ScrollableImageView widget"""
@@ -0,0 +1,354 @@
+import collections
+import ctypes
+import ctypes.util
+import os
+import queue
+import select
+import struct
+import sys
+import threading
+import time
+from typing import Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from input_policy import IMAGE_EXTENSIONS
+
+# Seconds a file's size and modification time must stay unchanged before it is
+# taken as completely written
+DEFAULT_SETTLE_TIME = 2.0
+
+# Seconds between directory scans without inotify, and between checks of
+# files that are still being written with it
+DEFAULT_POLL_INTERVAL = 1.0
+
+# Seconds between sweeps that forget reported files which have since gone
+_PRUNE_INTERVAL = 60.0
+
+# inotify(7) constants
+_IN_MODIFY = 0x00000002
+_IN_CLOSE_WRITE = 0x00000008
+_IN_MOVED_TO = 0x00000080
+_IN_CREATE = 0x00000100
+_IN_Q_OVERFLOW = 0x00004000
+_IN_ISDIR = 0x40000000
+_IN_NONBLOCK = 0o4000
+_IN_CLOEXEC = 0o2000000
+_WATCH_MASK = _IN_MODIFY | _IN_CLOSE_WRITE | _IN_MOVED_TO | _IN_CREATE
+_EVENT_HEADER = struct.Struct('iIII')
+
+
+class _Inotify:
+    """Minimal inotify binding through ctypes; raises OSError where inotify is unavailable"""
+
+    def __init__(self):
+        if not sys.platform.startswith('linux'):
+            raise OSError("inotify is only available on Linux")
+        self._libc = ctypes.CDLL(ctypes.util.find_library('c') or 'libc.so.6', use_errno=True)
+        self.fd = self._libc.inotify_init1(_IN_NONBLOCK | _IN_CLOEXEC)
+        if self.fd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno))
+        self._directories: Dict[int, str] = {}
+
+    def add_watch(self, directory: str):
+        wd = self._libc.inotify_add_watch(self.fd, os.fsencode(directory), _WATCH_MASK)
+        if wd < 0:
+            errno = ctypes.get_errno()
+            raise OSError(errno, os.strerror(errno), directory)
+        self._directories[wd] = directory
+
+    def read(self, timeout: float) -> Tuple[List[Tuple[str, bool]], bool]:
+        """
+        Wait up to timeout seconds for events.
+
+        Returns:
+            ([(path, is_directory), ...], overflowed); after an overflow events
+            were lost and the directories have to be scanned
+        """
+        readable, _, _ = select.select([self.fd], [], [], timeout)
+        if not readable:
+            return [], False
+        try:
+            data = os.read(self.fd, 64 * 1024)
+        except BlockingIOError:
+            return [], False
+        events, overflowed, offset = [], False, 0
+        while offset + _EVENT_HEADER.size <= len(data):
+            wd, mask, _, length = _EVENT_HEADER.unpack_from(data, offset)
+            offset += _EVENT_HEADER.size
+            name = data[offset:offset + length].rstrip(b'\0')
+            offset += length
+            if mask & _IN_Q_OVERFLOW:
+                overflowed = True
+            elif name and wd in self._directories:
+                events.append((os.path.join(self._directories[wd], os.fsdecode(name)), bool(mask & _IN_ISDIR)))
+        return events, overflowed
+
+    def close(self):
+        os.close(self.fd)
+
+
+class ThroughputMeter:
+    """Images per second over a sliding time window"""
+
+    def __init__(self, window: float = 60.0):
+        self.window = window
+        self._times = collections.deque()
+        self._started = time.monotonic()
+        self._lock = threading.Lock()
+
+    def record(self):
+        with self._lock:
+            self._times.append(time.monotonic())
+
+    def rate(self) -> float:
+        now = time.monotonic()
+        with self._lock:
+            while self._times and self._times[0] < now - self.window:
+                self._times.popleft()
+            count = len(self._times)
+        # A watch that started less than a window ago is averaged over its age
+        return count / max(1.0, min(self.window, now - self._started))
+
+
+class FolderWatcher:
+    """
+    Reports image files that appear in a folder once they are completely written.
+
+    On Linux, inotify tells the watcher which files changed; elsewhere, or if
+    inotify can't be set up, the folder is scanned every poll_interval
+    seconds. Either way a file is only reported after its size and
+    modification time have not changed for settle_time seconds, so files
+    still being copied in are not picked up half written. A file is reported
+    again if it is replaced later.
+    """
+
+    def __init__(
+        self,
+        directory: str,
+        on_files: Optional[Callable[[List[str]], None]] = None,
+        recursive: bool = False,
+        include_existing: bool = True,
+        exclude: Iterable[str] = (),
+        settle_time: float = DEFAULT_SETTLE_TIME,
+        poll_interval: float = DEFAULT_POLL_INTERVAL,
+        use_inotify: bool = True
+    ):
+        """
+        Args:
+            directory: Folder to watch
+            on_files: Called on the watcher thread with each group of newly
+                written image paths; a WatchFeed sets it itself
+            recursive: Also watch subfolders, including ones created later
+            include_existing: Report images already in the folder at start
+            exclude: Folders inside directory to ignore, such as the output folder
+            settle_time: Seconds a file must stay unchanged before it is reported
+            poll_interval: Seconds between scans when polling
+            use_inotify: Use inotify where available; False always polls
+        """
+        self.directory = os.path.abspath(directory)
+        self.on_files = on_files
+        self.recursive = recursive
+        self.include_existing = include_existing
+        self.exclude = {os.path.abspath(path) for path in exclude}
+        self.settle_time = settle_time
+        self.poll_interval = poll_interval
+        self.use_inotify = use_inotify
+        self.mode = None  # 'inotify' or 'polling' once started
+        self.detected = 0
+        # Files seen changing: path -> ((size, mtime), time that state was first seen)
+        self._candidates: Dict[str, Tuple[Tuple[int, int], float]] = {}
+        # State each file was last reported in, for files that still exist
+        self._reported: Dict[str, Tuple[int, int]] = {}
+        self._last_prune = time.monotonic()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if not os.path.isdir(self.directory):
+            raise NotADirectoryError(f"Not a folder: {self.directory}")
+        self._thread = threading.Thread(target=self._run, name="folder-watcher")
+        self._thread.daemon = True
+        self._thread.start()
+
+    def stop(self, timeout: Optional[float] = None):
+        self._stop.set()
+        if self._thread is not None and self._thread is not threading.current_thread():
+            self._thread.join(timeout)
+
+    @property
+    def is_running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    @property
+    def settling(self) -> int:
+        """Files seen but still waiting to settle"""
+        return len(self._candidates)
+
+    def _run(self):
+        inotify = None
+        if self.use_inotify:
+            try:
+                inotify = _Inotify()
+            except OSError as e:
+                print(f"Watching {self.directory} by polling, inotify unavailable: {str(e)}")
+        self.mode = 'inotify' if inotify is not None else 'polling'
+        try:
+            # Watches go in before the first scan so nothing slips in between
+            for directory in self._directories():
+                self._add_watch(inotify, directory)
+            self._scan(initial=True)
+            while not self._stop.is_set():
+                if inotify is None:
+                    self._stop.wait(self.poll_interval)
+                    self._scan()
+                else:
+                    timeout = self.poll_interval if self._candidates else 0.5
+                    events, overflowed = inotify.read(timeout)
+                    if overflowed:
+                        self._scan()
+                    for path, is_directory in events:
+                        if is_directory:
+                            if self.recursive and not self._excluded(path):
+                                self._add_watch(inotify, path)
+                                self._scan_directory(path)
+                        elif self._wanted(path):
+                            self._observe(path)
+                self._report_settled()
+                if time.monotonic() - self._last_prune >= _PRUNE_INTERVAL:
+                    self._prune_reported()
+        except Exception as e:
+            print(f"Watching {self.directory} stopped: {str(e)}")
+        finally:
+            if inotify is not None:
+                inotify.close()
+
+    def _add_watch(self, inotify: Optional[_Inotify], directory: str):
+        if inotify is None:
+            return
+        try:
+            inotify.add_watch(directory)
+        except OSError as e:
+            print(f"Cannot watch {directory}: {str(e)}")
+
+    def _excluded(self, path: str) -> bool:
+        return any(path == excluded or path.startswith(excluded + os.sep) for excluded in self.exclude)
+
+    def _wanted(self, path: str) -> bool:
+        name = os.path.basename(path)
+        # Hidden files include partial downloads and our own temporary outputs
+        return not name.startswith('.') and name.lower().endswith(IMAGE_EXTENSIONS) and not self._excluded(path)
+
+    def _directories(self) -> Iterator[str]:
+        stack = [self.directory]
+        while stack:
+            current = stack.pop()
+            yield current
+            if not self.recursive:
+                continue
+            try:
+                with os.scandir(current) as entries:
+                    for entry in entries:
+                        if entry.is_dir(follow_symlinks=False) and not self._excluded(entry.path):
+                            stack.append(entry.path)
+            except OSError:
+                continue
+
+    def _scan(self, initial: bool = False):
+        for directory in self._directories():
+            self._scan_directory(directory, initial)
+
+    def _scan_directory(self, directory: str, initial: bool = False):
+        try:
+            with os.scandir(directory) as entries:
+                for entry in entries:
+                    if entry.is_file() and self._wanted(entry.path):
+                        if initial and not self.include_existing:
+                            stat = entry.stat()
+                            self._reported[entry.path] = (stat.st_size, stat.st_mtime_ns)
+                        else:
+                            self._observe(entry.path)
+        except OSError as e:
+            print(f"Cannot scan {directory}: {str(e)}")
+
+    def _observe(self, path: str):
+        """Note the current state of a file that may be new or changed"""
+        try:
+            stat = os.stat(path)
+        except OSError:
+            self._candidates.pop(path, None)
+            return
+        state = (stat.st_size, stat.st_mtime_ns)
+        if self._reported.get(path) == state:
+            return
+        previous = self._candidates.get(path)
+        if previous is None or previous[0] != state:
+            self._candidates[path] = (state, time.monotonic())
+
+    def _prune_reported(self):
+        """Forget files that were deleted or moved away, so a long watch doesn't keep every name it ever saw"""
+        self._last_prune = time.monotonic()
+        for path in list(self._reported):
+            if not os.path.exists(path):
+                del self._reported[path]
+
+    def _report_settled(self):
+        now = time.monotonic()
+        ready = []
+        for path in list(self._candidates):
+            self._observe(path)
+            candidate = self._candidates.get(path)
+            if candidate is None:
+                continue
+            state, since = candidate
+            # Empty files are usually still being created
+            if state[0] > 0 and now - since >= self.settle_time:
+                del self._candidates[path]
+                self._reported[path] = state
+                ready.append(path)
+        if ready:
+            self.detected += len(ready)
+            try:
+                self.on_files(sorted(ready))
+            except Exception as e:
+                print(f"Watch folder handler failed: {str(e)}")
+
+
+class WatchFeed:
+    """
+    Iterable of the files reported by one or more FolderWatchers.
+
+    Iterating blocks until the next file arrives and ends once the watchers
+    are stopped and everything they reported has been handed out, which
+    suits BatchEngine.start(): its feeder thread consumes paths lazily.
+    """
+
+    def __init__(self, watchers: List[FolderWatcher]):
+        self.watchers = watchers
+        self._paths = queue.Queue()
+        for watcher in watchers:
+            watcher.on_files = self._enqueue
+
+    def _enqueue(self, paths: List[str]):
+        for path in paths:
+            self._paths.put(path)
+
+    @property
+    def backlog(self) -> int:
+        """Files detected but not yet taken, including ones still being written"""
+        return self._paths.qsize() + sum(watcher.settling for watcher in self.watchers)
+
+    def start(self):
+        for watcher in self.watchers:
+            watcher.start()
+
+    def stop(self):
+        for watcher in self.watchers:
+            watcher.stop()
+
+    def __iter__(self) -> Iterator[str]:
+        while True:
+            try:
+                yield self._paths.get(timeout=0.5)
+            except queue.Empty:
+                if not any(watcher.is_running for watcher in self.watchers):
+                    return